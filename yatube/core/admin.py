@@ -1 +1,19 @@
-# Register your models here.
+from django.contrib import admin
+
+from .models import Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'attempts',
+        'run_at',
+        'dedup_key',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'dedup_key')
+
+
+admin.site.register(Task, TaskAdmin)
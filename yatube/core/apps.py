@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import metrics, slow_queries, users
+        connection_created.connect(metrics.install)
+        connection_created.connect(slow_queries.install)
+        post_save.connect(users.forget_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(
+            users.forget_user, sender=settings.AUTH_USER_MODEL
+        )
+        user_logged_out.connect(users.forget_logged_out)
@@ -0,0 +1,134 @@
+"""Кеширование с защитой от одновременного пересчёта (cache stampede).
+
+Значение хранится вместе с «мягким» сроком годности. После него запись
+ещё живёт STALE_CACHE_GRACE секунд: пересчитывает её только тот воркер,
+который успел взять короткую блокировку, остальные получают устаревшее
+значение. Дополнительно запись может обновиться заранее с вероятностью,
+растущей к концу срока (алгоритм XFetch).
+"""
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .metrics import registry
+
+LOCK_SUFFIX = ':lock'
+# Сколько ждать чужого пересчёта, если устаревшего значения нет вовсе
+COLD_WAIT = 1.0
+COLD_WAIT_STEP = 0.05
+
+
+def _needs_refresh(expires, delta, beta, now):
+    if beta <= 0:
+        return now >= expires
+    # 1 - random() лежит в (0, 1], логарифм не уходит в минус бесконечность
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires
+
+
+def _compute_and_store(key, compute, timeout, grace, cache_backend):
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        cache_backend.set(
+            key, (value, time.time() + timeout, delta), timeout + grace
+        )
+    finally:
+        # Упавший пересчёт не должен держать блокировку до истечения:
+        # следующий воркер попробует сам
+        cache_backend.delete(key + LOCK_SUFFIX)
+    return value
+
+
+def _wait_for_other_worker(key, cache_backend):
+    deadline = time.monotonic() + COLD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(COLD_WAIT_STEP)
+        entry = cache_backend.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _count(family, result):
+    registry.inc('yatube_cache_requests_total', family=family, result=result)
+
+
+def get_or_compute(key, compute, timeout, beta=None, cache_backend=None,
+                   family='other'):
+    """Возвращает значение из кеша, пересчитывая его не более чем
+    одним воркером одновременно.
+
+    compute — функция без аргументов, timeout — «мягкий» срок жизни
+    в секундах, beta — сила раннего обновления (0 отключает его),
+    family — семейство ключей в метрике yatube_cache_requests_total.
+    """
+    cache_backend = cache_backend or cache
+    if beta is None:
+        beta = settings.STALE_CACHE_BETA
+    grace = settings.STALE_CACHE_GRACE
+    lock_timeout = settings.STALE_CACHE_LOCK_TIMEOUT
+    entry = cache_backend.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        if not _needs_refresh(expires, delta, beta, time.time()):
+            _count(family, 'hit')
+            return value
+        if not cache_backend.add(key + LOCK_SUFFIX, 1, lock_timeout):
+            # Пересчётом уже занят другой воркер: отдаём устаревшее
+            _count(family, 'stale')
+            return value
+        _count(family, 'refresh')
+        return _compute_and_store(key, compute, timeout, grace, cache_backend)
+    if not cache_backend.add(key + LOCK_SUFFIX, 1, lock_timeout):
+        entry = _wait_for_other_worker(key, cache_backend)
+        if entry is not None:
+            _count(family, 'hit')
+            return entry[0]
+    _count(family, 'miss')
+    return _compute_and_store(key, compute, timeout, grace, cache_backend)
+
+
+def stale_cache_page(timeout, key_prefix='page'):
+    """Декоратор view: кеширует GET-ответы для анонимных пользователей
+    через get_or_compute.
+
+    Страницы авторизованных пользователей содержат личные данные
+    и CSRF-токены, поэтому они всегда рендерятся заново. Заголовки
+    ответа, кроме Content-Type, не сохраняются: декоратор рассчитан
+    на простые страницы-списки.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+            key = f'{key_prefix}:{request.get_full_path()}'
+            uncached = {}
+
+            def compute():
+                response = view_func(request, *args, **kwargs)
+                if hasattr(response, 'render'):
+                    response.render()
+                uncached['response'] = response
+                return (
+                    response.content,
+                    response.status_code,
+                    response['Content-Type'],
+                )
+
+            content, status, content_type = get_or_compute(
+                key, compute, timeout, family='page'
+            )
+            if 'response' in uncached:
+                return uncached['response']
+            return HttpResponse(
+                content, status=status, content_type=content_type
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,23 @@
+from posts.models import FollowFeedState
+
+
+def follow_unread(request):
+    """Добавляет число непрочитанных записей в ленте подписок.
+
+    Значение ленивое: запрос к базе (одно чтение по первичному ключу)
+    выполняется, только если шаблон его использует.
+    """
+    cached = []
+
+    def unread():
+        if not cached:
+            user = getattr(request, 'user', None)
+            value = 0
+            if user is not None and user.is_authenticated:
+                value = FollowFeedState.objects.filter(
+                    user=user
+                ).values_list('unread', flat=True).first() or 0
+            cached.append(value)
+        return cached[0]
+
+    return {'follow_unread': unread}
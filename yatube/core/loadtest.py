@@ -0,0 +1,372 @@
+"""Нагрузочный генератор на asyncio без сторонних библиотек.
+
+Виртуальный пользователь — HttpSession со своими cookie (сессия
+и csrftoken); он раз за разом проходит сценарии, выбранные случайно
+с заданными весами. Сценарий — корутина journey(session), которая
+делает несколько запросов подряд, как живой посетитель.
+
+Два режима нагрузки:
+
+- замкнутый: users пользователей, запускаемых равномерно за ramp_up
+  секунд; каждый начинает следующий сценарий, закончив предыдущий;
+- открытый: новые сценарии стартуют с постоянной частотой rate в
+  секунду, сколько бы ни выполнялось уже начатых, — так видно, как
+  растут задержки, когда сервер не успевает.
+
+Каждый запрос попадает в Stats под меткой маршрута: число запросов,
+гистограмма задержек и ошибки по видам, в том числе «database is
+locked», которую SQLite отдаёт под конкурентной записью.
+
+replay() воспроизводит записанный трафик (core.middleware) с исходными
+промежутками между запросами, а compare_report() сравнивает задержки
+двух прогонов, например до и после изменения кода.
+"""
+import asyncio
+import random
+import re
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+# Верхние границы корзин гистограммы, мс
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Что искать в теле ответа с ошибкой сервера, чтобы назвать её
+ERROR_MARKERS = ('database is locked', 'OperationalError', 'Timeout')
+CSRF_RE = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class Response:
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', 'replace')
+
+
+def error_kind(status, body):
+    """Вид ошибки ответа или None для успешного."""
+    if status < 400:
+        return None
+    for marker in ERROR_MARKERS:
+        if marker.encode() in body:
+            return f'HTTP {status}: {marker}'
+    return f'HTTP {status}'
+
+
+class RouteStats:
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+
+    def percentile(self, share):
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return 0.0
+        return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+    def histogram(self):
+        """Число запросов в каждой корзине BUCKETS и сверх последней."""
+        counts = [0] * (len(BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[bisect_left(BUCKETS, latency)] += 1
+        return counts
+
+
+class Stats:
+
+    def __init__(self):
+        self.routes = defaultdict(RouteStats)
+        self.started = time.monotonic()
+        self.journeys = Counter()
+
+    def to_dict(self):
+        return {
+            route: {'latencies': stats.latencies, 'errors': stats.errors}
+            for route, stats in self.routes.items()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for route, values in data.items():
+            stats.routes[route].latencies = values['latencies']
+            stats.routes[route].errors = Counter(values['errors'])
+        return stats
+
+    def record(self, route, latency, error=None):
+        stats = self.routes[route]
+        stats.latencies.append(latency)
+        if error:
+            stats.errors[error] += 1
+
+    def report(self):
+        """Таблица по маршрутам, затем гистограммы и ошибки."""
+        elapsed = time.monotonic() - self.started
+        total = sum(len(stats.latencies) for stats in self.routes.values())
+        lines = [
+            f'Запросов: {total} за {elapsed:.1f} с '
+            f'({total / max(elapsed, 1e-9):.1f} в секунду)',
+            f'{"маршрут":<28}{"запросов":>9}{"ошибок":>9}'
+            f'{"p50":>8}{"p90":>8}{"p99":>8}{"max":>8}',
+        ]
+        for route, stats in sorted(self.routes.items()):
+            count = len(stats.latencies)
+            errors = sum(stats.errors.values())
+            lines.append(
+                f'{route:<28}{count:>9}{errors / count:>9.1%}'
+                f'{stats.percentile(0.5):>8.0f}{stats.percentile(0.9):>8.0f}'
+                f'{stats.percentile(0.99):>8.0f}{max(stats.latencies):>8.0f}'
+            )
+        for route, stats in sorted(self.routes.items()):
+            lines.append(f'\n{route}, мс:')
+            counts = stats.histogram()
+            width = max(counts)
+            bounds = [f'≤{bound}' for bound in BUCKETS] + [f'>{BUCKETS[-1]}']
+            for bound, count in zip(bounds, counts):
+                if count:
+                    bar = '#' * max(1, round(40 * count / width))
+                    lines.append(f'  {bound:>7} {count:>7} {bar}')
+            for error, count in stats.errors.most_common():
+                lines.append(f'  ошибка {error}: {count}')
+        return '\n'.join(lines)
+
+
+class HttpSession:
+    """Клиент одного виртуального пользователя: HTTP/1.1 поверх
+    asyncio.open_connection, по соединению на запрос."""
+
+    def __init__(self, base_url, stats, label=None, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.stats = stats
+        self.label = label or (lambda path: urlsplit(path).path)
+        self.timeout = timeout
+        self.cookies = {}
+        self.state = {}
+
+    def _cookie_header(self):
+        return '; '.join(
+            f'{key}={value}' for key, value in self.cookies.items()
+        )
+
+    async def _send(self, method, path, body, content_type):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        headers = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Connection: close',
+            f'Content-Length: {len(body)}',
+        ]
+        if content_type:
+            headers.append(f'Content-Type: {content_type}')
+        if self.cookies:
+            headers.append(f'Cookie: {self._cookie_header()}')
+        if 'csrftoken' in self.cookies:
+            headers.append(f'X-CSRFToken: {self.cookies["csrftoken"]}')
+        writer.write('\r\n'.join(headers).encode() + b'\r\n\r\n' + body)
+        await writer.drain()
+        raw = await reader.read()
+        writer.close()
+        return raw
+
+    def _parse(self, raw):
+        head, _, body = raw.partition(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                for key, morsel in SimpleCookie(value).items():
+                    self.cookies[key] = morsel.value
+            headers[name] = value
+        return Response(int(status_line.split()[1]), headers, body)
+
+    async def request(self, method, path, data=None, route=None):
+        body = urlencode(data or {}).encode()
+        content_type = data is not None and (
+            'application/x-www-form-urlencoded'
+        )
+        route = route or self.label(path)
+        started = time.perf_counter()
+        try:
+            raw = await asyncio.wait_for(
+                self._send(method, path, body, content_type), self.timeout
+            )
+            response = self._parse(raw)
+        except asyncio.TimeoutError:
+            self.stats.record(route, self._ms(started), 'таймаут')
+            raise
+        except (OSError, ValueError, IndexError) as error:
+            self.stats.record(
+                route, self._ms(started), f'соединение: {type(error).__name__}'
+            )
+            raise
+        error = error_kind(response.status, response.body)
+        self.stats.record(route, self._ms(started), error)
+        return response
+
+    @staticmethod
+    def _ms(started):
+        return (time.perf_counter() - started) * 1000
+
+    async def get(self, path, route=None):
+        return await self.request('GET', path, route=route)
+
+    async def post(self, path, data):
+        return await self.request('POST', path, data)
+
+    async def submit(self, form_path, data, action=None):
+        """Открывает страницу с формой и отправляет её с csrf-токеном."""
+        page = await self.get(form_path)
+        match = CSRF_RE.search(page.body)
+        if match:
+            data = {**data, 'csrfmiddlewaretoken': match.group(1).decode()}
+        return await self.post(action or form_path, data)
+
+
+class LoadTest:
+    """journeys — {имя: (корутина-сценарий, вес)}; rng — общий
+    со сценариями генератор вместо нового Random(seed)."""
+
+    def __init__(self, base_url, journeys, label=None, think_time=0.0,
+                 timeout=30, seed=None, rng=None):
+        self.base_url = base_url
+        self.names = list(journeys)
+        self.functions = [journeys[name][0] for name in self.names]
+        self.weights = [journeys[name][1] for name in self.names]
+        self.label = label
+        self.think_time = think_time
+        self.timeout = timeout
+        self.random = rng or random.Random(seed)
+        self.stats = Stats()
+
+    def session(self):
+        return HttpSession(self.base_url, self.stats, self.label, self.timeout)
+
+    async def run_journey(self, session):
+        index = self.random.choices(
+            range(len(self.names)), self.weights
+        )[0]
+        self.stats.journeys[self.names[index]] += 1
+        try:
+            await self.functions[index](session)
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+            # Ошибка уже записана в статистику, сценарий прерывается
+            pass
+
+    async def _user(self, delay, deadline):
+        await asyncio.sleep(delay)
+        session = self.session()
+        while time.monotonic() < deadline:
+            await self.run_journey(session)
+            if self.think_time:
+                await asyncio.sleep(self.random.expovariate(
+                    1 / self.think_time
+                ))
+
+    async def closed(self, users, duration, ramp_up=0.0):
+        """users пользователей, стартующих равномерно за ramp_up с."""
+        self.stats = Stats()
+        deadline = time.monotonic() + duration
+        step = ramp_up / users if users else 0
+        await asyncio.gather(*(
+            self._user(number * step, deadline) for number in range(users)
+        ))
+        return self.stats
+
+    async def open(self, rate, duration, max_active=1000):
+        """Новый сценарий каждые 1/rate с; не больше max_active сразу."""
+        self.stats = Stats()
+        deadline = time.monotonic() + duration
+        active = set()
+        limit = asyncio.Semaphore(max_active)
+        # Закончившие сценарий сессии переиспользуются, чтобы не
+        # входить на сайт заново для каждого сценария
+        idle = []
+
+        async def one():
+            async with limit:
+                session = idle.pop() if idle else self.session()
+                await self.run_journey(session)
+                idle.append(session)
+
+        next_start = time.monotonic()
+        while next_start < deadline:
+            task = asyncio.ensure_future(one())
+            active.add(task)
+            task.add_done_callback(active.discard)
+            next_start += 1 / rate
+            await asyncio.sleep(max(0.0, next_start - time.monotonic()))
+        if active:
+            await asyncio.gather(*active)
+        return self.stats
+
+
+async def replay(requests, make_session, stats, speed=1.0, max_active=1000):
+    """Воспроизводит requests — [(секунда от начала, ключ пользователя,
+    путь, метка)] по возрастанию времени.
+
+    speed=2 проигрывает запись вдвое быстрее, speed=0 — без пауз.
+    Запросы одного ключа идут из одной сессии, которую один раз
+    создаёт корутина make_session(ключ).
+    """
+    sessions = {}
+    limit = asyncio.Semaphore(max_active)
+    tasks = []
+
+    async def one(key, path, route):
+        async with limit:
+            if key not in sessions:
+                sessions[key] = asyncio.ensure_future(make_session(key))
+            session = await sessions[key]
+            session.stats = stats
+            try:
+                await session.get(path, route=route)
+            except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+                pass
+
+    started = time.monotonic()
+    stats.started = started
+    for offset, key, path, route in requests:
+        if speed:
+            await asyncio.sleep(max(
+                0.0, started + offset / speed - time.monotonic()
+            ))
+        tasks.append(asyncio.ensure_future(one(key, path, route)))
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def compare_report(base, new, threshold=0.1):
+    """Задержки маршрутов в двух прогонах; «!» — p90 вырос больше
+    чем на threshold."""
+    lines = [
+        f'{"маршрут":<28}{"n":>7}{"p50":>15}{"p90":>15}'
+        f'{"p99":>15}{"ошибок":>15}',
+    ]
+    for route in sorted(set(base.routes) | set(new.routes)):
+        before, after = base.routes[route], new.routes[route]
+        cells = [
+            f'{before.percentile(share):.0f}→{after.percentile(share):.0f}'
+            for share in (0.5, 0.9, 0.99)
+        ]
+        errors = (
+            f'{sum(before.errors.values())}→{sum(after.errors.values())}'
+        )
+        old_p90 = before.percentile(0.9)
+        worse = old_p90 and after.percentile(0.9) > old_p90 * (1 + threshold)
+        lines.append(
+            f'{route:<28}{len(after.latencies):>7}'
+            + ''.join(f'{cell:>15}' for cell in cells)
+            + f'{errors:>15}' + (' !' if worse else '')
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.metrics import clear
+
+
+class Command(BaseCommand):
+    help = (
+        'Очищает каталог метрик METRICS_DIR; запускается перед стартом '
+        'сервера, пока процессы-обработчики не работают.'
+    )
+
+    def handle(self, *args, **options):
+        removed = clear()
+        self.stdout.write(
+            f'Удалено файлов метрик: {removed} ({settings.METRICS_DIR})'
+        )
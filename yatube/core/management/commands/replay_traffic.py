@@ -0,0 +1,147 @@
+import asyncio
+import json
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import NoReverseMatch, reverse
+
+from core.loadtest import HttpSession, Stats, compare_report, replay
+
+User = get_user_model()
+
+# Запросы с телом не записываются, поэтому воспроизводятся только чтения
+REPLAYED_METHODS = ('GET', 'HEAD')
+
+
+def load_capture(path):
+    """Записи лога в виде (секунда от начала, ключ, путь, метка);
+    второе значение — число пропущенных записей."""
+    requests, skipped = [], 0
+    with open(path) as capture:
+        records = [json.loads(line) for line in capture if line.strip()]
+    records.sort(key=lambda record: record['time'])
+    for record in records:
+        try:
+            path = reverse(
+                record['view'], args=record['args'], kwargs=record['kwargs']
+            )
+        except NoReverseMatch:
+            skipped += 1
+            continue
+        if record['method'] not in REPLAYED_METHODS:
+            skipped += 1
+            continue
+        if record['query']:
+            path += '?' + urlencode(record['query'], doseq=True)
+        offset = record['time'] - records[0]['time']
+        requests.append((offset, tuple(record['user']), path, record['view']))
+    return requests, skipped
+
+
+class Command(BaseCommand):
+    help = (
+        'Воспроизводит записанный трафик на запущенном сервере '
+        'и сравнивает задержки с прошлым прогоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'capture', nargs='?',
+            help='Лог TrafficCaptureMiddleware (TRAFFIC_CAPTURE_PATH).',
+        )
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--speed', type=float, default=1.0,
+            help='Во сколько раз быстрее записи; 0 — без пауз.',
+        )
+        parser.add_argument('--max-active', type=int, default=1000)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument(
+            '--password', default='replay-password',
+            help='Пароль учётных записей replay-<вид>-<корзина>.',
+        )
+        parser.add_argument(
+            '--save', help='Сохранить задержки прогона в JSON-файл.',
+        )
+        parser.add_argument(
+            '--compare', help='Сохранённый прогон, с которым сравнить.',
+        )
+        parser.add_argument(
+            '--against',
+            help='Сравнить --compare с этим сохранённым прогоном '
+                 'вместо нового воспроизведения.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.1,
+            help='Рост p90, который отмечается как регрессия.',
+        )
+
+    def _account(self, kind, bucket, password):
+        user, created = User.objects.get_or_create(
+            username=f'replay-{kind}-{bucket}',
+            defaults={'is_staff': kind == 'staff'},
+        )
+        if created:
+            user.set_password(password)
+            user.save(update_fields=['password'])
+        return user.username
+
+    def _session_factory(self, options):
+        setup_stats = Stats()
+        accounts = {}
+
+        async def make_session(key):
+            session = HttpSession(
+                options['url'], setup_stats, timeout=options['timeout']
+            )
+            kind, bucket = key
+            if kind != 'anonymous':
+                # Вход не входит в измеряемый трафик
+                await session.submit(reverse(settings.LOGIN_URL), {
+                    'username': accounts[key],
+                    'password': options['password'],
+                })
+            return session
+
+        return make_session, accounts
+
+    def _replay(self, options):
+        requests, skipped = load_capture(options['capture'])
+        if not requests:
+            raise CommandError('В логе нет запросов для воспроизведения')
+        make_session, accounts = self._session_factory(options)
+        for _, key, _, _ in requests:
+            if key[0] != 'anonymous' and key not in accounts:
+                accounts[key] = self._account(*key, options['password'])
+        stats = asyncio.run(replay(
+            requests,
+            make_session,
+            Stats(),
+            speed=options['speed'],
+            max_active=options['max_active'],
+        ))
+        self.stdout.write(stats.report())
+        self.stdout.write(
+            f'Воспроизведено {len(requests)}, пропущено {skipped}'
+        )
+        return stats
+
+    def handle(self, *args, **options):
+        if options['against']:
+            with open(options['against']) as saved:
+                stats = Stats.from_dict(json.load(saved))
+        elif options['capture']:
+            stats = self._replay(options)
+        else:
+            raise CommandError('Укажите лог трафика или --against')
+        if options['save']:
+            with open(options['save'], 'w') as saved:
+                json.dump(stats.to_dict(), saved)
+        if options['compare']:
+            with open(options['compare']) as saved:
+                base = Stats.from_dict(json.load(saved))
+            self.stdout.write(
+                compare_report(base, stats, options['threshold'])
+            )
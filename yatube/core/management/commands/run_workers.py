@@ -0,0 +1,86 @@
+import logging
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from core.tasks import claim_task, discover_tasks, run_task
+
+logger = logging.getLogger(__name__)
+
+
+def worker_loop(stop, poll_interval, once):
+    """Цикл одного воркера: забрать задачу, выполнить, повторить."""
+    try:
+        while not stop.is_set():
+            try:
+                task_obj = claim_task()
+            except OperationalError:
+                # SQLite занят другим писателем — попробуем позже
+                logger.warning('База занята, задача не забрана')
+                stop.wait(poll_interval)
+                continue
+            if task_obj is None:
+                if once:
+                    break
+                stop.wait(poll_interval)
+                continue
+            run_task(task_obj)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры, выполняющие отложенные задачи.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Сколько воркеров запустить.',
+        )
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Воркеры-процессы вместо потоков.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить то, что уже в очереди, и выйти.',
+        )
+
+    def handle(self, *args, **options):
+        discover_tasks()
+        if options['processes']:
+            # Дочерние процессы не должны делить соединения с родителем
+            connections.close_all()
+            stop = multiprocessing.Event()
+            worker_class = multiprocessing.Process
+        else:
+            stop = threading.Event()
+            worker_class = threading.Thread
+        workers = [
+            worker_class(
+                target=worker_loop,
+                args=(stop, options['poll_interval'], options['once']),
+                daemon=True,
+            )
+            for _ in range(options['workers'])
+        ]
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Запущено воркеров: {len(workers)}')
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+        self.stdout.write('Воркеры остановлены')
@@ -0,0 +1,132 @@
+"""Профилирование памяти через tracemalloc.
+
+Включается настройкой MEMORY_PROFILE. Для доли MEMORY_PROFILE_SAMPLE
+запросов MemoryProfileMiddleware снимает снимок до и после ответа,
+и прирост по строкам кода копится под именем view: так видно, какие
+страницы оставляют после себя память — большие выборки, рост
+LocMemCache, буферы миниатюр. Раз в MEMORY_PROFILE_CHECKPOINT_INTERVAL
+секунд сохраняется снимок всего процесса; разницу между двумя такими
+точками показывает /debug/memory/ (core.views.memory_report).
+
+Данные свои у каждого процесса, страница показывает тот, что её
+обслужил. В многопоточном сервере в прирост запроса попадают
+и выделения соседних потоков — смотреть стоит на суммы по многим
+запросам, а не на один.
+"""
+import os
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict, deque
+
+from django.conf import settings
+
+# Выделения самого профилировщика и импорта модулей не интересны
+FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _site(stat):
+    frame = stat.traceback[0]
+    return f'{frame.filename}:{frame.lineno}'
+
+
+def format_size(size):
+    for unit in ('Б', 'КиБ', 'МиБ'):
+        if abs(size) < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} ГиБ'
+
+
+def format_diff(old, new, limit):
+    stats = new.compare_to(old, 'lineno')[:limit]
+    return [
+        f'{format_size(stat.size_diff):>12} {stat.count_diff:>+8}  '
+        f'{_site(stat)}'
+        for stat in stats
+    ]
+
+
+class MemoryProfiler:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.sites = defaultdict(Counter)
+        self.checkpoints = deque()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.MEMORY_PROFILE_FRAMES)
+        self.checkpoints = deque(maxlen=settings.MEMORY_PROFILE_CHECKPOINTS)
+        self.checkpoint()
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(FILTERS)
+
+    def record(self, view, before, after):
+        """Копит прирост памяти от запроса к view по строкам кода."""
+        grown = [
+            (_site(stat), stat.size_diff)
+            for stat in after.compare_to(before, 'lineno')
+            if stat.size_diff > 0
+        ]
+        with self.lock:
+            self.requests[view] += 1
+            self.sites[view].update(dict(grown))
+
+    def checkpoint(self):
+        snapshot = self.snapshot()
+        with self.lock:
+            self.checkpoints.append((time.time(), snapshot))
+
+    def maybe_checkpoint(self):
+        last = self.checkpoints[-1][0] if self.checkpoints else 0
+        if time.time() - last >= settings.MEMORY_PROFILE_CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def view_report(self, limit):
+        lines = [f'Процесс {os.getpid()}']
+        with self.lock:
+            views = sorted(
+                self.sites,
+                key=lambda view: -sum(self.sites[view].values()),
+            )
+            for view in views:
+                sites = self.sites[view]
+                count = self.requests[view]
+                total = sum(sites.values())
+                lines.append(
+                    f'\n{view}: запросов {count}, прирост '
+                    f'{format_size(total)}, '
+                    f'в среднем {format_size(total / count)}'
+                )
+                lines.extend(
+                    f'{format_size(size):>12}  {site}'
+                    for site, size in sites.most_common(limit)
+                )
+        return lines
+
+    def checkpoint_lines(self):
+        return [
+            f'{number}: {time.strftime("%H:%M:%S", time.localtime(taken))}'
+            for number, (taken, _) in enumerate(self.checkpoints)
+        ]
+
+    def diff(self, old, new=None, limit=20):
+        """Разница между точками old и new; без new — до текущего
+        состояния процесса."""
+        old_snapshot = self.checkpoints[old][1]
+        new_snapshot = (
+            self.snapshot() if new is None else self.checkpoints[new][1]
+        )
+        return format_diff(old_snapshot, new_snapshot, limit)
+
+
+profiler = MemoryProfiler()
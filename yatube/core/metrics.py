@@ -0,0 +1,196 @@
+"""Метрики в текстовом формате Prometheus.
+
+Счётчики и гистограммы копятся в памяти процесса под блокировкой —
+на пути запроса это несколько сложений. Не чаще раза
+в METRICS_FLUSH_INTERVAL секунд процесс сохраняет свои значения
+в METRICS_DIR/<pid>-<время старта>.json (запись во временный файл
+и os.replace, так что читатель не видит файл наполовину), а /metrics
+складывает файлы всех процессов. Время старта в имени не даёт новому
+процессу с тем же pid затереть итоги завершившегося.
+
+Файлы завершившихся процессов остаются до перезапуска сервера: их
+счётчики — уже накопленные итоги и должны входить в сумму. Перед
+запуском сервера каталог очищает manage.py clear_metrics, иначе файлы
+прошлых запусков копятся, а счётчики не начинаются с нуля.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = tuple(2 ** power * 1024 for power in range(0, 16, 2))
+
+METRICS = {
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время ответа по view.', LATENCY_BUCKETS
+    ),
+    'yatube_request_queries': (
+        'histogram', 'SQL-запросов на ответ по view.', QUERY_BUCKETS
+    ),
+    'yatube_cache_requests_total': (
+        'counter', 'Обращения к кешу по семейству ключей.', None
+    ),
+    'yatube_thumbnail_seconds': (
+        'histogram', 'Время построения миниатюры.', LATENCY_BUCKETS
+    ),
+    'yatube_upload_bytes': (
+        'histogram', 'Размер сохранённых картинок.', SIZE_BUCKETS
+    ),
+}
+
+local = threading.local()
+
+
+def _key(labels):
+    return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(dict)
+        self.flushed = 0.0
+        self.pid = None
+        self.started = None
+
+    def _check_fork(self):
+        # Дочерний процесс не должен повторно учесть значения родителя
+        # и писать в его файл
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.started = time.time_ns()
+            self.values = defaultdict(dict)
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(labels)
+        with self.lock:
+            self._check_fork()
+            series = self.values[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = _key(labels)
+        position = bisect_left(buckets, value)
+        with self.lock:
+            self._check_fork()
+            series = self.values[name]
+            # Корзины не накопительные, последняя — сверх всех границ;
+            # затем сумма и число наблюдений
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(buckets) + 3)
+            counts[position] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def path(self):
+        return os.path.join(
+            settings.METRICS_DIR, f'{self.pid}-{self.started}.json'
+        )
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed = now
+        with self.lock:
+            self._check_fork()
+            data = json.dumps(self.values, ensure_ascii=False)
+            path = self.path()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=settings.METRICS_DIR)
+        with os.fdopen(handle, 'w') as target:
+            target.write(data)
+        os.replace(temporary, path)
+
+
+registry = Registry()
+
+
+def clear():
+    """Удаляет файлы всех процессов; вызывается перед запуском
+    сервера (manage.py clear_metrics)."""
+    if not os.path.isdir(settings.METRICS_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(settings.METRICS_DIR):
+        os.remove(os.path.join(settings.METRICS_DIR, name))
+        removed += 1
+    return removed
+
+
+def collect():
+    """Значения всех процессов, сложенные по меткам."""
+    registry.flush(force=True)
+    total = defaultdict(dict)
+    for name in os.listdir(settings.METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, name)) as source:
+                values = json.load(source)
+        except (OSError, ValueError):
+            continue
+        for metric, series in values.items():
+            merged = total[metric]
+            for key, value in series.items():
+                if isinstance(value, list):
+                    current = merged.setdefault(key, [0] * len(value))
+                    merged[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+    return total
+
+
+def _labels(key, extra=()):
+    pairs = [*json.loads(key), *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def exposition():
+    """Текст для /metrics в формате Prometheus 0.0.4."""
+    values = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for key, value in sorted(values.get(name, {}).items()):
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(key)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                le = (('le', bound),)
+                lines.append(f'{name}_bucket{_labels(key, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(key)} {value[-2]}')
+            lines.append(f'{name}_count{_labels(key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def count_query(execute, sql, params, many, context):
+    """Обёртка execute: считает запросы текущего ответа."""
+    local.queries = getattr(local, 'queries', 0) + 1
+    return execute(sql, params, many, context)
+
+
+def install(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
@@ -0,0 +1,154 @@
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject
+
+from . import metrics, slow_queries, users
+from .memory import profiler
+
+
+class TrafficCaptureMiddleware:
+    """Пишет выборку запросов в TRAFFIC_CAPTURE_PATH для
+    manage.py replay_traffic: по строке JSON на запрос.
+
+    Лог обезличен: вместо пользователя — его вид и номер корзины
+    (HMAC от id по SECRET_KEY), из строки запроса остаются только
+    параметры TRAFFIC_CAPTURE_QUERY_KEYS; cookie, заголовки, адреса
+    и тела запросов не пишутся.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TRAFFIC_CAPTURE_PATH:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if random.random() >= settings.TRAFFIC_CAPTURE_SAMPLE:
+            return self.get_response(request)
+        started = time.time()
+        response = self.get_response(request)
+        duration = time.time() - started
+        match = request.resolver_match
+        if match is not None:
+            self.write({
+                'time': started,
+                'method': request.method,
+                'view': match.view_name,
+                'args': match.args,
+                'kwargs': match.kwargs,
+                'query': {
+                    key: request.GET.getlist(key)
+                    for key in settings.TRAFFIC_CAPTURE_QUERY_KEYS
+                    if key in request.GET
+                },
+                'user': self.user_bucket(request.user),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+            })
+        return response
+
+    @staticmethod
+    def user_bucket(user):
+        """[вид, корзина]: одна корзина — один воспроизводимый
+        пользователь, сам id в лог не попадает."""
+        if not user.is_authenticated:
+            return ['anonymous', None]
+        digest = hmac.new(
+            settings.SECRET_KEY.encode(), str(user.pk).encode(),
+            hashlib.sha256,
+        ).digest()
+        bucket = int.from_bytes(digest[:4], 'big')
+        return [
+            'staff' if user.is_staff else 'user',
+            bucket % settings.TRAFFIC_CAPTURE_USER_BUCKETS,
+        ]
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self.lock:
+            with open(settings.TRAFFIC_CAPTURE_PATH, 'a') as log:
+                log.write(line)
+
+
+class MemoryProfileMiddleware:
+    """Прирост памяти выборки запросов по view, см. core.memory."""
+
+    def __init__(self, get_response):
+        if not settings.MEMORY_PROFILE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiler.start()
+
+    def __call__(self, request):
+        profiler.maybe_checkpoint()
+        if random.random() >= settings.MEMORY_PROFILE_SAMPLE:
+            return self.get_response(request)
+        before = profiler.snapshot()
+        response = self.get_response(request)
+        match = request.resolver_match
+        if match is not None:
+            profiler.record(match.view_name, before, profiler.snapshot())
+        return response
+
+
+class SlowQueryMiddleware:
+    """Запоминает view запроса для журнала медленных запросов."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            slow_queries.local.view = None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        slow_queries.local.view = request.resolver_match.view_name
+
+
+class MetricsMiddleware:
+    """Время ответа и число SQL-запросов по view, см. core.metrics.
+    Стоит первым, чтобы время включало остальные middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.local.queries = 0
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.registry.observe(
+            'yatube_request_duration_seconds',
+            time.perf_counter() - started,
+            view=view,
+        )
+        metrics.registry.observe(
+            'yatube_request_queries', metrics.local.queries, view=view
+        )
+        metrics.registry.flush()
+        return response
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """request.user из кеша, см. core.users."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: self.get_user(request))
+
+    @staticmethod
+    def get_user(request):
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = users.get_user(request)
+        return request._cached_user
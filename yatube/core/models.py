@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class CreatedModel(models.Model):
@@ -11,3 +12,53 @@ class CreatedModel(models.Model):
     class Meta:
         # Это абстрактная модель:
         abstract = True
+
+
+class Task(CreatedModel):
+    """Отложенная задача, которую выполняет manage.py run_workers.
+
+    Успешно выполненные задачи удаляются, упавшие после всех попыток
+    остаются со статусом failed для разбора.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (FAILED, 'ошибка'),
+    )
+    name = models.CharField('задача', max_length=200)
+    payload = models.TextField('аргументы (JSON)', default='{}')
+    dedup_key = models.CharField(
+        'ключ дедупликации',
+        max_length=200,
+        blank=True,
+        null=True,
+    )
+    status = models.CharField(
+        'статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveIntegerField('попыток', default=0)
+    max_attempts = models.PositiveIntegerField('максимум попыток')
+    run_at = models.DateTimeField('запустить не раньше', default=timezone.now)
+    locked_until = models.DateTimeField('занята до', blank=True, null=True)
+    last_error = models.TextField('последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [models.Index(fields=['status', 'run_at'])]
+        constraints = [
+            # В очереди может ждать только одна задача с данным ключом
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_task_dedup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} [{self.status}]'
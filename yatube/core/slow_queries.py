@@ -0,0 +1,165 @@
+"""Журнал медленных SQL-запросов.
+
+Обёртка execute (см. CoreConfig.ready) замеряет каждый запрос. Запрос
+дольше SLOW_QUERY_THRESHOLD_MS пишется в лог core.slow_queries
+с параметрами, view, из которого он пришёл (его запоминает
+SlowQueryMiddleware), и планом EXPLAIN QUERY PLAN. Параметры
+запросов к таблицам с паролями и сессиями (SENSITIVE_TABLES) в лог
+не попадают — только их типы и длины. В плане
+отмечаются полный просмотр таблицы и временное B-дерево для
+сортировки или группировки.
+
+Похожие запросы — одинаковые с точностью до значений — копятся под
+общим отпечатком, и раз в SLOW_QUERY_REPORT_INTERVAL секунд в лог
+уходит сводка: сколько раз, сколько времени всего и из каких view.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'IN \((?:\?, )*\?\)')
+_PLANNED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+SENSITIVE_TABLES = ('auth_user', 'django_session')
+
+FULL_SCAN = 'полный просмотр'
+TEMP_BTREE = 'временное B-дерево'
+
+local = threading.local()
+
+
+def normalize_sql(sql):
+    """Запрос без значений: разные id и строки не считаются разницей."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+
+def loggable_params(sql, params):
+    """Параметры для лога; у запросов к SENSITIVE_TABLES вместо
+    значений — тип и длина."""
+    if not any(f'"{table}"' in sql for table in SENSITIVE_TABLES):
+        return params
+    return [
+        f'<{type(value).__name__}, {len(str(value))}>' for value in params
+    ] if isinstance(params, (list, tuple)) else '<скрыты>'
+
+
+def plan_flags(plan):
+    """Тревожные места плана SQLite."""
+    flags = set()
+    for line in plan:
+        # «SCAN t USING INDEX ...» идёт по индексу, а не по таблице
+        if line.startswith('SCAN') and ' USING ' not in line:
+            flags.add(FULL_SCAN)
+        if 'USE TEMP B-TREE' in line:
+            flags.add(TEMP_BTREE)
+    return sorted(flags)
+
+
+def explain(connection, sql, params):
+    if connection.vendor != 'sqlite':
+        return []
+    if not sql.lstrip().upper().startswith(_PLANNED):
+        return []
+    local.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+    except Exception:
+        logger.debug('План не получен', exc_info=True)
+        return []
+    finally:
+        local.explaining = False
+
+
+class SlowQueryLog:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.fingerprints = {}
+        self.since = time.time()
+
+    def __call__(self, execute, sql, params, many, context):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold is None or getattr(local, 'explaining', False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= threshold:
+                self.record(
+                    context['connection'], sql, params, many, duration
+                )
+
+    def record(self, connection, sql, params, many, duration):
+        view = getattr(local, 'view', None)
+        plan = [] if many else explain(connection, sql, params)
+        flags = plan_flags(plan)
+        logger.warning(
+            'Медленный запрос %.1f мс из %s%s\n%s\nпараметры: %r\n%s',
+            duration, view or '-',
+            f' ({", ".join(flags)})' if flags else '',
+            sql, loggable_params(sql, params), '\n'.join(plan),
+        )
+        fingerprint = normalize_sql(sql)
+        with self.lock:
+            entry = self.fingerprints.setdefault(fingerprint, {
+                'count': 0, 'total': 0.0, 'max': 0.0,
+                'views': Counter(), 'flags': set(),
+            })
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+            entry['views'][view or '-'] += 1
+            entry['flags'].update(flags)
+        if time.time() - self.since >= settings.SLOW_QUERY_REPORT_INTERVAL:
+            logger.warning('%s', self.report(reset=True))
+
+    def report(self, reset=False):
+        """Сводка по отпечаткам, самые затратные по сумме времени
+        первыми."""
+        with self.lock:
+            entries = sorted(
+                self.fingerprints.items(), key=lambda item: -item[1]['total']
+            )[:settings.SLOW_QUERY_REPORT_TOP]
+            since = time.strftime('%H:%M:%S', time.localtime(self.since))
+            lines = [f'Медленные запросы с {since}:']
+            for fingerprint, entry in entries:
+                views = ', '.join(
+                    f'{view} {count}'
+                    for view, count in entry['views'].most_common(3)
+                )
+                flags = ', '.join(sorted(entry['flags']))
+                lines.append(
+                    f'{entry["count"]} раз, всего {entry["total"]:.0f} мс, '
+                    f'макс. {entry["max"]:.0f} мс; {views}'
+                    + (f'; {flags}' if flags else '')
+                    + f'\n  {fingerprint}'
+                )
+            if reset:
+                self.reset()
+        return '\n'.join(lines)
+
+
+slow_query_log = SlowQueryLog()
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: обёртка на каждое соединение."""
+    if slow_query_log not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_log)
@@ -0,0 +1,46 @@
+"""Разреженные матрицы в формате CSR на чистом NumPy.
+
+Строка i матрицы — это indices[indptr[i]:indptr[i + 1]] (и data в тех же
+границах). Для графа подписок и TF-IDF этого хватает, а зависимость от
+SciPy не нужна.
+"""
+import numpy as np
+
+
+def build_csr(rows, cols, n_rows, data=None):
+    """Собирает CSR из координатных массивов (rows[k], cols[k], data[k]).
+
+    Возвращает (indptr, indices, data); data равно None, если веса
+    не переданы.
+    """
+    order = np.argsort(rows, kind='stable')
+    counts = np.bincount(rows, minlength=n_rows)
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = cols[order]
+    if data is not None:
+        data = data[order]
+    return indptr, indices, data
+
+
+def gather_offsets(indptr, rows, limit=None):
+    """Позиции всех элементов строк rows подряд, без цикла по строкам.
+
+    limit ограничивает число элементов, взятых из каждой строки.
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    if limit is not None:
+        lengths = np.minimum(lengths, limit)
+    total = int(lengths.sum())
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return shift + np.arange(total, dtype=np.int64)
+
+
+def gather_rows(indptr, indices, rows, limit=None):
+    """Конкатенация строк rows матрицы (indptr, indices)."""
+    return indices[gather_offsets(indptr, rows, limit)]
+
+
+def row_slice(indptr, indices, row):
+    return indices[indptr[row]:indptr[row + 1]]
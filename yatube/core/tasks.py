@@ -0,0 +1,167 @@
+"""Небольшая очередь отложенных задач поверх таблицы core.Task.
+
+Задача — обычная функция, отмеченная декоратором @task в модуле
+tasks.py любого приложения. Из view её ставят в очередь через
+enqueue(): запись появляется только после коммита транзакции запроса,
+так что воркер не увидит задачу про ещё не сохранённые данные.
+Выполняет задачи manage.py run_workers.
+"""
+import json
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(func=None, *, max_attempts=None):
+    """Регистрирует функцию как задачу: @task или @task(max_attempts=5)."""
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        func.task_name = name
+        func.max_attempts = max_attempts or settings.TASKS_MAX_ATTEMPTS
+        _registry[name] = func
+        return func
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def discover_tasks():
+    autodiscover_modules('tasks')
+
+
+def enqueue(func, *args, dedup_key=None, delay=0, **kwargs):
+    """Ставит задачу в очередь после коммита текущей транзакции.
+
+    Пока в очереди ждёт задача с тем же dedup_key, новая не создаётся.
+    Аргументы должны сериализоваться в JSON.
+    """
+    if settings.TASKS_EAGER:
+        func(*args, **kwargs)
+        return
+
+    def insert():
+        try:
+            with transaction.atomic():
+                Task.objects.create(
+                    name=func.task_name,
+                    payload=json.dumps({'args': args, 'kwargs': kwargs}),
+                    dedup_key=dedup_key,
+                    max_attempts=func.max_attempts,
+                    run_at=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            logger.debug('Задача %s уже в очереди', dedup_key)
+
+    transaction.on_commit(insert)
+
+
+def _runnable(now):
+    return (
+        Q(status=Task.PENDING, run_at__lte=now)
+        | Q(
+            status=Task.RUNNING,
+            locked_until__lt=now,
+            attempts__lt=F('max_attempts'),
+        )
+    )
+
+
+def _fail_abandoned(now):
+    """Задачи, чей воркер погиб на последней попытке (нехватка памяти,
+    падение в C-расширении), помечаются failed, а не берутся снова."""
+    Task.objects.filter(
+        status=Task.RUNNING,
+        locked_until__lt=now,
+        attempts__gte=F('max_attempts'),
+    ).update(
+        status=Task.FAILED,
+        last_error='Воркер не завершил задачу за отведённое время',
+    )
+
+
+def claim_task():
+    """Забирает одну готовую задачу; истёкшие блокировки упавших
+    воркеров тоже считаются свободными, пока не исчерпаны попытки."""
+    now = timezone.now()
+    _fail_abandoned(now)
+    candidates = Task.objects.filter(_runnable(now)).values_list(
+        'id', flat=True
+    )[:settings.TASKS_CLAIM_BATCH]
+    lease = timedelta(seconds=settings.TASKS_LEASE_SECONDS)
+    for task_id in list(candidates):
+        claimed = Task.objects.filter(_runnable(now), id=task_id).update(
+            status=Task.RUNNING,
+            locked_until=now + lease,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Task.objects.get(id=task_id)
+    return None
+
+
+def backoff_delay(attempts):
+    """Экспоненциальная пауза перед повтором со случайным разбросом."""
+    delay = settings.TASKS_RETRY_BACKOFF * 2 ** (attempts - 1)
+    return delay * random.uniform(0.5, 1.5)
+
+
+def _schedule_retry(task_obj, error):
+    task_obj.last_error = error
+    if task_obj.attempts >= task_obj.max_attempts:
+        task_obj.status = Task.FAILED
+        task_obj.save(update_fields=['status', 'last_error'])
+        return
+    task_obj.status = Task.PENDING
+    task_obj.locked_until = None
+    task_obj.run_at = timezone.now() + timedelta(
+        seconds=backoff_delay(task_obj.attempts)
+    )
+    try:
+        with transaction.atomic():
+            task_obj.save(update_fields=[
+                'status', 'locked_until', 'run_at', 'last_error'
+            ])
+    except IntegrityError:
+        # Такая же задача уже снова в очереди, она и выполнит работу
+        task_obj.delete()
+
+
+def run_task(task_obj):
+    func = _registry.get(task_obj.name)
+    if func is None:
+        _schedule_retry(task_obj, f'Неизвестная задача {task_obj.name}')
+        return False
+    payload = json.loads(task_obj.payload)
+    try:
+        func(*payload.get('args', ()), **payload.get('kwargs', {}))
+    except Exception:
+        logger.exception('Задача %s упала', task_obj)
+        _schedule_retry(task_obj, traceback.format_exc())
+        return False
+    task_obj.delete()
+    return True
+
+
+def run_pending(limit=None):
+    """Выполняет готовые задачи в текущем потоке; возвращает их число."""
+    done = 0
+    while limit is None or done < limit:
+        task_obj = claim_task()
+        if task_obj is None:
+            break
+        run_task(task_obj)
+        done += 1
+    return done
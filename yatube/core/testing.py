@@ -0,0 +1,139 @@
+"""Проверка числа SQL-запросов на каждый адрес сайта.
+
+QueryBudgetMixin обходит все маршруты из urlconfs анонимным
+и авторизованным клиентом на данных двух размеров (seed(1) и затем
+ещё seed(scale - 1)) и проверяет, что:
+
+- число запросов страницы не зависит от объёма данных, то есть в неё
+  не пробрался запрос на каждую строку;
+- оно не больше бюджета, объявленного для маршрута в budgets.
+
+Маршруты из post_data запрашиваются POST с этими данными, остальные —
+GET. Ответ 405 — ошибка: значит, запись не измерена, а маршруту нужны
+данные для POST.
+
+Маршрут без бюджета или без значений для своих параметров — тоже
+ошибка, так что новая страница не останется без проверки. При провале
+запросы двух прогонов сравниваются построчно: в unified diff видно,
+какие запросы добавились, а какие пропали.
+"""
+import difflib
+from importlib import import_module
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from .slow_queries import normalize_sql
+
+ANONYMOUS = 'anonymous'
+AUTHORIZED = 'authorized'
+
+
+def query_diff(before, after, before_name='до', after_name='после'):
+    return '\n'.join(difflib.unified_diff(
+        [normalize_sql(sql) for sql in before],
+        [normalize_sql(sql) for sql in after],
+        before_name,
+        after_name,
+        lineterm='',
+    ))
+
+
+def iter_routes(urlconf):
+    """(имя вида 'namespace:name', параметры) для маршрутов модуля."""
+    module = import_module(urlconf)
+    namespace = getattr(module, 'app_name', None)
+    for pattern in module.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        name = f'{namespace}:{pattern.name}' if namespace else pattern.name
+        yield name, sorted(pattern.pattern.converters)
+
+
+class QueryBudgetMixin:
+    """Тест бюджета запросов: class Tests(QueryBudgetMixin, TestCase).
+
+    Наследник задаёт urlconfs, budgets ({маршрут: число запросов}),
+    url_kwargs (значения параметров маршрутов по имени), post_data
+    ({маршрут: данные формы} для POST), пользователя
+    self.user для авторизованного клиента и seed(size), добавляющий
+    size порций данных поверх уже созданных.
+    """
+    urlconfs = ()
+    budgets = {}
+    url_kwargs = {}
+    post_data = {}
+    scale = 5
+    user = None
+
+    def seed(self, size):
+        raise NotImplementedError
+
+    def routes(self):
+        for urlconf in self.urlconfs:
+            for name, params in iter_routes(urlconf):
+                missing = [
+                    param for param in params if param not in self.url_kwargs
+                ]
+                if missing:
+                    self.fail(f'{name}: нет значений для {missing}')
+                yield name, reverse(name, kwargs={
+                    param: self.url_kwargs[param] for param in params
+                })
+
+    def request(self, name, url):
+        if name in self.post_data:
+            return self.client.post(url, self.post_data[name])
+        return self.client.get(url)
+
+    def capture(self, name, url, client_kind):
+        """Запросы одного обращения к маршруту; перед ним оно
+        повторяется вхолостую, чтобы прогреть состояние процесса,
+        а кеш очищается, чтобы считать запросы без него."""
+        if client_kind == AUTHORIZED:
+            self.client.force_login(self.user)
+        else:
+            self.client.logout()
+        self.request(name, url)
+        cache.clear()
+        if client_kind == AUTHORIZED:
+            self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.request(name, url)
+        self.assertNotEqual(
+            response.status_code, 405,
+            f'{name}: метод не разрешён, нужны данные в post_data',
+        )
+        return [query['sql'] for query in context.captured_queries]
+
+    def capture_all(self):
+        return {
+            (name, client_kind): self.capture(name, url, client_kind)
+            for name, url in self.routes()
+            for client_kind in (ANONYMOUS, AUTHORIZED)
+        }
+
+    def test_query_budgets(self):
+        self.seed(1)
+        small = self.capture_all()
+        self.seed(self.scale - 1)
+        large = self.capture_all()
+        for (name, client_kind), queries in large.items():
+            with self.subTest(route=name, client=client_kind):
+                self.assertIn(name, self.budgets, 'Не объявлен бюджет')
+                before = small[name, client_kind]
+                self.assertEqual(
+                    len(queries),
+                    len(before),
+                    'Число запросов растёт с объёмом данных:\n'
+                    + query_diff(before, queries, 'мало данных', 'много'),
+                )
+                self.assertLessEqual(
+                    len(queries),
+                    self.budgets[name],
+                    'Бюджет превышен:\n' + '\n'.join(
+                        normalize_sql(sql) for sql in queries
+                    ),
+                )
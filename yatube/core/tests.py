@@ -1,6 +1,45 @@
+import asyncio
+import json
+import os
+import tempfile
+import tracemalloc
+import time
+from datetime import timedelta
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import LOCK_SUFFIX, get_or_compute
+from .loadtest import LoadTest, Stats, compare_report
+from .management.commands.replay_traffic import load_capture
+from .metrics import Registry, collect, registry
+from .models import Task
+from .slow_queries import (FULL_SCAN, TEMP_BTREE, explain, plan_flags,
+                           slow_query_log)
+from .testing import normalize_sql, query_diff
+from .tasks import claim_task, enqueue, run_pending, task
+from .users import USER_KEY, user_by_username
+
+calls = []
+
+
+@task(max_attempts=2)
+def record_call(value):
+    calls.append(value)
+
+
+@task(max_attempts=2)
+def always_fails():
+    raise ValueError('Ошибка в задаче')
 
 
 class CoreURLTests(TestCase):
@@ -8,3 +47,466 @@ class CoreURLTests(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class StaleCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_value_is_computed_once(self):
+        """Пока срок не истёк, значение берётся из кеша."""
+        self.assertEqual(get_or_compute('key', self.compute, 60, beta=0), 1)
+        self.assertEqual(get_or_compute('key', self.compute, 60, beta=0), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_locked(self):
+        """Пока другой воркер держит блокировку, отдаётся старое значение."""
+        get_or_compute('key', self.compute, 0, beta=0)
+        cache.add('key' + LOCK_SUFFIX, 1)
+        self.assertEqual(get_or_compute('key', self.compute, 0, beta=0), 1)
+        cache.delete('key' + LOCK_SUFFIX)
+        self.assertEqual(get_or_compute('key', self.compute, 0, beta=0), 2)
+
+    def test_failed_compute_releases_lock(self):
+        """Исключение при пересчёте снимает блокировку."""
+        def fail():
+            raise ValueError('Ошибка пересчёта')
+
+        with self.assertRaises(ValueError):
+            get_or_compute('key', fail, 60, beta=0)
+        self.assertIsNone(cache.get('key' + LOCK_SUFFIX))
+        self.assertEqual(get_or_compute('key', self.compute, 60, beta=0), 1)
+
+    def test_early_refresh(self):
+        """С большим beta запись обновляется до истечения срока."""
+        get_or_compute('key', self.compute, 60, beta=0)
+        cache.set('key', (1, time.time() + 60, 1.0))
+        with mock.patch('core.cache.random.random', return_value=0.999999):
+            self.assertEqual(
+                get_or_compute('key', self.compute, 60, beta=10), 2
+            )
+
+
+class TasksTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def add_task(self, func, *args, **fields):
+        return Task.objects.create(
+            name=func.task_name,
+            payload=json.dumps({'args': args}),
+            max_attempts=func.max_attempts,
+            **fields,
+        )
+
+    def test_task_runs_and_is_removed(self):
+        """Выполненная задача удаляется из очереди."""
+        self.add_task(record_call, 1)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        """Упавшая задача откладывается, а после всех попыток
+        помечается как failed."""
+        task_obj = self.add_task(always_fails)
+        run_pending()
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.PENDING)
+        self.assertEqual(task_obj.attempts, 1)
+        self.assertGreater(task_obj.run_at, timezone.now())
+        Task.objects.filter(id=task_obj.id).update(run_at=timezone.now())
+        run_pending()
+        task_obj.refresh_from_db()
+        self.assertEqual(task_obj.status, Task.FAILED)
+
+    def test_pending_dedup_key_is_unique(self):
+        """Две задачи с одним ключом не ждут в очереди одновременно."""
+        self.add_task(record_call, 1, dedup_key='key')
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.add_task(record_call, 2, dedup_key='key')
+
+    def test_abandoned_task_fails_after_last_attempt(self):
+        """Задача, чей воркер погиб на последней попытке, помечается
+        failed и больше не забирается."""
+        expired = timezone.now() - timedelta(seconds=1)
+        retried = self.add_task(
+            always_fails, status=Task.RUNNING, locked_until=expired,
+            attempts=1,
+        )
+        exhausted = self.add_task(
+            record_call, 1, status=Task.RUNNING, locked_until=expired,
+            attempts=2,
+        )
+        self.assertEqual(claim_task(), retried)
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, Task.FAILED)
+        self.assertIsNone(claim_task())
+        self.assertEqual(calls, [])
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode(self):
+        """В режиме TASKS_EAGER задача выполняется сразу."""
+        enqueue(record_call, 3)
+        self.assertEqual(calls, [3])
+
+
+class EnqueueTests(TransactionTestCase):
+    """on_commit срабатывает только вне TestCase."""
+
+    def test_inserted_on_commit(self):
+        """Запись появляется только после коммита."""
+        with transaction.atomic():
+            enqueue(record_call, 1)
+            self.assertFalse(Task.objects.exists())
+        self.assertEqual(Task.objects.get().name, record_call.task_name)
+
+    def test_dropped_on_rollback(self):
+        """После отката транзакции задачи нет."""
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                enqueue(record_call, 1)
+                raise ValueError('Откат')
+        self.assertFalse(Task.objects.exists())
+
+    def test_dedup_key(self):
+        """Пока задача с ключом ждёт, вторая с тем же ключом
+        не ставится."""
+        enqueue(record_call, 1, dedup_key='key')
+        enqueue(record_call, 2, dedup_key='key')
+        enqueue(record_call, 3, dedup_key='other')
+        self.assertEqual(
+            sorted(Task.objects.values_list('dedup_key', flat=True)),
+            ['key', 'other'],
+        )
+
+
+class QueryDiffTests(TestCase):
+    def test_values_are_ignored(self):
+        """Запросы, отличающиеся только значениями, совпадают."""
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (1, 2) AND s = 'a'"),
+            normalize_sql("SELECT * FROM t WHERE id IN (7) AND s = 'b''c'"),
+        )
+
+    def test_new_query_in_diff(self):
+        """Лишний запрос попадает в diff строкой с плюсом."""
+        diff = query_diff(
+            ['SELECT 1 FROM t'], ['SELECT 1 FROM t', 'SELECT 2 FROM u']
+        )
+        self.assertIn('+SELECT ? FROM u', diff.splitlines())
+
+
+async def fake_server(reader, writer):
+    """Отвечает 200 на /ok и 500 «database is locked» на остальное."""
+    request_line = await reader.readline()
+    await reader.readuntil(b'\r\n\r\n')
+    if b' /ok ' in request_line:
+        status, body = '200 OK', b'ok'
+    else:
+        status, body = '500 Internal Server Error', b'database is locked'
+    writer.write(
+        f'HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\n'
+        f'Set-Cookie: csrftoken=abc; Path=/\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+    writer.close()
+
+
+class LoadTestTests(TestCase):
+    async def run_load(self):
+        server = await asyncio.start_server(fake_server, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def journey(session):
+            await session.get('/ok')
+            await session.post('/write', {'text': 'x'})
+            self.assertEqual(session.cookies['csrftoken'], 'abc')
+
+        load = LoadTest(
+            f'http://127.0.0.1:{port}', {'write': (journey, 1)}, seed=1
+        )
+        async with server:
+            return await load.open(rate=50, duration=0.2)
+
+    def test_stats_per_route(self):
+        """Задержки и ошибки собираются по маршрутам, ошибка базы
+        узнаётся по тексту ответа."""
+        stats = asyncio.run(self.run_load())
+        ok, write = stats.routes['/ok'], stats.routes['/write']
+        self.assertEqual(len(ok.latencies), len(write.latencies))
+        self.assertGreater(len(ok.latencies), 0)
+        self.assertFalse(ok.errors)
+        self.assertEqual(
+            write.errors,
+            {'HTTP 500: database is locked': len(write.latencies)},
+        )
+        self.assertEqual(sum(ok.histogram()), len(ok.latencies))
+        self.assertIn('/write', stats.report())
+
+
+class TrafficCaptureTests(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def test_capture_is_anonymized_and_replayable(self):
+        """В логе нет имени и id пользователя и лишних параметров,
+        а запись снова превращается в адрес."""
+        user = get_user_model().objects.create_user(username='secret')
+        self.client.force_login(user)
+        with override_settings(
+            TRAFFIC_CAPTURE_PATH=self.path, TRAFFIC_CAPTURE_SAMPLE=1
+        ):
+            self.client.get('/?page=1&token=abc')
+            self.client.get('/profile/secret/')
+        with open(self.path) as capture:
+            text = capture.read()
+        first = json.loads(text.splitlines()[0])
+        self.assertEqual(first['view'], 'posts:index')
+        self.assertEqual(first['query'], {'page': ['1']})
+        self.assertEqual(first['user'][0], 'user')
+        self.assertNotIn('abc', text)
+        requests, skipped = load_capture(self.path)
+        self.assertEqual(skipped, 0)
+        self.assertEqual(
+            [path for _, _, path, _ in requests],
+            ['/?page=1', '/profile/secret/'],
+        )
+
+    def test_compare_marks_regressions(self):
+        """Маршрут, у которого вырос p90, отмечается «!»."""
+        base = Stats.from_dict({
+            'fast': {'latencies': [10] * 10, 'errors': {}},
+            'slow': {'latencies': [10] * 10, 'errors': {}},
+        })
+        new = Stats.from_dict({
+            'fast': {'latencies': [10] * 10, 'errors': {}},
+            'slow': {'latencies': [30] * 10, 'errors': {'HTTP 500': 1}},
+        })
+        lines = compare_report(base, new).splitlines()
+        self.assertFalse(lines[1].endswith('!'))
+        self.assertTrue(lines[2].endswith('!'))
+        self.assertIn('0→1', lines[2])
+
+
+@override_settings(MEMORY_PROFILE=True, MEMORY_PROFILE_SAMPLE=1)
+class MemoryProfileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True
+        )
+
+    def setUp(self):
+        self.addCleanup(tracemalloc.stop)
+        self.client.force_login(self.staff)
+
+    def test_report_by_view(self):
+        """Прирост памяти копится по view, точки сравниваются."""
+        self.client.get('/')
+        response = self.client.get('/debug/memory/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('posts:index: запросов 1', response.content.decode())
+        response = self.client.get('/debug/memory/?diff=0')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get('/debug/memory/?diff=5,7')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_staff_only(self):
+        """Отчёт доступен только персоналу."""
+        self.client.logout()
+        response = self.client.get('/debug/memory/')
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        slow_query_log.reset()
+
+    def test_plan_flags(self):
+        """Полный просмотр и сортировка во временном дереве видны
+        в плане."""
+        plan = explain(
+            connection,
+            'SELECT id FROM posts_post WHERE text LIKE %s ORDER BY text',
+            ['%x%'],
+        )
+        self.assertEqual(set(plan_flags(plan)), {FULL_SCAN, TEMP_BTREE})
+        plan = explain(
+            connection, 'SELECT id FROM posts_post WHERE id = %s', [1]
+        )
+        self.assertEqual(plan_flags(plan), [])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_password_hash_not_logged(self):
+        """Параметры запросов к auth_user в лог не пишутся."""
+        user = get_user_model().objects.create_user(username='secret')
+        user.set_password('пароль')
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            user.save(update_fields=['password'])
+        self.assertNotIn(user.password, '\n'.join(logs.output))
+        self.assertIn("'<str, ", logs.output[0])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_grouped_by_fingerprint(self):
+        """Запросы страницы пишутся в лог и сводятся по отпечатку
+        с именем view."""
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get('/')
+            self.client.get('/?page=2')
+        self.assertIn('из posts:index', logs.output[0])
+        report = slow_query_log.report()
+        self.assertIn('posts:index 2', report)
+        self.assertIn('2 раз', report)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        registry.values.clear()
+        cache.clear()
+
+    def test_metrics_summed_across_processes(self):
+        """/metrics складывает значения всех процессов из общего
+        каталога."""
+        other = os.path.join(self.directory, '1.json')
+        with open(other, 'w') as target:
+            json.dump({'yatube_cache_requests_total': {
+                '[["family", "page"], ["result", "hit"]]': 5,
+            }}, target)
+        with override_settings(METRICS_DIR=self.directory):
+            self.client.get('/')
+            self.client.get('/')
+            text = self.client.get('/metrics').content.decode()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            text,
+        )
+        self.assertIn(
+            'yatube_request_queries_bucket{view="posts:index",le="+Inf"} 2',
+            text,
+        )
+        self.assertIn(
+            'yatube_cache_requests_total{family="page",result="hit"} 5',
+            text,
+        )
+        self.assertIn(
+            'yatube_cache_requests_total{family="fragment",result="miss"} 1',
+            text,
+        )
+
+    def test_new_process_with_same_pid_keeps_old_totals(self):
+        """Процесс с тем же pid после перезапуска пишет свой файл,
+        и итоги прежнего не теряются; clear_metrics удаляет оба."""
+        with override_settings(METRICS_DIR=self.directory):
+            for _ in range(2):
+                process = Registry()
+                process.inc('yatube_cache_requests_total', family='x')
+                process.flush(force=True)
+            self.assertEqual(len(os.listdir(self.directory)), 2)
+            totals = collect()['yatube_cache_requests_total']
+            self.assertEqual(totals['[["family", "x"]]'], 2)
+            call_command('clear_metrics', stdout=StringIO())
+            self.assertEqual(os.listdir(self.directory), [])
+
+    def test_metrics_only_for_allowed_addresses(self):
+        """Чужим адресам /metrics не отдаётся."""
+        with override_settings(METRICS_DIR=self.directory):
+            response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    USER_CACHE_TIMEOUT=300,
+)
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='reader', password='old-password'
+        )
+        self.client.force_login(self.user)
+        self.unread = reverse('posts:follow_unread')
+
+    def test_logged_in_request_skips_session_and_user(self):
+        """С тёплым кешем страница вошедшего пользователя не читает
+        из базы ни сессию, ни пользователя."""
+        self.client.get(self.unread)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.unread)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_user_edit_invalidates_cache(self):
+        """Правка пользователя видна на следующем запросе."""
+        self.client.get(self.unread)
+        self.user.first_name = 'Новое'
+        self.user.save()
+        response = self.client.get(self.unread)
+        self.assertEqual(response.wsgi_request.user.first_name, 'Новое')
+
+    def test_password_change_ends_other_sessions(self):
+        """После смены пароля другие сессии разлогиниваются."""
+        self.client.get(self.unread)
+        self.user.set_password('new-password')
+        self.user.save()
+        response = self.client.get(self.unread)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_logout_drops_cached_user(self):
+        """Выход убирает пользователя из кеша и из сессии."""
+        self.client.get(self.unread)
+        self.assertIsNotNone(cache.get(USER_KEY.format(self.user.pk)))
+        other = Client()
+        other.cookies = self.client.cookies
+        self.client.get(reverse('users:logout'))
+        self.assertIsNone(cache.get(USER_KEY.format(self.user.pk)))
+        response = other.get(self.unread)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_deactivated_user_not_authenticated(self):
+        """Отключённый пользователь не проходит проверку, даже если
+        лежит в кеше после просмотра профиля."""
+        self.user.is_active = False
+        self.user.save()
+        user_by_username('reader')
+        response = self.client.get(self.unread)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+        USER_CACHE_TIMEOUT=None,
+    )
+    def test_process_local_cache_not_used(self):
+        """С выключенным кешем пользователь и сессия читаются
+        из базы, и в кеш ничего не попадает."""
+        client = Client()
+        client.force_login(self.user)
+        client.get(self.unread)
+        with self.assertNumQueries(3):
+            client.get(self.unread)
+        self.assertIsNone(cache.get(USER_KEY.format(self.user.pk)))
+        self.assertEqual(user_by_username('reader'), self.user)
+        self.assertIsNone(cache.get(USER_KEY.format(self.user.pk)))
+
+    def test_username_map_follows_rename(self):
+        """Кеш имён отдаёт пользователя без запросов, а старое имя
+        после переименования не находится."""
+        user_by_username('reader')
+        with self.assertNumQueries(0):
+            self.assertEqual(user_by_username('reader'), self.user)
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertIsNone(user_by_username('reader'))
+        self.assertEqual(user_by_username('renamed'), self.user)
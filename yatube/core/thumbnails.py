@@ -0,0 +1,30 @@
+import time
+
+from sorl.thumbnail.base import ThumbnailBackend
+
+from .metrics import local, registry
+
+
+class MeteredThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, отдающий в метрики попадания в его
+    хранилище ключей и время построения миниатюр."""
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        local.thumbnail_created = False
+        thumbnail = super().get_thumbnail(file_, geometry_string, **options)
+        result = 'miss' if local.thumbnail_created else 'hit'
+        registry.inc(
+            'yatube_cache_requests_total', family='thumbnail', result=result
+        )
+        return thumbnail
+
+    def _create_thumbnail(self, source_image, geometry_string, options,
+                          thumbnail):
+        started = time.perf_counter()
+        super()._create_thumbnail(
+            source_image, geometry_string, options, thumbnail
+        )
+        local.thumbnail_created = True
+        registry.observe(
+            'yatube_thumbnail_seconds', time.perf_counter() - started
+        )
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('debug/memory/', views.memory_report, name='memory'),
+    path('metrics', views.metrics, name='metrics'),
+]
@@ -0,0 +1,124 @@
+"""Кешированное определение пользователя запроса.
+
+Сессии хранятся в cached_db (SESSION_ENGINE), а пользователь — в кеше
+под ключом с его id на USER_CACHE_TIMEOUT секунд: страница вошедшего
+пользователя не тратит запросы ни на строку сессии, ни на User.
+Хеш сессии сверяется на каждом запросе, как и без кеша, так что смена
+пароля по-прежнему завершает остальные сессии. Запись сбрасывается при
+сохранении и удалении пользователя (смена пароля, правка, вход — он
+обновляет last_login) и при выходе.
+
+Профили ищутся по имени через кеш «имя → id». id из него — только
+подсказка: имя сверяется с найденным пользователем, поэтому старое
+имя после переименования просто перестаёт находиться.
+
+Кеш нужен общий для всех процессов (memcached): сброс записи в кеше
+одного процесса не виден остальным. Поэтому без MEMCACHED_LOCATION
+настройки оставляют сессии в базе, а USER_CACHE_TIMEOUT = None
+выключает кеш пользователя — тогда всё читается из базы, как в Django.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY, get_user_model)
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+from .metrics import registry
+
+USER_KEY = 'auth:user:{}'
+USERNAME_KEY = 'auth:username:{}'
+
+
+def _count(hit):
+    registry.inc(
+        'yatube_cache_requests_total',
+        family='user', result='hit' if hit else 'miss',
+    )
+
+
+def _remember(user):
+    cache.set_many({
+        USER_KEY.format(user.pk): user,
+        USERNAME_KEY.format(user.username): user.pk,
+    }, settings.USER_CACHE_TIMEOUT)
+
+
+def cached_user(user_id):
+    """Пользователь по id или None."""
+    if settings.USER_CACHE_TIMEOUT is None:
+        return get_user_model().objects.filter(pk=user_id).first()
+    user = cache.get(USER_KEY.format(user_id))
+    _count(user is not None)
+    if user is None:
+        user = get_user_model().objects.filter(pk=user_id).first()
+        if user is not None:
+            _remember(user)
+    return user
+
+
+def user_by_username(username):
+    """Пользователь по имени или None."""
+    if settings.USER_CACHE_TIMEOUT is None:
+        return get_user_model().objects.filter(username=username).first()
+    user_id = cache.get(USERNAME_KEY.format(username))
+    if user_id is not None:
+        user = cached_user(user_id)
+        if user is not None and user.username == username:
+            return user
+    user = get_user_model().objects.filter(username=username).first()
+    if user is not None:
+        _remember(user)
+    return user
+
+
+def _can_authenticate(backend_path, user):
+    backend = auth.load_backend(backend_path)
+    check = getattr(backend, 'user_can_authenticate', None)
+    return check is None or check(user)
+
+
+def get_user(request):
+    """То же, что django.contrib.auth.get_user, но пользователь
+    берётся из кеша."""
+    if settings.USER_CACHE_TIMEOUT is None:
+        return auth.get_user(request)
+    try:
+        user_id = get_user_model()._meta.pk.to_python(
+            request.session[SESSION_KEY]
+        )
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    user = cache.get(USER_KEY.format(user_id))
+    _count(user is not None)
+    if user is None:
+        # Промах: полная проверка Django, удачный результат — в кеш
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            _remember(user)
+        return user
+    if (backend_path not in settings.AUTHENTICATION_BACKENDS
+            or not _can_authenticate(backend_path, user)):
+        return AnonymousUser()
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+            session_hash, user.get_session_auth_hash())):
+        request.session.flush()
+        return AnonymousUser()
+    return user
+
+
+def forget_user(sender, instance, **kwargs):
+    """Обработчик post_save и post_delete пользователя."""
+    cache.delete_many([
+        USER_KEY.format(instance.pk),
+        USERNAME_KEY.format(instance.username),
+    ])
+
+
+def forget_logged_out(sender, request, user, **kwargs):
+    """Обработчик user_logged_out."""
+    if user is not None:
+        forget_user(sender, user)
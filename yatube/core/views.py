@@ -1,5 +1,12 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from .memory import profiler
+from .metrics import exposition
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -17,3 +24,41 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def _checkpoint_numbers(value):
+    try:
+        return [int(number) for number in value.split(',')]
+    except ValueError:
+        raise Http404('Номера точек — целые через запятую')
+
+
+@staff_member_required
+def memory_report(request):
+    """Текстовый отчёт профилировщика памяти: ?diff=0,3 — разница
+    между точками 0 и 3, ?diff=2 — от точки 2 до текущего момента."""
+    if not settings.MEMORY_PROFILE:
+        raise Http404('Профилирование памяти выключено')
+    limit = settings.MEMORY_PROFILE_TOP
+    lines = ['Точки:', *profiler.checkpoint_lines(), '']
+    if 'diff' in request.GET:
+        numbers = _checkpoint_numbers(request.GET['diff'])
+        try:
+            lines.extend(profiler.diff(*numbers[:2], limit=limit))
+        except (IndexError, TypeError):
+            raise Http404('Нет такой точки')
+    else:
+        lines.extend(profiler.view_report(limit))
+    return HttpResponse(
+        '\n'.join(lines), content_type='text/plain; charset=utf-8'
+    )
+
+
+def metrics(request):
+    """Метрики всех процессов для Prometheus; только с адресов
+    METRICS_ALLOWED_IPS."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    return HttpResponse(
+        exposition(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,6 +1,20 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.helpers import ActionForm
+from django.urls import reverse
+from django.utils.html import format_html
 
-from .models import Comment, Group, Post
+from core.tasks import enqueue
+from .bulk import create_operation, run_operation
+from .models import BulkOperation, Comment, Group, Post
+from .tasks import run_bulk_operation
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(), required=False, label='Группа'
+    )
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -15,6 +29,68 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('created', 'group')
     empty_value_display = '-пусто-'
+    action_form = PostActionForm
+    actions = ('reassign_group', 'delete_posts', 'purge_authors')
+
+    def get_actions(self, request):
+        # Стандартное удаление грузит каждый пост со всеми зависимостями;
+        # вместо него delete_posts
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def _start(self, request, action, queryset, **params):
+        filters = None
+        if request.POST.get('select_across') == '1':
+            # Выбраны все записи по фильтру: выборку по этим параметрам
+            # построит сама операция
+            filters = dict(request.GET.lists())
+        operation = create_operation(
+            action, queryset, request.user, filters=filters, **params
+        )
+        link = reverse(
+            'admin:posts_bulkoperation_change', args=[operation.id]
+        )
+        if operation.total <= settings.BULK_ACTIONS_SYNC_LIMIT:
+            run_operation(operation)
+            message = 'Готово: {} из {}. <a href="{}">Подробнее</a>'
+        else:
+            enqueue(run_bulk_operation, operation.id)
+            message = (
+                'Операция поставлена в очередь: {} из {}. '
+                '<a href="{}">Следить за прогрессом</a>'
+            )
+        operation.refresh_from_db()
+        self.message_user(
+            request,
+            format_html(message, operation.done, operation.total, link),
+        )
+
+    def reassign_group(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid():
+            self.message_user(request, 'Неверная группа', level='error')
+            return
+        group = form.cleaned_data['group']
+        self._start(
+            request, BulkOperation.REASSIGN, queryset,
+            group=group.id if group else None,
+        )
+    reassign_group.short_description = 'Перенести в выбранную группу'
+    reassign_group.allowed_permissions = ('change',)
+
+    def delete_posts(self, request, queryset):
+        self._start(request, BulkOperation.DELETE, queryset)
+    delete_posts.short_description = 'Удалить выбранные записи'
+    delete_posts.allowed_permissions = ('delete',)
+
+    def purge_authors(self, request, queryset):
+        self._start(request, BulkOperation.PURGE, queryset)
+    purge_authors.short_description = (
+        'Удалить все записи и комментарии их авторов'
+    )
+    purge_authors.allowed_permissions = ('delete',)
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -28,6 +104,26 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ('post', 'author',)
 
 
+class BulkOperationAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk', 'action', 'status', 'progress', 'user', 'created', 'finished'
+    )
+    list_filter = ('action', 'status')
+    fields = (
+        'action', 'status', 'progress', 'params', 'user', 'created',
+        'finished',
+    )
+    readonly_fields = fields
+
+    def progress(self, operation):
+        return f'{operation.done} / {operation.total}'
+    progress.short_description = 'прогресс'
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(BulkOperation, BulkOperationAdmin)
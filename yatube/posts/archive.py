@@ -0,0 +1,62 @@
+"""Перенос старых постов в архивные таблицы.
+
+Ленты работают только с «горячей» таблицей posts_post, которая остаётся
+маленькой вместе с индексами. Архивные посты сохраняют id, поэтому
+старые ссылки /posts/<id>/ продолжают работать. По тем же id остаются
+реакции, просмотры, история правок и упоминания: они привязаны к посту
+без внешнего ключа и при переносе не удаляются. Посты и комментарии
+удаляются запросами DELETE (bulk.delete_set), без загрузки объектов.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk import delete_set
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+from .tags import release_tags
+
+POST_FIELDS = (
+    'id', 'created', 'text', 'text_html', 'html_version', 'author_id',
+    'group_id', 'image',
+)
+COMMENT_FIELDS = (
+    'id', 'created', 'post_id', 'author_id', 'text', 'text_html',
+    'html_version', 'parent_id', 'path', 'depth',
+)
+
+
+def _archive_batch(post_ids):
+    with transaction.atomic():
+        ArchivedPost.objects.bulk_create(
+            ArchivedPost(**row)
+            for row in Post.objects.filter(id__in=post_ids).values(
+                *POST_FIELDS
+            )
+        )
+        comments = Comment.objects.filter(post_id__in=post_ids)
+        ArchivedComment.objects.bulk_create(
+            ArchivedComment(**row)
+            for row in comments.values(*COMMENT_FIELDS)
+        )
+        delete_set(comments, keep=True)
+        # Архивные посты не попадают в ленты тегов
+        release_tags(post_ids)
+        delete_set(Post.objects.filter(id__in=post_ids), keep=True)
+
+
+def archive_old_posts(days=None, batch_size=500):
+    """Переносит посты старше days дней вместе с комментариями
+    и возвращает их число."""
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    horizon = timezone.now() - timedelta(days=days)
+    moved = 0
+    while True:
+        post_ids = list(Post.objects.filter(
+            created__lt=horizon
+        ).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not post_ids:
+            return moved
+        _archive_batch(post_ids)
+        moved += len(post_ids)
@@ -0,0 +1,198 @@
+"""Автодополнение имён пользователей и групп по префиксу.
+
+Индекс — отсортированный список кортежей (ключ, вид, id, подпись,
+адрес) в памяти процесса; поиск — bisect до первого ключа с нужным
+префиксом и проход вперёд, пока ключи им начинаются. Ключи — имя
+пользователя, имя, фамилия и полное имя, а для групп — slug, название
+и каждое его слово, всё в нижнем регистре.
+
+Индекс строится при первом запросе, а сигналы (см. posts.signals)
+правят его при создании, изменении и удалении пользователей
+и групп. Сигналы доходят только до своего процесса, поэтому индекс
+дополнительно перестраивается целиком раз в AUTOCOMPLETE_MAX_AGE
+секунд — в фоновом потоке, один раз на процесс; запросы тем временем
+ищут по прежнему индексу.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.urls import NoReverseMatch, reverse
+
+from .models import Group
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+USER = 'user'
+GROUP = 'group'
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+def _url(name, value):
+    try:
+        return reverse(name, args=[value])
+    except NoReverseMatch:
+        return None
+
+
+def _entries(keys, kind, item_id, label, url):
+    # Без адреса подсказка бесполезна: такой объект не индексируем
+    if url is None:
+        return []
+    return [
+        (normalize(key), kind, item_id, label, url)
+        for key in keys if key.strip()
+    ]
+
+
+def user_entries(user_id, username, first_name, last_name):
+    full_name = f'{first_name} {last_name}'.strip()
+    label = f'{full_name} (@{username})' if full_name else f'@{username}'
+    keys = {username, first_name, last_name, full_name}
+    url = _url('posts:profile', username)
+    return _entries(keys, USER, user_id, label, url)
+
+
+def group_entries(group_id, slug, title):
+    keys = {slug, title, *title.split()}
+    url = _url('posts:group_list', slug)
+    return _entries(keys, GROUP, group_id, title, url)
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self._entries = []
+        self._by_item = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        # Правки, пришедшие во время перестройки; None — не перестраивается
+        self._pending = None
+        self.built = None
+
+    def _load(self):
+        entries = []
+        for row in User.objects.filter(is_active=True).values_list(
+            'id', 'username', 'first_name', 'last_name'
+        ).iterator():
+            entries.extend(user_entries(*row))
+        for row in Group.objects.values_list('id', 'slug', 'title'):
+            entries.extend(group_entries(*row))
+        return entries
+
+    def rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            entries = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        by_item = {}
+        for entry in entries:
+            by_item.setdefault(entry[1:3], []).append(entry)
+        entries.sort()
+        with self._lock:
+            # Поиск читает self._entries без блокировки: список
+            # подменяется целиком, а не правится на месте
+            self._entries, self._by_item = entries, by_item
+            # Прочитанное из базы могло опередить сигналы, пришедшие
+            # за время загрузки: применяем их поверх
+            pending, self._pending = self._pending, None
+            for kind, item_id, item_entries in pending:
+                self._apply(kind, item_id, item_entries)
+            self.built = time.monotonic()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Индекс автодополнения не перестроен')
+        finally:
+            with self._lock:
+                self._rebuilding = False
+            # Соединение потока больше никому не понадобится
+            connections.close_all()
+
+    def ensure_fresh(self):
+        if self.built is None:
+            # Первого построения ждут все: искать ещё не по чему
+            with self._build_lock:
+                if self.built is None:
+                    self.rebuild()
+            return
+        if time.monotonic() - self.built <= settings.AUTOCOMPLETE_MAX_AGE:
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(
+            target=self._rebuild_in_background,
+            name='autocomplete-rebuild',
+            daemon=True,
+        ).start()
+
+    def update(self, kind, item_id, entries):
+        """Заменяет ключи объекта; пустой entries удаляет его.
+
+        Правится копия списка, так что поиск без блокировки никогда
+        не видит его наполовину изменённым.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((kind, item_id, entries))
+            elif self.built is None:
+                return
+            self._apply(kind, item_id, entries)
+
+    def _apply(self, kind, item_id, entries):
+        updated = list(self._entries)
+        for entry in self._by_item.pop((kind, item_id), ()):
+            position = bisect_left(updated, entry)
+            if updated[position:position + 1] == [entry]:
+                del updated[position]
+        for entry in entries:
+            insort(updated, entry)
+        if entries:
+            self._by_item[kind, item_id] = list(entries)
+        self._entries = updated
+
+    def search(self, query, limit=None):
+        """До limit подсказок [(вид, подпись, адрес)] по префиксу."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = limit or settings.AUTOCOMPLETE_LIMIT
+        entries = self._entries
+        position = bisect_left(entries, (prefix,))
+        seen = set()
+        found = []
+        while position < len(entries) and len(found) < limit:
+            key, kind, item_id, label, url = entries[position]
+            if not key.startswith(prefix):
+                break
+            if (kind, item_id) not in seen:
+                seen.add((kind, item_id))
+                found.append((kind, label, url))
+            position += 1
+        return found
+
+
+prefix_index = PrefixIndex()
+
+
+def autocomplete(query, limit=None):
+    prefix_index.ensure_fresh()
+    return prefix_index.search(query, limit)
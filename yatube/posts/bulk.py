@@ -0,0 +1,229 @@
+"""Массовые операции над постами запросами UPDATE и DELETE.
+
+Стандартное удаление Django загружает каждый объект и весь граф его
+зависимостей в память. Здесь посты обрабатываются пачками по
+BULK_ACTIONS_CHUNK id: зависимые строки удаляются запросами
+DELETE ... WHERE ... IN (подзапрос) по связям модели, без загрузки
+объектов, а прогресс пишется в BulkOperation после каждой пачки.
+Небольшие выборки админка обрабатывает сразу, большие — задачей
+run_bulk_operation в фоне. Выбор «все по фильтру» сохраняется
+параметрами фильтра списка админки, а не id: задача сама заново
+строит выборку и идёт по ней пачками.
+"""
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CASCADE, DO_NOTHING, SET_NULL
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from .models import BulkOperation, Comment, Post
+from .tags import release_tags
+
+
+def _with_descendants(queryset, field_name):
+    """Выборка вместе со всеми потомками по ссылке модели на себя
+    (ответы на комментарии); читаются только id."""
+    model = queryset.model
+    ids = set(queryset.values_list('pk', flat=True))
+    frontier = ids
+    while frontier:
+        frontier = set(model._base_manager.filter(**{
+            f'{field_name}__in': frontier
+        }).values_list('pk', flat=True)) - ids
+        ids |= frontier
+    return model._base_manager.filter(pk__in=ids)
+
+
+def _reverse_relations(model):
+    # Скрытые связи (related_name='+') тоже нужны: иначе строки
+    # со ссылкой на удалённый пост останутся
+    return [
+        field for field in model._meta.get_fields(include_hidden=True)
+        if field.auto_created and not field.concrete
+        and (field.one_to_many or field.one_to_one)
+    ]
+
+
+def _kept(relation):
+    """Связь без внешнего ключа в базе: такие строки (реакции,
+    просмотры, история, упоминания) переживают архивирование, а при
+    удалении уходят вместе с постом или комментарием."""
+    return (
+        relation.on_delete is DO_NOTHING
+        and not relation.field.db_constraint
+    )
+
+
+def delete_kept(model, ids):
+    """Удаляет строки, привязанные к записям model с id из ids без
+    внешнего ключа; для архивных записей — по связям исходной модели."""
+    for relation in _reverse_relations(model):
+        if _kept(relation):
+            delete_set(relation.related_model._base_manager.filter(**{
+                f'{relation.field.name}__in': ids
+            }))
+
+
+def delete_set(queryset, keep=False):
+    """Удаляет выборку и всё, что каскадно от неё зависит, запросами
+    DELETE без загрузки объектов. Сигналы удаления не отправляются.
+    С keep строки, привязанные без внешнего ключа, остаются."""
+    model = queryset.model
+    relations = _reverse_relations(model)
+    for relation in relations:
+        if relation.related_model is model:
+            queryset = _with_descendants(queryset, relation.field.name)
+    for relation in relations:
+        if relation.related_model is model:
+            continue
+        dependents = relation.related_model._base_manager.filter(**{
+            f'{relation.field.name}__in': queryset.values('pk')
+        })
+        if relation.on_delete is CASCADE:
+            delete_set(dependents, keep)
+        elif _kept(relation):
+            if not keep:
+                delete_set(dependents)
+        elif relation.on_delete is SET_NULL:
+            dependents.update(**{relation.field.name: None})
+        elif relation.on_delete is not DO_NOTHING:
+            raise ValueError(
+                f'Связь {relation} не поддерживает массовое удаление'
+            )
+    # _raw_delete — один DELETE по условию выборки, без Collector
+    return queryset._raw_delete(queryset.db)
+
+
+def delete_posts(post_ids):
+    release_tags(post_ids)
+    return delete_set(Post.objects.filter(id__in=post_ids))
+
+
+def reassign_group(post_ids, group_id):
+    return Post.objects.filter(id__in=post_ids).update(group_id=group_id)
+
+
+def _chunks(queryset, chunk_size):
+    """id выборки пачками по возрастанию; выборка перечитывается для
+    каждой пачки, так что обработанные строки могут из неё выпадать."""
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list(
+            'id', flat=True
+        )[:chunk_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield ids
+
+
+def _slices(ids, chunk_size):
+    for start in range(0, len(ids), chunk_size):
+        yield ids[start:start + chunk_size]
+
+
+def _changelist_posts(filters, user):
+    """Посты, которые список админки показал бы с параметрами filters
+    ({параметр: [значения]})."""
+    from django.contrib import admin
+    from django.contrib.auth.models import AnonymousUser
+
+    # posts.admin сам импортирует этот модуль
+    from .admin import PostAdmin
+    request = HttpRequest()
+    request.GET = QueryDict(mutable=True)
+    for name, values in filters.items():
+        request.GET.setlist(name, values)
+    request.user = user or AnonymousUser()
+    model_admin = PostAdmin(Post, admin.site)
+    return model_admin.get_changelist_instance(request).get_queryset(
+        request
+    )
+
+
+def _steps(operation, chunk_size):
+    """Пары (пачки id, функция над пачкой) для операции."""
+    params = json.loads(operation.params)
+    if operation.action == BulkOperation.PURGE:
+        authors = params['authors']
+        return [
+            (
+                _chunks(Post.objects.filter(author__in=authors), chunk_size),
+                delete_posts,
+            ),
+            (
+                _chunks(
+                    Comment.objects.filter(author__in=authors), chunk_size
+                ),
+                lambda ids: delete_set(Comment.objects.filter(id__in=ids)),
+            ),
+        ]
+    if 'filters' in params:
+        posts = _chunks(
+            _changelist_posts(params['filters'], operation.user), chunk_size
+        )
+    else:
+        posts = _slices(params['posts'], chunk_size)
+    if operation.action == BulkOperation.REASSIGN:
+        return [(posts, lambda ids: reassign_group(ids, params['group']))]
+    return [(posts, delete_posts)]
+
+
+def _progress(operation, **fields):
+    BulkOperation.objects.filter(id=operation.id).update(**fields)
+
+
+def run_operation(operation):
+    chunk_size = settings.BULK_ACTIONS_CHUNK
+    _progress(operation, status=BulkOperation.RUNNING)
+    done = 0
+    try:
+        for chunks, apply in _steps(operation, chunk_size):
+            for ids in chunks:
+                with transaction.atomic():
+                    apply(ids)
+                done += len(ids)
+                _progress(operation, done=done)
+    except Exception:
+        _progress(operation, status=BulkOperation.FAILED)
+        raise
+    _progress(
+        operation, status=BulkOperation.DONE, finished=timezone.now()
+    )
+    return done
+
+
+def create_operation(action, posts, user, filters=None, **params):
+    """Записывает операцию над выборкой posts; запускает её вызывающий:
+    run_operation сразу или задача run_bulk_operation в фоне.
+
+    filters — параметры фильтра списка админки, если выбраны все
+    записи по нему; иначе сохраняются id отмеченных постов (их не
+    больше страницы списка). Ни то ни другое не зависит от версии
+    кода, так что операция из очереди выполнится и после обновления."""
+    if action == BulkOperation.PURGE:
+        params['authors'] = list(
+            posts.order_by('author_id').values_list(
+                'author_id', flat=True
+            ).distinct()
+        )
+        total = (
+            Post.objects.filter(author__in=params['authors']).count()
+            + Comment.objects.filter(author__in=params['authors']).count()
+        )
+    elif filters is not None:
+        params['filters'] = filters
+        total = posts.count()
+    else:
+        params['posts'] = list(
+            posts.order_by('id').values_list('id', flat=True)
+        )
+        total = len(params['posts'])
+    return BulkOperation.objects.create(
+        action=action,
+        params=json.dumps(params),
+        total=total,
+        user=user,
+    )
@@ -1,9 +1,12 @@
 from django.forms import ModelForm
 
 from .models import Comment, Post
+from .uploads import ChunkedUploadFile, completed_upload
 
 
 class PostForm(ModelForm):
+    """Форма поста; картинку можно передать токеном загрузки частями."""
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
@@ -13,6 +16,32 @@ class PostForm(ModelForm):
             'image': 'Загрузите изображение'
         }
 
+    def __init__(self, *args, upload_token=None, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_token = upload_token
+        self.upload = None
+        if upload_token and user is not None:
+            self.upload = completed_upload(user, upload_token)
+        if self.upload is not None:
+            self.files = self.files.copy()
+            self.files['image'] = ChunkedUploadFile(self.upload)
+
+    def full_clean(self):
+        try:
+            super().full_clean()
+        finally:
+            # После проверки файл загрузки нужен хранилищу только по пути
+            # (temporary_file_path): дескриптор закрываем сразу, даже если
+            # форма не прошла проверку или пост так и не сохранится
+            if self.upload is not None:
+                self.files['image'].close()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.upload_token and self.upload is None:
+            self.add_error('image', 'Загрузка не найдена или не завершена')
+        return cleaned_data
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,117 @@
+"""Сценарии посетителей для manage.py loadtest (см. core.loadtest).
+
+Посты сценарии выбирают из post_ids — выборки id, которую команда
+берёт из базы (на главной нет ссылок на отдельные посты), а авторов —
+по ссылкам на странице поста. Вход выполняется один раз
+на виртуального пользователя под одной из учётных записей accounts.
+Все случайные выборы идут через rng — тот же генератор, что у LoadTest,
+чтобы прогон с --seed повторялся.
+"""
+import random
+import re
+from urllib.parse import urlsplit
+
+from django.urls import Resolver404, resolve, reverse
+
+PROFILE_LINK_RE = re.compile(r'href="/profile/([^/"]+)/"')
+
+# Вес сценария — его доля среди запускаемых
+JOURNEY_WEIGHTS = {
+    'browse_index': 40,
+    'open_post': 30,
+    'comment': 10,
+    'follow_author': 10,
+    'read_feed': 10,
+}
+
+
+def route_label(path):
+    """Метка запроса в отчёте — имя маршрута, а не конкретный адрес."""
+    try:
+        return resolve(urlsplit(path).path).view_name
+    except Resolver404:
+        return 'не найден'
+
+
+def parse_weights(text):
+    """'browse_index=5,comment=1' → {'browse_index': 5, 'comment': 1}."""
+    weights = {}
+    for item in filter(None, text.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in JOURNEY_WEIGHTS:
+            raise ValueError(f'Неизвестный сценарий {name}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Journeys:
+
+    def __init__(self, accounts, password, post_ids, rng=None):
+        self.accounts = accounts
+        self.password = password
+        self.post_ids = post_ids
+        self.random = rng or random.Random()
+
+    async def login(self, session):
+        if session.state.get('user'):
+            return
+        username = self.random.choice(self.accounts)
+        response = await session.submit(
+            reverse('users:login'),
+            {'username': username, 'password': self.password},
+        )
+        if response.status == 302:
+            session.state['user'] = username
+
+    async def _pick_post(self, session):
+        """Посетитель приходит на пост с главной."""
+        await session.get(reverse('posts:index'))
+        return self.random.choice(self.post_ids) if self.post_ids else None
+
+    async def browse_index(self, session):
+        await session.get(reverse('posts:index'))
+        await session.get(reverse('posts:index') + '?page=2')
+
+    async def open_post(self, session):
+        post_id = await self._pick_post(session)
+        if post_id:
+            await session.get(reverse('posts:post_detail', args=[post_id]))
+
+    async def comment(self, session):
+        await self.login(session)
+        post_id = await self._pick_post(session)
+        if post_id:
+            await session.submit(
+                reverse('posts:post_detail', args=[post_id]),
+                {'text': 'Комментарий нагрузочного теста'},
+                action=reverse('posts:add_comment', args=[post_id]),
+            )
+
+    async def follow_author(self, session):
+        await self.login(session)
+        post_id = await self._pick_post(session)
+        if not post_id:
+            return
+        page = await session.get(
+            reverse('posts:post_detail', args=[post_id])
+        )
+        usernames = PROFILE_LINK_RE.findall(page.text)
+        if usernames:
+            username = self.random.choice(usernames)
+            await session.get(reverse('posts:profile', args=[username]))
+            await session.get(
+                reverse('posts:profile_follow', args=[username])
+            )
+
+    async def read_feed(self, session):
+        await self.login(session)
+        await session.get(reverse('posts:follow_index'))
+        await session.get(reverse('posts:follow_unread'))
+
+    def weighted(self, weights=None):
+        """{имя: (сценарий, вес)} для core.loadtest.LoadTest."""
+        weights = weights or JOURNEY_WEIGHTS
+        return {
+            name: (getattr(self, name), weight)
+            for name, weight in weights.items() if weight > 0
+        }
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.archive import archive_old_posts
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые посты и их комментарии в архивные таблицы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Горизонт в днях (по умолчанию ARCHIVE_AFTER_DAYS).',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        moved = archive_old_posts(options['days'], options['batch_size'])
+        self.stdout.write(f'В архив перенесено постов: {moved}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.recommendations import build_follow_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации «на кого подписаться».'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать всех, а не только изменившихся '
+                 '(запускать периодически).',
+        )
+        parser.add_argument('--top-k', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        refreshed = build_follow_suggestions(
+            full=options['full'],
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'Обновлены рекомендации для {refreshed} польз.')
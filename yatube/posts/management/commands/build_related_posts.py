@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.related import build_related_posts
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие посты по TF-IDF.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все посты, а не только новые и изменённые.',
+        )
+        parser.add_argument('--top-k', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        refreshed = build_related_posts(
+            full=options['full'],
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'Обновлены похожие для {refreshed} постов')
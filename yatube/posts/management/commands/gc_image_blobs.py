@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import ArchivedPost, ImageBlob, Post
+from posts.storage import post_image_storage
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов, на которые больше никто не ссылается, '
+            'вместе с их миниатюрами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help='Не трогать файлы, загруженные за этот срок: на них '
+                 'может ещё не успеть сослаться пост.',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def _delete_rows(self, orphans, cutoff):
+        """Удаляет строки, которые так и не использовались с начала
+        прохода, и возвращает их: файл, загруженный заново после
+        выборки, остаётся вместе со строкой."""
+        ids = [blob_id for blob_id, _ in orphans]
+        ImageBlob.objects.filter(id__in=ids, last_used__lt=cutoff).delete()
+        kept = set(ImageBlob.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        return [
+            (blob_id, name) for blob_id, name in orphans
+            if blob_id not in kept
+        ]
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        blobs = ImageBlob.objects.filter(last_used__lt=cutoff).order_by('id')
+        last_id = 0
+        removed = 0
+        while True:
+            chunk = list(blobs.filter(id__gt=last_id).values_list(
+                'id', 'name'
+            )[:options['chunk_size']])
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            names = [name for _, name in chunk]
+            referenced = set(Post.objects.filter(
+                image__in=names
+            ).values_list('image', flat=True))
+            referenced.update(ArchivedPost.objects.filter(
+                image__in=names
+            ).values_list('image', flat=True))
+            orphans = [
+                (blob_id, name) for blob_id, name in chunk
+                if name not in referenced
+            ]
+            if not options['dry_run']:
+                orphans = self._delete_rows(orphans, cutoff)
+                for _, name in orphans:
+                    delete(ImageFile(name, storage=post_image_storage))
+            removed += len(orphans)
+        self.stdout.write(f'Неиспользуемых файлов: {removed}')
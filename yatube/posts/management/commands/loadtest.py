@@ -0,0 +1,111 @@
+import asyncio
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import LoadTest
+from posts.journeys import Journeys, parse_weights, route_label
+from posts.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает запущенный сервер сценариями посетителей и печатает '
+        'задержки и ошибки по маршрутам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес запущенного сервера.',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность в секундах.',
+        )
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='Число одновременных пользователей (замкнутый режим).',
+        )
+        parser.add_argument(
+            '--ramp-up', type=float, default=0,
+            help='За сколько секунд запустить всех пользователей.',
+        )
+        parser.add_argument(
+            '--rate', type=float,
+            help='Сценариев в секунду (открытый режим вместо --users).',
+        )
+        parser.add_argument(
+            '--max-active', type=int, default=1000,
+            help='Предел одновременных сценариев в открытом режиме.',
+        )
+        parser.add_argument(
+            '--think-time', type=float, default=1.0,
+            help='Средняя пауза между сценариями пользователя, с.',
+        )
+        parser.add_argument(
+            '--journeys', default='',
+            help='Веса сценариев: browse_index=4,comment=1.',
+        )
+        parser.add_argument(
+            '--accounts', type=int, default=10,
+            help='Сколько учётных записей loadtest<N> использовать.',
+        )
+        parser.add_argument(
+            '--password', default='loadtest-password',
+            help='Пароль учётных записей нагрузочного теста.',
+        )
+        parser.add_argument(
+            '--posts', type=int, default=100,
+            help='Из скольких последних постов выбирать открываемые.',
+        )
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int)
+
+    def _accounts(self, count, password):
+        usernames = [f'loadtest{number}' for number in range(count)]
+        for username in usernames:
+            user, created = User.objects.get_or_create(username=username)
+            if created:
+                user.set_password(password)
+                user.save(update_fields=['password'])
+        return usernames
+
+    def handle(self, *args, **options):
+        try:
+            weights = parse_weights(options['journeys'])
+        except ValueError as error:
+            raise CommandError(error)
+        rng = random.Random(options['seed'])
+        journeys = Journeys(
+            self._accounts(options['accounts'], options['password']),
+            options['password'],
+            list(Post.objects.order_by('-created').values_list(
+                'id', flat=True
+            )[:options['posts']]),
+            rng=rng,
+        )
+        load = LoadTest(
+            options['url'],
+            journeys.weighted(weights),
+            label=route_label,
+            think_time=options['think_time'],
+            timeout=options['timeout'],
+            rng=rng,
+        )
+        if options['rate']:
+            run = load.open(
+                options['rate'], options['duration'], options['max_active']
+            )
+        else:
+            run = load.closed(
+                options['users'], options['duration'], options['ramp_up']
+            )
+        stats = asyncio.run(run)
+        self.stdout.write(stats.report())
+        self.stdout.write('Сценарии: ' + ', '.join(
+            f'{name} {count}' for name, count in stats.journeys.items()
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные незавершённые загрузки картинок частями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=None,
+            help='Возраст загрузки; по умолчанию '
+                 'CHUNKED_UPLOAD_EXPIRE_HOURS.',
+        )
+
+    def handle(self, *args, **options):
+        removed = purge_stale_uploads(options['hours'])
+        self.stdout.write(f'Удалено загрузок: {removed}')
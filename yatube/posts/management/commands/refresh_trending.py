@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import refresh_trending_scores
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг постов для ленты «Популярное».'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все посты за окно, а не только изменившиеся.',
+        )
+
+    def handle(self, *args, **options):
+        refreshed = refresh_trending_scores(full=options['full'])
+        self.stdout.write(f'Пересчитан рейтинг {refreshed} постов.')
@@ -0,0 +1,59 @@
+import multiprocessing
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.markup import RENDERER_VERSION
+from posts.mentions import rerender_chunk
+
+MODELS = (
+    'posts.Post', 'posts.Comment', 'posts.ArchivedPost',
+    'posts.ArchivedComment',
+)
+
+
+def _run_chunk(job):
+    try:
+        return rerender_chunk(*job)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает HTML текстов постов и комментариев после '
+            'смены версии отрисовщика.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help='Сколько процессов запустить; 1 — без процессов.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def jobs(self, chunk_size):
+        for label in MODELS:
+            stale = apps.get_model(label).objects.filter(
+                html_version__lt=RENDERER_VERSION
+            ).order_by('id').values_list('id', flat=True)
+            last_id = None
+            while True:
+                page = stale if last_id is None else stale.filter(
+                    id__gt=last_id
+                )
+                ids = list(page[:chunk_size])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                yield label, ids
+
+    def handle(self, *args, **options):
+        jobs = list(self.jobs(options['chunk_size']))
+        if options['workers'] <= 1:
+            done = sum(rerender_chunk(*job) for job in jobs)
+        else:
+            # Дочерние процессы не должны делить соединения с родителем
+            connections.close_all()
+            with multiprocessing.Pool(options['workers']) as pool:
+                done = sum(pool.imap_unordered(_run_chunk, jobs))
+        self.stdout.write(f'Пересобрано текстов: {done}')
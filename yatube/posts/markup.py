@@ -0,0 +1,68 @@
+"""Разметка в тексте постов и комментариев: хештеги, упоминания
+пользователей и переносы строк.
+
+render_text превращает исходный текст в безопасный HTML; результат
+хранится рядом с текстом (text_html). Любое изменение того, что
+выдаёт render_text, требует увеличить RENDERER_VERSION — тогда
+старые записи пересоберёт команда rerender_html.
+"""
+import re
+
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+RENDERER_VERSION = 1
+
+TAG_MAX_LENGTH = 50
+TAG_RE = re.compile(r'(?<![\w#&])#(\w+)')
+# Точки и дефисы допустимы внутри имени, но не в конце: «@ivan.» — это
+# упоминание ivan в конце предложения
+MENTION_RE = re.compile(r'(?<![\w@.+-])@([\w.@+-]*\w)')
+MARKUP_RE = re.compile(f'{TAG_RE.pattern}|{MENTION_RE.pattern}')
+
+
+def _is_tag(name):
+    return len(name) <= TAG_MAX_LENGTH and not name.isdigit()
+
+
+def extract_tags(text):
+    """Множество хештегов текста в нижнем регистре; числа вроде «#1»
+    тегами не считаются."""
+    return {name.lower() for name in TAG_RE.findall(text) if _is_tag(name)}
+
+
+def extract_mentions(text):
+    return set(MENTION_RE.findall(text))
+
+
+def _escape(text):
+    return escape(text).replace('\n', '<br>')
+
+
+def _link(match, mention_urls):
+    tag, mention = match.groups()
+    if tag is not None and _is_tag(tag):
+        url = reverse('posts:tag_posts', args=[tag.lower()])
+        return format_html('<a href="{}">#{}</a>', url, tag)
+    if mention is not None and mention in mention_urls:
+        return format_html(
+            '<a href="{}">@{}</a>', mention_urls[mention], mention
+        )
+    return None
+
+
+def render_text(text, mention_urls):
+    """Экранирует text, заменяет переносы строк на <br> и превращает
+    хештеги и упоминания с адресом в словаре mention_urls в ссылки."""
+    parts = []
+    last = 0
+    for match in MARKUP_RE.finditer(text):
+        link = _link(match, mention_urls)
+        if link is None:
+            continue
+        parts.append(_escape(text[last:match.start()]))
+        parts.append(link)
+        last = match.end()
+    parts.append(_escape(text[last:]))
+    return mark_safe(''.join(parts))
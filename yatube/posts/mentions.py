@@ -0,0 +1,184 @@
+"""Упоминания @имя и готовый HTML текстов постов и комментариев.
+
+При сохранении (см. posts.signals) имена разрешаются в пользователей
+одним запросом, текст отрисовывается в text_html, а упоминания
+записываются связью mentions. Показ берёт text_html как есть. Только
+записи, собранные старой версией отрисовщика и ещё не пересобранные
+командой rerender_html, отрисовываются на лету: для всей страницы
+сразу, из кеша одним get_many, а для промахов — одним запросом
+к связям на модель. У архивных записей те же упоминания: строки
+PostMention и CommentMention остаются при архивировании по тем же id.
+
+Адрес профиля в text_html содержит имя, поэтому после смены имени
+задача rerender_mentions пересобирает записи, где упомянут
+пользователь. Упоминание хранит имя, как оно написано в тексте,
+так что прежнее @имя ведёт на новый адрес профиля.
+"""
+import hashlib
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from .markup import RENDERER_VERSION, extract_mentions, render_text
+
+User = get_user_model()
+
+
+# Модель упоминаний и поле со ссылкой на запись для каждой модели
+# с текстом; архивные записи ссылаются на упоминания по своему id
+MENTION_MODELS = {
+    'posts.post': ('posts.PostMention', 'post'),
+    'posts.archivedpost': ('posts.PostMention', 'post'),
+    'posts.comment': ('posts.CommentMention', 'comment'),
+    'posts.archivedcomment': ('posts.CommentMention', 'comment'),
+}
+
+
+def _relation_field(obj):
+    return obj.mentions.field.name
+
+
+def profile_urls(usernames):
+    return {
+        username: reverse('posts:profile', args=[username])
+        for username in usernames
+    }
+
+
+def render(obj):
+    """Собирает obj.text_html; упомянутых пользователей запоминает
+    для sync_mentions."""
+    names = extract_mentions(obj.text)
+    mentioned = dict(User.objects.filter(username__in=names).values_list(
+        'username', 'id'
+    )) if names else {}
+    obj.text_html = render_text(obj.text, profile_urls(mentioned))
+    obj.html_version = RENDERER_VERSION
+    obj._rendered_text = obj.text
+    obj._mentioned = {user_id: name for name, user_id in mentioned.items()}
+
+
+def sync_mentions(obj):
+    """Приводит связь mentions к упоминаниям, найденным render."""
+    current = set(obj.mentions.values_list('user_id', flat=True))
+    parsed = set(obj._mentioned)
+    if current - parsed:
+        obj.mentions.filter(user_id__in=current - parsed).delete()
+    if parsed - current:
+        field = _relation_field(obj)
+        obj.mentions.model.objects.bulk_create(
+            obj.mentions.model(**{
+                field: obj, 'user_id': user_id,
+                'name': obj._mentioned[user_id],
+            })
+            for user_id in parsed - current
+        )
+
+
+def _cache_key(obj):
+    digest = hashlib.md5(obj.text.encode()).hexdigest()
+    return (
+        f'rendered:{RENDERER_VERSION}:{obj._meta.label_lower}:'
+        f'{obj.pk}:{digest}'
+    )
+
+
+def load_mention_urls(objects):
+    """{(модель, pk): {имя: адрес профиля}} для постов и комментариев,
+    в том числе архивных, по запросу на модель."""
+    by_model = {}
+    for obj in objects:
+        if '@' in obj.text and obj._meta.label_lower in MENTION_MODELS:
+            by_model.setdefault(type(obj), []).append(obj)
+    urls = {}
+    for model, group in by_model.items():
+        label, field = MENTION_MODELS[model._meta.label_lower]
+        rows = apps.get_model(label).objects.filter(**{
+            f'{field}_id__in': [obj.pk for obj in group]
+        }).values_list(f'{field}_id', 'name', 'user__username')
+        for pk, name, username in rows:
+            urls.setdefault((model, pk), {})[name] = reverse(
+                'posts:profile', args=[username]
+            )
+    return urls
+
+
+def _render_stale(objects):
+    keys = [_cache_key(obj) for obj in objects]
+    cached = cache.get_many(keys)
+    missing = [obj for key, obj in zip(keys, objects) if key not in cached]
+    urls = load_mention_urls(missing)
+    fresh = {}
+    for key, obj in zip(keys, objects):
+        if key in cached:
+            obj.rendered_html = mark_safe(cached[key])
+            continue
+        obj.rendered_html = render_text(
+            obj.text, urls.get((type(obj), obj.pk), {})
+        )
+        fresh[key] = str(obj.rendered_html)
+    if fresh:
+        cache.set_many(fresh, settings.RENDERED_TEXT_CACHE_TIMEOUT)
+
+
+def attach_rendered_text(objects):
+    """Проставляет каждому объекту rendered_html — безопасный HTML
+    его текста."""
+    objects = list(objects)
+    stale = []
+    for obj in objects:
+        if obj.html_version == RENDERER_VERSION:
+            obj.rendered_html = mark_safe(obj.text_html)
+        else:
+            stale.append(obj)
+    if stale:
+        _render_stale(stale)
+    return objects
+
+
+def rerender_chunk(model_label, ids, force=False):
+    """Пересобирает text_html записей ids модели model_label; строки,
+    которые успели отрисоваться при правке, не трогает. Без force
+    пересобираются только записи старой версии отрисовщика. Возвращает
+    число обновлённых записей."""
+    model = apps.get_model(model_label)
+    objects = list(model.objects.filter(id__in=ids).only('id', 'text'))
+    urls = load_mention_urls(objects)
+    updated = 0
+    with transaction.atomic():
+        for obj in objects:
+            # С force отрисованной при правке считается запись с другим
+            # текстом
+            unchanged = (
+                {'text': obj.text} if force
+                else {'html_version__lt': RENDERER_VERSION}
+            )
+            updated += model.objects.filter(
+                id=obj.id, **unchanged
+            ).update(
+                text_html=render_text(
+                    obj.text, urls.get((model, obj.id), {})
+                ),
+                html_version=RENDERER_VERSION,
+            )
+    return updated
+
+
+def rerender_mentions(user_id, chunk_size=500):
+    """Пересобирает text_html всех записей, где упомянут пользователь
+    user_id, — после смены его имени. Возвращает число обновлённых."""
+    updated = 0
+    for model_label, (label, field) in MENTION_MODELS.items():
+        ids = list(apps.get_model(label).objects.filter(
+            user_id=user_id
+        ).order_by(f'{field}_id').values_list(f'{field}_id', flat=True))
+        for start in range(0, len(ids), chunk_size):
+            updated += rerender_chunk(
+                model_label, ids[start:start + chunk_size], force=True
+            )
+    return updated
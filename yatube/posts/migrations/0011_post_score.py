@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_follow_suggestions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='posts.Post', verbose_name='пост')),
+                ('score', models.FloatField(verbose_name='рейтинг')),
+                ('comments', models.PositiveIntegerField(default=0, verbose_name='комментарии')),
+                ('followers', models.PositiveIntegerField(default=0, verbose_name='подписчики автора')),
+                ('updated', models.DateTimeField(verbose_name='дата расчёта')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['-score', '-post'], name='posts_posts_score_765881_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0011_post_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowFeedState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='follow_feed_state', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='последний просмотр')),
+                ('unread', models.PositiveIntegerField(default=0, verbose_name='непрочитанные записи')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0017_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('token', models.UUIDField(default=uuid.uuid4, unique=True, verbose_name='токен')),
+                ('filename', models.CharField(max_length=255, verbose_name='имя файла')),
+                ('size', models.BigIntegerField(verbose_name='размер')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='получено байт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from posts.markup import extract_tags
+
+
+def fill_tags(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Tag = apps.get_model('posts', 'Tag')
+    PostTag = apps.get_model('posts', 'PostTag')
+    tags = {}
+    for post in Post.objects.only('id', 'text', 'created').iterator():
+        for name in extract_tags(post.text):
+            if name not in tags:
+                tags[name] = Tag.objects.create(name=name)
+            tag = tags[name]
+            PostTag.objects.create(post=post, tag=tag, created=post.created)
+            tag.post_count += 1
+    for tag in tags.values():
+        tag.save(update_fields=['post_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_post_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='название')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='постов')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(verbose_name='дата поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='posts.Post', verbose_name='пост')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='posts.Tag', verbose_name='тег')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(fields=['tag', '-created', '-post'], name='posts_postt_tag_id_2134c0_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('tag', 'post'), name='unique_post_tag'),
+        ),
+        migrations.RunPython(fill_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from posts.markup import extract_mentions
+
+
+def fill_mentions(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    for model_name, relation_name, field in (
+        ('Post', 'PostMention', 'post_id'),
+        ('Comment', 'CommentMention', 'comment_id'),
+    ):
+        model = apps.get_model('posts', model_name)
+        relation = apps.get_model('posts', relation_name)
+        rows = model.objects.filter(text__contains='@').values_list(
+            'id', 'text'
+        )
+        for obj_id, text in rows.iterator():
+            names = extract_mentions(text)
+            relation.objects.bulk_create(
+                relation(**{field: obj_id, 'user_id': user_id})
+                for user_id in User.objects.filter(
+                    username__in=names
+                ).values_list('id', flat=True)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0020_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostMention',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='posts.Post', verbose_name='пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_mentions', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CommentMention',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='posts.Comment', verbose_name='комментарий')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_mentions', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postmention',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='unique_post_mention'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentmention',
+            constraint=models.UniqueConstraint(fields=('comment', 'user'), name='unique_comment_mention'),
+        ),
+        migrations.RunPython(fill_mentions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-19 19:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0023_related_posts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkOperation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('action', models.CharField(choices=[('reassign', 'перенос в группу'), ('delete', 'удаление'), ('purge', 'удаление всего от авторов')], max_length=10, verbose_name='действие')),
+                ('query', models.BinaryField(verbose_name='запрос')),
+                ('params', models.TextField(default='{}', verbose_name='параметры (JSON)')),
+                ('status', models.CharField(choices=[('pending', 'в очереди'), ('running', 'выполняется'), ('done', 'завершена'), ('failed', 'ошибка')], default='pending', max_length=10, verbose_name='статус')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='всего')),
+                ('done', models.PositiveIntegerField(default=0, verbose_name='обработано')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='завершена')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bulk_operations', to=settings.AUTH_USER_MODEL, verbose_name='запустил')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
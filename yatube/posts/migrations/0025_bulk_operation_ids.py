@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-19 20:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_bulk_operations'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bulkoperation',
+            name='query',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-19 21:02
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def fill_feed_states(apps, schema_editor):
+    """Строки состояния ленты для подписок, созданных до 0012:
+    без них bump_unread_counts не считает непрочитанное."""
+    Follow = apps.get_model('posts', 'Follow')
+    FollowFeedState = apps.get_model('posts', 'FollowFeedState')
+    now = timezone.now()
+    FollowFeedState.objects.bulk_create(
+        (
+            FollowFeedState(user_id=user_id, last_seen=now, unread=0)
+            for user_id in Follow.objects.values_list(
+                'user_id', flat=True
+            ).distinct().order_by()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_bulk_operation_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feed_states, migrations.RunPython.noop),
+    ]
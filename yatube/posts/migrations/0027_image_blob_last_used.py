@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-19 20:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_created(apps, schema_editor):
+    ImageBlob = apps.get_model('posts', 'ImageBlob')
+    ImageBlob.objects.update(last_used=models.F('created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_fill_follow_feed_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='last_used',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='последнее использование'),
+        ),
+        migrations.RunPython(copy_created, migrations.RunPython.noop),
+    ]
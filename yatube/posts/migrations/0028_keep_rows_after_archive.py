@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-19 20:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_image_blob_last_used'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commentmention',
+            name='comment',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='mentions', to='posts.Comment', verbose_name='комментарий'),
+        ),
+        migrations.AlterField(
+            model_name='postmention',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='mentions', to='posts.Post', verbose_name='пост'),
+        ),
+        migrations.AlterField(
+            model_name='postrevision',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='revisions', to='posts.Post', verbose_name='пост'),
+        ),
+        migrations.AlterField(
+            model_name='postviewcount',
+            name='post',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='view_count', serialize=False, to='posts.Post', verbose_name='пост'),
+        ),
+        migrations.AlterField(
+            model_name='reaction',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='reactions', to='posts.Post', verbose_name='пост'),
+        ),
+        migrations.AlterField(
+            model_name='reactioncounter',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='reaction_counters', to='posts.Post', verbose_name='пост'),
+        ),
+    ]
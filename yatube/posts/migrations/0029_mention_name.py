@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-19 23:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_names(apps, schema_editor):
+    """До смены имён упоминания писались текущим именем
+    пользователя."""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for label in ('PostMention', 'CommentMention'):
+        apps.get_model('posts', label).objects.update(name=Subquery(
+            User.objects.filter(pk=OuterRef('user_id')).values('username')
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0028_keep_rows_after_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentmention',
+            name='name',
+            field=models.CharField(
+                default='', max_length=150, verbose_name='имя в тексте'
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='postmention',
+            name='name',
+            field=models.CharField(
+                default='', max_length=150, verbose_name='имя в тексте'
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_names, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,13 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils.timezone import now
 
 from core.models import CreatedModel
+from .markup import RENDERER_VERSION, TAG_MAX_LENGTH
+from .storage import post_image_storage
+from .threads import make_path
 
 User = get_user_model()
 
@@ -15,7 +21,33 @@ class Group(models.Model):
         return self.title
 
 
-class Post(CreatedModel):
+class RenderedTextModel(models.Model):
+    """Абстрактная модель: текст хранится вместе с готовым HTML
+    (см. posts.markup) и версией отрисовщика, которой он собран."""
+    text_html = models.TextField('HTML текста', blank=True, editable=False)
+    html_version = models.PositiveSmallIntegerField(
+        'версия отрисовки', default=0, editable=False
+    )
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rendered_text = instance.__dict__.get('text')
+        return instance
+
+    def needs_render(self):
+        """Нужно ли пересобрать HTML: текст изменился после загрузки
+        из базы или HTML собран старой версией отрисовщика."""
+        return (
+            self.html_version != RENDERER_VERSION
+            or getattr(self, '_rendered_text', None) != self.text
+        )
+
+
+class Post(RenderedTextModel, CreatedModel):
     text = models.TextField(verbose_name='текст')
     author = models.ForeignKey(
         User,
@@ -35,7 +67,10 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=post_image_storage,
+        blank=True,
+        # gc_image_blobs ищет ссылки на файлы по имени
+        db_index=True,
     )
     # Аргумент upload_to указывает директорию,
     # в которую будут загружаться пользовательские файлы.
@@ -47,7 +82,7 @@ class Post(CreatedModel):
         return self.text[:15]
 
 
-class Comment(CreatedModel):
+class Comment(RenderedTextModel, CreatedModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -61,6 +96,31 @@ class Comment(CreatedModel):
         verbose_name='комментарии автора'
     )
     text = models.TextField(verbose_name='текст комментария')
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True,
+        null=True,
+        verbose_name='ответ на комментарий'
+    )
+    # Материализованный путь ветки, см. posts.threads
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        ordering = ['path']
+        indexes = [models.Index(fields=['post', 'path'])]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.path:
+            parent_path = self.parent.path if self.parent else ''
+            self.path = make_path(self.id, parent_path)
+            self.depth = self.parent.depth + 1 if self.parent else 0
+            Comment.objects.filter(id=self.id).update(
+                path=self.path, depth=self.depth
+            )
 
 
 class Follow(models.Model):
@@ -76,3 +136,458 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='подписки',
     )
+
+
+class FollowSuggestion(models.Model):
+    """Рекомендация «на кого подписаться», рассчитанная офлайн
+    командой build_follow_suggestions."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follow_suggestions',
+        verbose_name='пользователь',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggested_to',
+        verbose_name='рекомендуемый автор',
+    )
+    score = models.FloatField('оценка')
+
+    class Meta:
+        ordering = ['-score']
+        indexes = [models.Index(fields=['user', '-score'])]
+
+
+class FollowSuggestionSignature(models.Model):
+    """Отпечаток набора подписок пользователя на момент расчёта
+    рекомендаций: по нему находим, кого нужно пересчитать."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    signature = models.BigIntegerField()
+
+
+class PostScore(models.Model):
+    """Предрассчитанный рейтинг поста для ленты «Популярное».
+
+    Обновляется командой refresh_trending; comments и followers
+    хранят входные данные последнего расчёта.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending_score',
+        verbose_name='пост',
+    )
+    score = models.FloatField('рейтинг')
+    comments = models.PositiveIntegerField('комментарии', default=0)
+    followers = models.PositiveIntegerField('подписчики автора', default=0)
+    updated = models.DateTimeField('дата расчёта')
+
+    class Meta:
+        indexes = [models.Index(fields=['-score', '-post'])]
+
+
+class FollowFeedState(models.Model):
+    """Когда пользователь последний раз открывал ленту подписок
+    и сколько записей там появилось с тех пор."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='follow_feed_state',
+        verbose_name='пользователь',
+    )
+    last_seen = models.DateTimeField('последний просмотр', default=now)
+    unread = models.PositiveIntegerField('непрочитанные записи', default=0)
+
+
+class ArchivedPost(RenderedTextModel):
+    """Пост старше ARCHIVE_AFTER_DAYS, перенесённый командой
+    archive_posts. Поля те же, что у Post, id сохраняется."""
+    id = models.IntegerField(primary_key=True)
+    created = models.DateTimeField('Дата создания')
+    text = models.TextField(verbose_name='текст')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts_by_user',
+        verbose_name='автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts_by_group',
+        blank=True,
+        null=True,
+        verbose_name='группа'
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        storage=post_image_storage,
+        blank=True,
+        # gc_image_blobs ищет ссылки на файлы по имени
+        db_index=True,
+    )
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [models.Index(fields=['author', '-created'])]
+
+    def __str__(self):
+        return self.text[:15]
+
+
+class ArchivedComment(RenderedTextModel):
+    """Комментарий к архивному посту."""
+    id = models.IntegerField(primary_key=True)
+    created = models.DateTimeField('Дата создания')
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments_by_post',
+        verbose_name='комментарии к посту'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments_by_author',
+        verbose_name='комментарии автора'
+    )
+    text = models.TextField(verbose_name='текст комментария')
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True,
+        null=True,
+        verbose_name='ответ на комментарий'
+    )
+    path = models.CharField(max_length=255, blank=True)
+    depth = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['path']
+        indexes = [models.Index(fields=['post', 'path'])]
+
+
+class Reaction(CreatedModel):
+    """Реакция пользователя на пост: не больше одной на пару
+    пользователь — пост."""
+    LIKE = 'like'
+    HEART = 'heart'
+    FIRE = 'fire'
+    KIND_CHOICES = (
+        (LIKE, '👍'),
+        (HEART, '❤️'),
+        (FIRE, '🔥'),
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='reactions',
+        verbose_name='пользователь',
+    )
+    post = models.ForeignKey(
+        Post,
+        # Строка переживает архивирование поста (posts.archive)
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='reactions',
+        verbose_name='пост',
+    )
+    kind = models.CharField('реакция', max_length=10, choices=KIND_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_user_post_reaction'
+            ),
+        ]
+
+
+class ReactionCounter(models.Model):
+    """Один из REACTION_SHARDS счётчиков реакций поста (в SQLite —
+    единственный). Запись попадает в случайный шард, итог — сумма
+    по шардам."""
+    post = models.ForeignKey(
+        Post,
+        # Строка переживает архивирование поста (posts.archive)
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='reaction_counters',
+        verbose_name='пост',
+    )
+    kind = models.CharField(
+        'реакция', max_length=10, choices=Reaction.KIND_CHOICES
+    )
+    shard = models.PositiveSmallIntegerField('шард')
+    count = models.IntegerField('количество', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'kind', 'shard'],
+                name='unique_reaction_counter_shard',
+            ),
+        ]
+
+
+class PostViewCount(models.Model):
+    """Число просмотров поста; пишется пачками из posts.view_counter."""
+    post = models.OneToOneField(
+        Post,
+        # Строка переживает архивирование поста (posts.archive)
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name='view_count',
+        verbose_name='пост',
+    )
+    views = models.BigIntegerField('просмотры', default=0)
+
+
+class ImageBlob(CreatedModel):
+    """Файл в контентно-адресуемом хранилище картинок постов.
+
+    last_used обновляется при каждой повторной загрузке тех же байтов:
+    gc_image_blobs отсчитывает срок от него, а не от created.
+    """
+    name = models.CharField('путь', max_length=255, unique=True)
+    digest = models.CharField('SHA-256', max_length=64, db_index=True)
+    size = models.BigIntegerField('размер')
+    last_used = models.DateTimeField(
+        'последнее использование', default=now, db_index=True
+    )
+
+    def __str__(self):
+        return self.name
+
+
+class ChunkedUpload(CreatedModel):
+    """Картинка, которая загружается частями (см. posts.uploads)."""
+    token = models.UUIDField('токен', unique=True, default=uuid.uuid4)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='chunked_uploads',
+        verbose_name='пользователь'
+    )
+    filename = models.CharField('имя файла', max_length=255)
+    size = models.BigIntegerField('размер')
+    offset = models.BigIntegerField('получено байт', default=0)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+
+class PostRevision(CreatedModel):
+    """Прежняя версия текста поста: целиком или разностью
+    с предыдущей (см. posts.revisions)."""
+    post = models.ForeignKey(
+        Post,
+        # Строка переживает архивирование поста (posts.archive)
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='revisions',
+        verbose_name='пост'
+    )
+    number = models.PositiveIntegerField('номер')
+    snapshot = models.BooleanField('полный текст', default=False)
+    data = models.TextField('данные')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'number'], name='unique_post_revision'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} #{self.number}'
+
+
+class Tag(models.Model):
+    """Хештег; post_count поддерживается при разборе постов."""
+    name = models.CharField(
+        'название', max_length=TAG_MAX_LENGTH, unique=True
+    )
+    post_count = models.PositiveIntegerField('постов', default=0)
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """Хештег в посте. Дата поста продублирована, чтобы лента тега
+    читалась одним проходом по индексу (tag, -created)."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+        verbose_name='пост'
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+        verbose_name='тег'
+    )
+    created = models.DateTimeField('дата поста')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tag', 'post'], name='unique_post_tag'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['tag', '-created', '-post']),
+        ]
+
+
+class PostMention(models.Model):
+    """Пользователь, упомянутый в посте через @имя."""
+    post = models.ForeignKey(
+        Post,
+        # Строка переживает архивирование поста (posts.archive)
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='mentions',
+        verbose_name='пост'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='post_mentions',
+        verbose_name='пользователь'
+    )
+    # Имя, как оно написано в тексте: после смены имени пользователя
+    # ссылка с прежнего @имени ведёт на новый адрес профиля
+    name = models.CharField('имя в тексте', max_length=150)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'user'], name='unique_post_mention'
+            ),
+        ]
+
+
+class CommentMention(models.Model):
+    """Пользователь, упомянутый в комментарии через @имя."""
+    comment = models.ForeignKey(
+        Comment,
+        # Строка переживает архивирование комментария (posts.archive)
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='mentions',
+        verbose_name='комментарий'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='comment_mentions',
+        verbose_name='пользователь'
+    )
+    # Имя, как оно написано в тексте: после смены имени пользователя
+    # ссылка с прежнего @имени ведёт на новый адрес профиля
+    name = models.CharField('имя в тексте', max_length=150)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['comment', 'user'], name='unique_comment_mention'
+            ),
+        ]
+
+
+class RelatedPost(models.Model):
+    """Похожий пост по TF-IDF (см. posts.related)."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='related_posts',
+        verbose_name='пост'
+    )
+    related = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='похожий пост'
+    )
+    score = models.FloatField('сходство')
+
+    class Meta:
+        indexes = [models.Index(fields=['post', '-score'])]
+
+
+class RelatedPostSignature(models.Model):
+    """Отпечаток текста и группы поста на момент расчёта похожих:
+    по нему следующий запуск находит новые и изменённые посты."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='related_signature',
+        verbose_name='пост',
+    )
+    signature = models.BigIntegerField('отпечаток')
+
+
+class BulkOperation(CreatedModel):
+    """Массовая операция над постами из админки (см. posts.bulk).
+
+    params — JSON с id выбранных постов (или авторов) и параметрами
+    действия; done и total показывают прогресс.
+    """
+    REASSIGN = 'reassign'
+    DELETE = 'delete'
+    PURGE = 'purge'
+    ACTION_CHOICES = (
+        (REASSIGN, 'перенос в группу'),
+        (DELETE, 'удаление'),
+        (PURGE, 'удаление всего от авторов'),
+    )
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (DONE, 'завершена'),
+        (FAILED, 'ошибка'),
+    )
+    action = models.CharField(
+        'действие', max_length=10, choices=ACTION_CHOICES
+    )
+    params = models.TextField('параметры (JSON)', default='{}')
+    status = models.CharField(
+        'статус', max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    total = models.PositiveIntegerField('всего', default=0)
+    done = models.PositiveIntegerField('обработано', default=0)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='bulk_operations',
+        verbose_name='запустил'
+    )
+    finished = models.DateTimeField('завершена', null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.get_action_display()} #{self.pk}'
@@ -0,0 +1,87 @@
+"""Реакции на посты и их счётчики.
+
+Сама реакция — отдельная запись, уникальная для пары пользователь —
+пост, так что повторное нажатие ничего не меняет. Итог хранится
+в ReactionCounter, чтобы страницы не считали реакции по строкам.
+
+Счётчик можно разбить на REACTION_SHARDS строк: изменение попадает
+в случайную, читается сумма. Это разводит записи только в базе
+с построчными блокировками (PostgreSQL). В SQLite запись блокирует
+всю базу, а вставка Reaction идёт в той же транзакции, так что шарды
+ничего не дают, и по умолчанию он один.
+"""
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Reaction, ReactionCounter
+
+
+def _bump(post_id, kind, delta):
+    shard = random.randrange(settings.REACTION_SHARDS)
+    counters = ReactionCounter.objects.filter(
+        post_id=post_id, kind=kind, shard=shard
+    )
+    if counters.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            ReactionCounter.objects.create(
+                post_id=post_id, kind=kind, shard=shard, count=delta
+            )
+    except IntegrityError:
+        # Шард успели создать параллельно
+        counters.update(count=F('count') + delta)
+
+
+def react(user, post, kind):
+    """Ставит реакцию kind; повторный вызов с тем же kind — no-op."""
+    with transaction.atomic():
+        current = Reaction.objects.select_for_update().filter(
+            user=user, post=post
+        ).first()
+        if current is not None and current.kind == kind:
+            return
+        if current is None:
+            try:
+                with transaction.atomic():
+                    Reaction.objects.create(user=user, post=post, kind=kind)
+            except IntegrityError:
+                return
+        else:
+            _bump(post.id, current.kind, -1)
+            current.kind = kind
+            current.save(update_fields=['kind'])
+        _bump(post.id, kind, 1)
+
+
+def unreact(user, post):
+    with transaction.atomic():
+        current = Reaction.objects.select_for_update().filter(
+            user=user, post=post
+        ).first()
+        if current is None:
+            return
+        current.delete()
+        _bump(post.id, current.kind, -1)
+
+
+def attach_reaction_totals(posts):
+    """Проставляет каждому посту reaction_totals — список
+    (реакция, значок, количество) — одним запросом на всю страницу."""
+    posts = list(posts)
+    totals = {}
+    rows = ReactionCounter.objects.filter(
+        post_id__in=[post.id for post in posts]
+    ).values_list('post_id', 'kind').annotate(total=Sum('count')).order_by()
+    for post_id, kind, total in rows:
+        totals[post_id, kind] = total
+    for post in posts:
+        post.reaction_totals = [
+            (kind, label, totals[post.id, kind])
+            for kind, label in Reaction.KIND_CHOICES
+            if totals.get((post.id, kind))
+        ]
+    return posts
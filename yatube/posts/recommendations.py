@@ -0,0 +1,225 @@
+"""Офлайн-расчёт рекомендаций «на кого подписаться» по графу Follow.
+
+Граф целиком загружается в компактные массивы CSR (по 8 байт на ребро
+в каждом направлении), затем для каждого пользователя считаются:
+
+* друзья друзей — авторы, на которых подписаны мои авторы;
+* совместные подписки — авторы, на которых подписаны пользователи
+  с похожим набором подписок.
+
+Уже известные авторы и сам пользователь из кандидатов исключаются.
+"""
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from core.sparse import build_csr, gather_rows, row_slice
+from .models import Follow, FollowSuggestion, FollowSuggestionSignature
+
+LOAD_CHUNK = 100_000
+# Нечётная 64-битная константа для хеширования id в отпечатке подписок
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def load_follow_edges(chunk_size=LOAD_CHUNK):
+    """Читает таблицу подписок частями в массив пар (user_id, author_id)
+    без дублей и подписок на самого себя."""
+    rows = Follow.objects.order_by().values_list(
+        'user_id', 'author_id'
+    ).iterator(chunk_size=chunk_size)
+    parts = []
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        parts.append(np.array(chunk, dtype=np.int64))
+    if not parts:
+        return np.empty((0, 2), dtype=np.int64)
+    edges = np.unique(np.concatenate(parts), axis=0)
+    return edges[edges[:, 0] != edges[:, 1]]
+
+
+class FollowGraph:
+    """Граф подписок: пользователи пронумерованы подряд, self.ids
+    переводит номер обратно в id."""
+
+    def __init__(self, edges):
+        self.ids, inverse = np.unique(edges.ravel(), return_inverse=True)
+        inverse = inverse.reshape(-1, 2)
+        size = len(self.ids)
+        users, authors = inverse[:, 0], inverse[:, 1]
+        self.follows_ptr, self.follows, _ = build_csr(users, authors, size)
+        self.followers_ptr, self.followers, _ = build_csr(
+            authors, users, size
+        )
+        self.degrees = np.diff(self.follows_ptr)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def has_follows(self):
+        return self.degrees > 0
+
+    def signatures(self):
+        """Отпечаток набора подписок каждого пользователя: сумма хешей
+        id авторов по модулю 2**64, смешанная с их количеством."""
+        hashed = self.ids[self.follows].astype(np.uint64) * HASH_MULTIPLIER
+        cumulative = np.zeros(len(hashed) + 1, dtype=np.uint64)
+        np.cumsum(hashed, out=cumulative[1:])
+        sums = (
+            cumulative[self.follows_ptr[1:]]
+            - cumulative[self.follows_ptr[:-1]]
+        )
+        lengths = self.degrees.astype(np.uint64)
+        return (sums ^ lengths).view(np.int64)
+
+    def authors_of(self, nodes):
+        return gather_rows(self.follows_ptr, self.follows, nodes)
+
+    def followers_of(self, nodes):
+        return gather_rows(self.followers_ptr, self.followers, nodes)
+
+    def suggest(self, node, top_k, co_follow_weight, fanout):
+        """Возвращает (id авторов, оценки) лучших кандидатов для node."""
+        followed = row_slice(self.follows_ptr, self.follows, node)
+        # Друзья друзей: каждый путь node -> v -> w даёт w единицу
+        candidates = [gather_rows(self.follows_ptr, self.follows, followed)]
+        weights = [np.ones(len(candidates[0]))]
+        # Похожие пользователи: сколько у них общих авторов с node
+        similar = gather_rows(
+            self.followers_ptr, self.followers, followed, limit=fanout
+        )
+        similar, shared = np.unique(
+            similar[similar != node], return_counts=True
+        )
+        if len(similar) > fanout:
+            keep = np.argpartition(-shared, fanout)[:fanout]
+            similar, shared = similar[keep], shared[keep]
+        candidates.append(
+            gather_rows(self.follows_ptr, self.follows, similar)
+        )
+        weights.append(
+            co_follow_weight * np.repeat(shared, self.degrees[similar])
+        )
+        candidates = np.concatenate(candidates)
+        weights = np.concatenate(weights)
+        allowed = (candidates != node) & ~np.isin(candidates, followed)
+        candidates, inverse = np.unique(
+            candidates[allowed], return_inverse=True
+        )
+        scores = np.bincount(inverse, weights=weights[allowed])
+        if len(candidates) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            candidates, scores = candidates[best], scores[best]
+        return self.ids[candidates], scores
+
+
+def _stored_signatures(graph):
+    """Сохранённые отпечатки, разложенные по номерам вершин графа,
+    и id пользователей, которых в графе больше нет."""
+    stored = np.array(
+        FollowSuggestionSignature.objects.values_list('user_id', 'signature'),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    signatures = np.zeros(len(graph), dtype=np.int64)
+    known = np.zeros(len(graph), dtype=bool)
+    positions = np.searchsorted(graph.ids, stored[:, 0])
+    positions = np.minimum(positions, max(len(graph) - 1, 0))
+    in_graph = (
+        graph.ids[positions] == stored[:, 0]
+        if len(graph) else np.zeros(len(stored), dtype=bool)
+    )
+    signatures[positions[in_graph]] = stored[in_graph, 1]
+    known[positions[in_graph]] = True
+    return signatures, known, stored[~in_graph, 0]
+
+
+def _dirty_nodes(graph, current, full):
+    """Вершины, для которых рекомендации нужно пересчитать, и id
+    пользователей, чьи рекомендации нужно просто удалить."""
+    active = graph.has_follows()
+    stored, known, gone = _stored_signatures(graph)
+    if full:
+        dirty = active
+    else:
+        # Для тех, кого ещё не считали, важны только активные
+        changed = np.flatnonzero(np.where(known, stored != current, active))
+        # Изменились подписки автора — изменились «друзья друзей»
+        # у всех его подписчиков, а у тех, кто делит с ним авторов, —
+        # совместные подписки
+        dirty = np.zeros(len(graph), dtype=bool)
+        dirty[changed] = True
+        dirty[graph.followers_of(changed)] = True
+        dirty[graph.followers_of(graph.authors_of(changed))] = True
+        dirty &= active
+    gone = np.concatenate([gone, graph.ids[known & ~active]])
+    return np.flatnonzero(dirty), gone
+
+
+def _save_batch(graph, nodes, signatures, options):
+    user_ids = [int(user_id) for user_id in graph.ids[nodes]]
+    suggestions = []
+    for node, user_id in zip(nodes, user_ids):
+        authors, scores = graph.suggest(node, *options)
+        suggestions.extend(
+            FollowSuggestion(
+                user_id=user_id, author_id=int(author), score=float(score)
+            )
+            for author, score in zip(authors, scores)
+        )
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=user_ids).delete()
+        FollowSuggestion.objects.bulk_create(suggestions)
+        FollowSuggestionSignature.objects.filter(
+            user_id__in=user_ids
+        ).delete()
+        FollowSuggestionSignature.objects.bulk_create(
+            FollowSuggestionSignature(
+                user_id=user_id, signature=int(signature)
+            )
+            for user_id, signature in zip(user_ids, signatures[nodes])
+        )
+
+
+def build_follow_suggestions(full=False, top_k=None, batch_size=500):
+    """Пересчитывает рекомендации и возвращает число обновлённых
+    пользователей.
+
+    Без full пересчитываются только пользователи, чьи подписки
+    изменились с прошлого запуска, их подписчики и подписчики их
+    авторов. Отписка от автора, который больше не общий, так не
+    находится: у бывших соседей по этому автору рекомендации
+    останутся старыми до запуска с full, поэтому его стоит
+    периодически выполнять (например, раз в сутки).
+    """
+    options = (
+        top_k or settings.FOLLOW_SUGGESTIONS_TOP_K,
+        settings.FOLLOW_SUGGESTIONS_CO_FOLLOW_WEIGHT,
+        settings.FOLLOW_SUGGESTIONS_FANOUT,
+    )
+    graph = FollowGraph(load_follow_edges())
+    signatures = graph.signatures()
+    dirty, gone = _dirty_nodes(graph, signatures, full)
+    for start in range(0, len(gone), batch_size):
+        user_ids = [int(user_id) for user_id in gone[start:start + batch_size]]
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(user_id__in=user_ids).delete()
+            FollowSuggestionSignature.objects.filter(
+                user_id__in=user_ids
+            ).delete()
+    for start in range(0, len(dirty), batch_size):
+        _save_batch(
+            graph, dirty[start:start + batch_size], signatures, options
+        )
+    return len(dirty)
+
+
+def get_follow_suggestions(user):
+    """Готовые рекомендации для пользователя: одно чтение по индексу."""
+    if not user.is_authenticated:
+        return FollowSuggestion.objects.none()
+    return FollowSuggestion.objects.filter(user=user).exclude(
+        author__following__user=user
+    ).select_related('author')[:settings.FOLLOW_SUGGESTIONS_SHOWN]
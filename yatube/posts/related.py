@@ -0,0 +1,245 @@
+"""Офлайн-расчёт похожих постов по TF-IDF.
+
+Тексты всех постов переводятся в разреженные векторы TF-IDF
+(core.sparse): вес слова — (1 + log tf) * idf, вектор нормирован.
+Группа поста добавляется отдельным признаком, так что у постов
+одной группы косинусное сходство выше на долю
+RELATED_POSTS_GROUP_WEIGHT. Сходство поста со всеми остальными
+считается через обратный индекс «слово → посты», поэтому
+просматриваются только посты с общими словами.
+
+Для каждого поста хранится RELATED_POSTS_TOP_K лучших. Каждый запуск —
+это полная перестройка индекса: все тексты читаются и разбираются
+заново, весь корпус держится в памяти. Выборочна только запись:
+обычный запуск переписывает списки новых и изменённых постов (их
+находят по отпечатку текста и группы), списки, куда они теперь
+проходят по сходству, и списки, где они уже были. Сдвиг idf от новых
+постов остальные списки не пересчитывает — это делает запуск с full.
+"""
+import hashlib
+import re
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+
+from core.sparse import build_csr, gather_offsets
+from .models import Post, RelatedPost, RelatedPostSignature
+
+LOAD_CHUNK = 10_000
+OWNERS_CHUNK = 500
+TOKEN_RE = re.compile(r'\w{3,}')
+
+
+def tokenize(text):
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if not token.isdigit()
+    ]
+
+
+def signature(text, group_id):
+    digest = hashlib.blake2b(
+        f'{group_id}:{text}'.encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def load_posts(chunk_size=LOAD_CHUNK):
+    """Читает все посты частями: (id, токены, группа или -1,
+    отпечаток). Корпус целиком остаётся в памяти и разбирается заново
+    при каждом запуске."""
+    rows = Post.objects.order_by('id').values_list(
+        'id', 'text', 'group_id'
+    ).iterator(chunk_size=chunk_size)
+    ids, documents, groups, signatures = [], [], [], []
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for post_id, text, group_id in chunk:
+            ids.append(post_id)
+            documents.append(tokenize(text))
+            groups.append(-1 if group_id is None else group_id)
+            signatures.append(signature(text, group_id))
+    return (
+        np.array(ids, dtype=np.int64),
+        documents,
+        np.array(groups, dtype=np.int64),
+        np.array(signatures, dtype=np.int64),
+    )
+
+
+def _term_pairs(documents):
+    """Пары (номер поста, номер слова) для каждого вхождения слова."""
+    vocabulary = {}
+    rows, cols = [], []
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+            rows.append(row)
+    return (
+        np.array(rows, dtype=np.int64),
+        np.array(cols, dtype=np.int64),
+        len(vocabulary),
+    )
+
+
+class TfIdfIndex:
+    """Векторы постов (CSR «пост → признаки») и обратный индекс
+    (CSR «признак → посты») с одинаковыми весами."""
+
+    def __init__(self, documents, groups, group_weight, max_df):
+        size = len(documents)
+        rows, cols, n_terms = _term_pairs(documents)
+        pairs, counts = np.unique(rows * n_terms + cols, return_counts=True)
+        rows, cols = pairs // max(n_terms, 1), pairs % max(n_terms, 1)
+        df = np.bincount(cols, minlength=n_terms)
+        idf = np.log((1 + size) / (1 + df)) + 1
+        keep = df[cols] <= max_df * size
+        rows, cols = rows[keep], cols[keep]
+        weights = (1 + np.log(counts[keep])) * idf[cols]
+        norms = np.sqrt(
+            np.bincount(rows, weights=weights ** 2, minlength=size)
+        )
+        weights = weights / norms[rows]
+        # Признак группы: после общей нормировки он даёт постам одной
+        # группы долю group_weight в сходстве
+        grouped = np.flatnonzero(groups >= 0)
+        group_values, group_cols = np.unique(
+            groups[grouped], return_inverse=True
+        )
+        text_scale = np.where(
+            groups[rows] >= 0, np.sqrt(1 - group_weight), 1
+        )
+        group_scale = np.where(
+            norms[grouped] > 0, np.sqrt(group_weight), 1
+        )
+        rows = np.concatenate([rows, grouped])
+        cols = np.concatenate([cols, n_terms + group_cols])
+        weights = np.concatenate([weights * text_scale, group_scale])
+        n_features = n_terms + len(group_values)
+        self.ptr, self.features, self.weights = build_csr(
+            rows, cols, size, weights
+        )
+        self.inverted_ptr, self.posts, self.inverted_weights = build_csr(
+            cols, rows, n_features, weights
+        )
+
+    def scores(self, node):
+        """(номера постов, сходство) для всех постов с общими
+        признаками, кроме самого node."""
+        start, stop = self.ptr[node], self.ptr[node + 1]
+        features = self.features[start:stop]
+        offsets = gather_offsets(self.inverted_ptr, features)
+        lengths = np.diff(self.inverted_ptr)[features]
+        candidates = self.posts[offsets]
+        products = self.inverted_weights[offsets] * np.repeat(
+            self.weights[start:stop], lengths
+        )
+        candidates, inverse = np.unique(candidates, return_inverse=True)
+        totals = np.bincount(inverse, weights=products)
+        other = candidates != node
+        return candidates[other], totals[other]
+
+
+def _top(candidates, scores, top_k):
+    if len(candidates) > top_k:
+        best = np.argpartition(-scores, top_k)[:top_k]
+        candidates, scores = candidates[best], scores[best]
+    return candidates, scores
+
+
+def _thresholds(ids, top_k):
+    """Наименьшее хранимое сходство для постов с полным списком;
+    для остальных в список попадёт любой похожий пост."""
+    thresholds = np.zeros(len(ids))
+    rows = RelatedPost.objects.values('post_id').annotate(
+        lowest=Min('score'), total=Count('id')
+    ).order_by().values_list('post_id', 'lowest', 'total')
+    for post_id, lowest, total in rows:
+        position = np.searchsorted(ids, post_id)
+        if total >= top_k and position < len(ids):
+            thresholds[position] = lowest
+    return thresholds
+
+
+def _dirty_nodes(ids, signatures, index, top_k, full):
+    if full:
+        return np.arange(len(ids))
+    stored = dict(RelatedPostSignature.objects.values_list(
+        'post_id', 'signature'
+    ))
+    changed = np.array([
+        stored.get(int(post_id)) != int(current)
+        for post_id, current in zip(ids, signatures)
+    ], dtype=bool)
+    dirty = changed.copy()
+    thresholds = _thresholds(ids, top_k)
+    for node in np.flatnonzero(changed):
+        candidates, scores = index.scores(node)
+        # Сходство симметрично: новый пост попадает в список старого,
+        # если похож на него сильнее худшего из сохранённых
+        dirty[candidates[scores > thresholds[candidates]]] = True
+    # Изменённый пост мог перестать быть похожим на те посты,
+    # в чьих списках он уже есть
+    changed_ids = [int(post_id) for post_id in ids[changed]]
+    owners = []
+    for start in range(0, len(changed_ids), OWNERS_CHUNK):
+        owners.extend(RelatedPost.objects.filter(
+            related_id__in=changed_ids[start:start + OWNERS_CHUNK]
+        ).values_list('post_id', flat=True))
+    owners = np.unique(np.array(owners, dtype=np.int64))
+    positions = np.minimum(np.searchsorted(ids, owners), len(ids) - 1)
+    dirty[positions[ids[positions] == owners]] = True
+    return np.flatnonzero(dirty)
+
+
+def _save_batch(ids, nodes, index, signatures, top_k):
+    post_ids = [int(post_id) for post_id in ids[nodes]]
+    related = []
+    for node, post_id in zip(nodes, post_ids):
+        candidates, scores = _top(*index.scores(node), top_k)
+        related.extend(
+            RelatedPost(
+                post_id=post_id,
+                related_id=int(ids[candidate]),
+                score=float(score),
+            )
+            for candidate, score in zip(candidates, scores)
+        )
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=post_ids).delete()
+        RelatedPost.objects.bulk_create(related)
+        RelatedPostSignature.objects.filter(post_id__in=post_ids).delete()
+        RelatedPostSignature.objects.bulk_create(
+            RelatedPostSignature(post_id=post_id, signature=int(value))
+            for post_id, value in zip(post_ids, signatures[nodes])
+        )
+
+
+def build_related_posts(full=False, top_k=None, batch_size=500):
+    """Пересчитывает похожие посты и возвращает число обновлённых."""
+    top_k = top_k or settings.RELATED_POSTS_TOP_K
+    ids, documents, groups, signatures = load_posts()
+    index = TfIdfIndex(
+        documents,
+        groups,
+        settings.RELATED_POSTS_GROUP_WEIGHT,
+        settings.RELATED_POSTS_MAX_DF,
+    )
+    dirty = _dirty_nodes(ids, signatures, index, top_k, full)
+    for start in range(0, len(dirty), batch_size):
+        _save_batch(
+            ids, dirty[start:start + batch_size], index, signatures, top_k
+        )
+    return len(dirty)
+
+
+def get_related_posts(post):
+    """Готовый список похожих постов: одно чтение по индексу."""
+    return post.related_posts.select_related(
+        'related__author'
+    ).order_by('-score')[:settings.RELATED_POSTS_SHOWN]
@@ -0,0 +1,116 @@
+"""История правок поста.
+
+Версии нумеруются с единицы: первая — исходный текст, последняя
+совпадает с Post.text, так что чтение текущего текста ничего
+не стоит. Версия хранится разностью с предыдущей: JSON-список, где
+неотрицательное число — сколько символов взять из прежнего текста,
+отрицательное — сколько пропустить, строка — вставка. Каждая
+REVISIONS_SNAPSHOT_EVERY-я версия (и любая, чья разность не короче
+самого текста) хранится целиком, поэтому для сборки любой версии
+достаточно одного запроса на REVISIONS_SNAPSHOT_EVERY строк.
+Хранится не больше REVISIONS_KEEP последних версий. Сравнение текстов
+квадратично по длине, поэтому правки текстов длиннее
+REVISIONS_DELTA_MAX_LENGTH символов тоже хранятся целиком.
+"""
+import json
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import PostRevision
+
+
+def make_delta(old, new):
+    ops = []
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(new[j1:j2])
+    return json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+
+
+def apply_delta(old, delta):
+    parts = []
+    position = 0
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        elif op >= 0:
+            parts.append(old[position:position + op])
+            position += op
+        else:
+            position -= op
+    return ''.join(parts)
+
+
+def _rebuild(revisions):
+    """Собирает текст последней из revisions, упорядоченных по номеру
+    по убыванию; среди них должен быть полный текст."""
+    chain = []
+    for revision in revisions:
+        chain.append(revision)
+        if revision.snapshot:
+            break
+    text = chain.pop().data
+    for revision in reversed(chain):
+        text = apply_delta(text, revision.data)
+    return text
+
+
+def revision_text(post, number):
+    """Текст версии number или None, если такой версии нет; post может
+    быть и архивным."""
+    revisions = list(
+        PostRevision.objects.filter(post_id=post.id, number__lte=number)
+        .order_by('-number')[:settings.REVISIONS_SNAPSHOT_EVERY]
+    )
+    if not revisions or revisions[0].number != number:
+        return None
+    return _rebuild(revisions)
+
+
+def _prune(post, latest):
+    first_kept = latest - settings.REVISIONS_KEEP + 1
+    if first_kept <= 1:
+        return
+    first = post.revisions.filter(number=first_kept).first()
+    if first is not None and not first.snapshot:
+        first.data = revision_text(post, first_kept)
+        first.snapshot = True
+        first.save(update_fields=['data', 'snapshot'])
+    post.revisions.filter(number__lt=first_kept).delete()
+
+
+@transaction.atomic
+def record_edit(post, old_text):
+    """Записывает правку поста, чей текст до правки был old_text."""
+    if post.text == old_text:
+        return None
+    # Параллельная правка ждёт, пока эта не запишет свою версию
+    last = post.revisions.select_for_update().order_by('-number').first()
+    if last is None:
+        last = PostRevision.objects.create(
+            post=post, number=1, snapshot=True, data=old_text
+        )
+    number = last.number + 1
+    snapshot = (number - 1) % settings.REVISIONS_SNAPSHOT_EVERY == 0
+    data = post.text
+    if max(len(old_text), len(post.text)) > (
+            settings.REVISIONS_DELTA_MAX_LENGTH):
+        snapshot = True
+    if not snapshot:
+        delta = make_delta(old_text, post.text)
+        snapshot = len(delta) >= len(post.text)
+        if not snapshot:
+            data = delta
+    revision = PostRevision.objects.create(
+        post=post, number=number, snapshot=snapshot, data=data
+    )
+    _prune(post, number)
+    return revision
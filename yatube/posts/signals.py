@@ -0,0 +1,108 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from core.tasks import enqueue
+
+from .autocomplete import (GROUP, USER, group_entries, prefix_index,
+                           user_entries)
+from .bulk import delete_kept
+from .mentions import render, sync_mentions
+from .models import ArchivedComment, ArchivedPost, Comment, Group, Post
+from .tags import release_tags, sync_tags
+from .tasks import rerender_user_mentions
+
+User = get_user_model()
+
+NAME_FIELDS = {'username', 'first_name', 'last_name', 'is_active'}
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def render_markup(sender, instance, update_fields=None, **kwargs):
+    instance._markup_changed = (
+        (update_fields is None or 'text' in update_fields)
+        and instance.needs_render()
+    )
+    if instance._markup_changed:
+        render(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post_markup(sender, instance, **kwargs):
+    if instance._markup_changed:
+        sync_tags(instance)
+        sync_mentions(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def release_post_tags(sender, instance, **kwargs):
+    release_tags([instance.id])
+
+
+@receiver(pre_delete, sender=Post)
+@receiver(pre_delete, sender=ArchivedPost)
+def delete_post_rows(sender, instance, **kwargs):
+    delete_kept(Post, [instance.id])
+
+
+@receiver(pre_delete, sender=Comment)
+@receiver(pre_delete, sender=ArchivedComment)
+def delete_comment_rows(sender, instance, **kwargs):
+    delete_kept(Comment, [instance.id])
+
+
+@receiver(post_save, sender=Comment)
+def index_comment_markup(sender, instance, **kwargs):
+    if instance._markup_changed:
+        sync_mentions(instance)
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    instance._old_username = None
+    if instance.pk is None or (
+            update_fields is not None and 'username' not in update_fields):
+        return
+    instance._old_username = User.objects.filter(
+        pk=instance.pk
+    ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def rerender_renamed_mentions(sender, instance, **kwargs):
+    old = getattr(instance, '_old_username', None)
+    if old is not None and old != instance.username:
+        enqueue(
+            rerender_user_mentions, instance.id,
+            dedup_key=f'mentions:{instance.id}',
+        )
+
+
+@receiver(post_save, sender=User)
+def index_user_name(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login — имена не менялись
+    if update_fields is not None and not NAME_FIELDS & set(update_fields):
+        return
+    entries = user_entries(
+        instance.id, instance.username, instance.first_name,
+        instance.last_name,
+    ) if instance.is_active else []
+    prefix_index.update(USER, instance.id, entries)
+
+
+@receiver(post_save, sender=Group)
+def index_group_title(sender, instance, **kwargs):
+    prefix_index.update(
+        GROUP,
+        instance.id,
+        group_entries(instance.id, instance.slug, instance.title),
+    )
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def unindex_name(sender, instance, **kwargs):
+    kind = USER if sender is User else GROUP
+    prefix_index.update(kind, instance.id, [])
@@ -0,0 +1,61 @@
+"""Хештеги в тексте постов.
+
+Разбор идёт при каждом сохранении поста (см. posts.signals):
+найденные теги сравниваются с уже записанными, и в базе меняются
+только добавленные и удалённые, вместе со счётчиками Tag.post_count.
+Удаление поста снимает его теги там же, массовые удаления и архив
+снимают их сами пачкой.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from .markup import extract_tags
+from .models import PostTag, Tag
+
+
+def _get_or_create_tags(names):
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in names], ignore_conflicts=True
+    )
+    return list(Tag.objects.filter(name__in=names))
+
+
+@transaction.atomic
+def sync_tags(post):
+    """Приводит теги поста в базе к тегам в его тексте."""
+    current = dict(
+        post.post_tags.values_list('tag__name', 'tag_id')
+    )
+    parsed = extract_tags(post.text)
+    added = parsed - current.keys()
+    removed = [current[name] for name in current.keys() - parsed]
+    if removed:
+        post.post_tags.filter(tag_id__in=removed).delete()
+        Tag.objects.filter(id__in=removed).update(
+            post_count=F('post_count') - 1
+        )
+    if added:
+        tags = _get_or_create_tags(added)
+        PostTag.objects.bulk_create(
+            PostTag(post=post, tag=tag, created=post.created)
+            for tag in tags
+        )
+        Tag.objects.filter(id__in=[tag.id for tag in tags]).update(
+            post_count=F('post_count') + 1
+        )
+
+
+def release_tags(post_ids):
+    """Снимает теги с постов перед их удалением, уменьшая счётчики
+    одним запросом на тег."""
+    post_tags = PostTag.objects.filter(post_id__in=post_ids)
+    counts = post_tags.values('tag_id').annotate(
+        posts=Count('id')
+    ).order_by()
+    if not counts:
+        return
+    for row in counts:
+        Tag.objects.filter(id=row['tag_id']).update(
+            post_count=F('post_count') - row['posts']
+        )
+    post_tags.delete()
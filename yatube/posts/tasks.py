@@ -0,0 +1,46 @@
+from django.db.models import F
+from sorl.thumbnail import get_thumbnail
+
+from core.tasks import task
+from .bulk import run_operation
+from .mentions import rerender_mentions
+from .models import BulkOperation, FollowFeedState, Post
+
+# Те же параметры, что и в шаблонах лент
+FEED_THUMBNAIL = ('960x339', {'crop': 'center', 'upscale': True})
+
+
+@task
+def warm_thumbnails(post_id):
+    """Заранее строит миниатюру картинки поста, чтобы её не строил
+    первый зашедший на главную."""
+    post = Post.objects.filter(id=post_id).first()
+    if post is None or not post.image:
+        return
+    geometry, options = FEED_THUMBNAIL
+    get_thumbnail(post.image, geometry, **options)
+
+
+@task
+def bump_unread_counts(author_id):
+    """Увеличивает счётчик непрочитанного у подписчиков автора
+    одним UPDATE."""
+    FollowFeedState.objects.filter(
+        user__follower__author_id=author_id
+    ).update(unread=F('unread') + 1)
+
+
+@task(max_attempts=1)
+def run_bulk_operation(operation_id):
+    """Массовая операция из админки; повторно не запускается, чтобы
+    не применять половину операции дважды."""
+    operation = BulkOperation.objects.filter(id=operation_id).first()
+    if operation is not None and operation.status == BulkOperation.PENDING:
+        run_operation(operation)
+
+
+@task
+def rerender_user_mentions(user_id):
+    """Пересобирает тексты с упоминанием пользователя после смены
+    его имени: в ссылке на профиль старое имя."""
+    rerender_mentions(user_id)
@@ -0,0 +1,22 @@
+from django import template
+
+from posts.mentions import attach_rendered_text
+
+register = template.Library()
+
+
+@register.filter
+def with_html(objects):
+    """{% for post in page_obj|with_html %}: HTML текстов для всей
+    страницы сразу; записи, собранные старым отрисовщиком, собираются
+    заново пачкой."""
+    return attach_rendered_text(objects)
+
+
+@register.filter
+def as_html(obj):
+    """{{ post|as_html }} — HTML текста; внутри цикла с with_html
+    уже готов, иначе берётся для одного объекта."""
+    if not hasattr(obj, 'rendered_html'):
+        attach_rendered_text([obj])
+    return obj.rendered_html
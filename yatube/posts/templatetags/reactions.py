@@ -0,0 +1,13 @@
+from django import template
+
+from posts.reactions import attach_reaction_totals
+
+register = template.Library()
+
+
+@register.filter
+def with_reactions(posts):
+    """{% for post in page_obj|with_reactions %}: итоги реакций для
+    всей страницы одним запросом. Внутри {% stalecache %} запрос
+    выполняется только при пересчёте фрагмента."""
+    return attach_reaction_totals(posts)
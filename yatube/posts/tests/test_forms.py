@@ -1,13 +1,20 @@
+import hashlib
+import os
 import shutil
 import tempfile
+from datetime import timedelta
+from io import StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Comment, Group, Post
+from posts.models import ChunkedUpload, Comment, Group, ImageBlob, Post
+from posts.storage import post_image_storage
 
 User = get_user_model()
 
@@ -35,7 +42,7 @@ class PostCreateFormTests(TestCase):
         # Для тестирования загрузки изображений
         # берём байт-последовательность картинки,
         # состоящей из двух пикселей: белого и чёрного
-        small_gif = (
+        cls.small_gif = small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
@@ -82,7 +89,65 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.text, self.form_data['text'])
         self.assertEqual(post.group.id, self.group.id)
         self.assertEqual(post.author, self.post.author)
-        self.assertEqual(post.image.name, f'posts/{self.uploaded.name}')
+        digest = hashlib.sha256(self.small_gif).hexdigest()
+        self.assertEqual(
+            post.image.name,
+            f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        )
+
+    def test_same_image_is_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом."""
+        names = []
+        for text in ('Первый', 'Второй'):
+            self.authorized_client.post(reverse('posts:post_create'), data={
+                'text': text,
+                'image': SimpleUploadedFile(
+                    name=f'{text}.GIF',
+                    content=self.small_gif,
+                    content_type='image/gif'
+                ),
+            })
+            names.append(Post.objects.get(text=text).image.name)
+        self.assertEqual(names[0], names[1])
+        self.assertEqual(ImageBlob.objects.filter(name=names[0]).count(), 1)
+        directory = os.path.dirname(os.path.join(TEMP_MEDIA_ROOT, names[0]))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_gc_removes_unreferenced_images(self):
+        """gc_image_blobs удаляет только файлы без постов."""
+        self.authorized_client.post(reverse('posts:post_create'), data={
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(
+                name='gc.gif',
+                content=self.small_gif,
+                content_type='image/gif'
+            ),
+        })
+        post = Post.objects.get(text='Пост с картинкой')
+        path = post.image.path
+        call_command('gc_image_blobs', grace_hours=0, stdout=StringIO())
+        self.assertTrue(os.path.exists(path))
+        post.delete()
+        call_command('gc_image_blobs', grace_hours=0, stdout=StringIO())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_gc_keeps_reused_image(self):
+        """Повторная загрузка старого файла продлевает ему срок:
+        gc_image_blobs не удаляет его до того, как сошлётся пост."""
+        upload = SimpleUploadedFile('old.gif', self.small_gif)
+        name = post_image_storage.save('posts/old.gif', upload)
+        ImageBlob.objects.filter(name=name).update(
+            created=timezone.now() - timedelta(days=7),
+            last_used=timezone.now() - timedelta(days=7),
+        )
+        upload = SimpleUploadedFile('again.gif', self.small_gif)
+        self.assertEqual(
+            post_image_storage.save('posts/again.gif', upload), name
+        )
+        call_command('gc_image_blobs', grace_hours=1, stdout=StringIO())
+        self.assertTrue(post_image_storage.exists(name))
+        self.assertTrue(ImageBlob.objects.filter(name=name).exists())
 
     def test_edit_post(self):
         """При отправке валидной формы со страницы редактирования поста
@@ -162,3 +227,145 @@ class CommentCreateFormTests(TestCase):
             response,
             f"{redirect}?next={self.reverse_link}"
         )
+
+
+@override_settings(COMMENTS_SHOWN_DEPTH=2)
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+        cls.root = Comment.objects.create(
+            post=cls.post, author=cls.user, text='Корень'
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def reply(self, parent, text):
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': text, 'parent': parent.id},
+        )
+        return Comment.objects.get(text=text)
+
+    def test_reply_gets_materialized_path(self):
+        """Ответ хранит путь родителя и свою глубину."""
+        child = self.reply(self.root, 'Ответ')
+        self.assertEqual(child.parent, self.root)
+        self.assertEqual(child.depth, 1)
+        self.assertTrue(child.path.startswith(self.root.path))
+
+    def test_deep_replies_are_collapsed(self):
+        """Глубокие ответы скрыты и подгружаются отдельной страницей."""
+        child = self.reply(self.root, 'Ответ')
+        grandchild = self.reply(child, 'Ответ на ответ')
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        comments = response.context['comments']
+        self.assertEqual(comments, [self.root, child])
+        self.assertTrue(comments[1].has_hidden_replies)
+        response = self.client.get(reverse(
+            'posts:comment_thread',
+            kwargs={'post_id': self.post.id, 'comment_id': child.id},
+        ))
+        self.assertEqual(response.context['comments'], [grandchild])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, CHUNKED_UPLOAD_MAX_CHUNK=16)
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+        cls.image = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('posts:upload_start'), {
+            'filename': 'big.gif', 'size': len(self.image),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.token = response.json()['token']
+        self.url = reverse('posts:upload_chunk', args=[self.token])
+
+    def send(self, offset, chunk, checksum=None):
+        return self.client.post(
+            self.url,
+            data=chunk,
+            content_type='application/octet-stream',
+            HTTP_X_UPLOAD_OFFSET=str(offset),
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def upload_all(self):
+        for offset in range(0, len(self.image), 16):
+            response = self.send(offset, self.image[offset:offset + 16])
+            self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_upload_resumes_after_bad_chunk(self):
+        """Испорченная часть отвергается, загрузка продолжается
+        с последнего принятого байта."""
+        self.send(0, self.image[:16])
+        response = self.send(16, b'x' * 16, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 16)
+        response = self.send(0, self.image[:16])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(self.url).json()['offset'], 16)
+        for offset in (16, 32):
+            self.send(offset, self.image[offset:offset + 16])
+        self.assertTrue(self.client.get(self.url).json()['complete'])
+
+    def test_oversized_chunk_is_rejected(self):
+        """Часть больше CHUNKED_UPLOAD_MAX_CHUNK не принимается."""
+        response = self.send(0, self.image[:20])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_post_references_upload_by_token(self):
+        """Пост получает собранную картинку по токену загрузки."""
+        self.assertTrue(self.upload_all().json()['complete'])
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Большое фото', 'upload_token': self.token,
+        })
+        post = Post.objects.get(text='Большое фото')
+        with open(post.image.path, 'rb') as image:
+            self.assertEqual(image.read(), self.image)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_upload_file_closed_when_form_invalid(self):
+        """Файл загрузки закрывается и тогда, когда пост
+        не сохранился."""
+        self.upload_all()
+        response = self.client.post(reverse('posts:post_create'), {
+            'text': '', 'upload_token': self.token,
+        })
+        form = response.context['form']
+        self.assertTrue(form.errors['text'])
+        self.assertTrue(form.files['image'].closed)
+
+    def test_incomplete_upload_is_not_accepted(self):
+        """Незавершённую загрузку нельзя прикрепить к посту."""
+        self.send(0, self.image[:16])
+        response = self.client.post(reverse('posts:post_create'), {
+            'text': 'Рано', 'upload_token': self.token,
+        })
+        self.assertFalse(Post.objects.filter(text='Рано').exists())
+        self.assertTrue(response.context['form'].errors['image'])
@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from core.testing import QueryBudgetMixin
+from posts.models import (ChunkedUpload, Comment, Follow, Group, Post,
+                          Reaction, RelatedPost)
+from posts.reactions import react
+from posts.revisions import record_edit
+
+User = get_user_model()
+
+
+@override_settings(VIEW_COUNTS_FLUSH_INTERVAL=3600)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Число запросов страниц не растёт с объёмом данных."""
+    urlconfs = ('posts.urls', 'users.urls', 'about.urls')
+    # Авторизованному клиенту нужно больше запросов (сессия,
+    # пользователь, подписки), бюджет считан по нему
+    budgets = {
+        'posts:index': 6,
+        'posts:trending': 4,
+        'posts:tag_posts': 6,
+        'posts:group_list': 7,
+        'posts:profile': 10,
+        'posts:post_detail': 13,
+        'posts:post_create': 4,
+        'posts:autocomplete': 0,
+        'posts:upload_start': 3,
+        'posts:upload_chunk': 3,
+        'posts:post_edit': 4,
+        'posts:post_history': 5,
+        'posts:post_revision': 6,
+        'posts:add_comment': 6,
+        'posts:comment_thread': 7,
+        'posts:react': 6,
+        'posts:unreact': 6,
+        'posts:follow_index': 8,
+        'posts:follow_unread': 3,
+        'posts:profile_follow': 5,
+        'posts:profile_unfollow': 4,
+        'users:logout': 4,
+        'users:signup': 3,
+        'users:login': 3,
+        'users:password_reset_form': 3,
+        'about:author': 3,
+        'about:tech': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            text='#тег Пост', author=cls.author, group=cls.group
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.post, author=cls.user, text='Комментарий'
+        )
+        old_text = cls.post.text
+        cls.post.text = '#тег Пост после правки'
+        cls.post.save()
+        record_edit(cls.post, old_text)
+        upload = ChunkedUpload.objects.create(
+            user=cls.user, filename='image.gif', size=10
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post_data = {
+            'posts:add_comment': {'text': 'Комментарий'},
+            'posts:react': {'kind': Reaction.LIKE},
+            'posts:unreact': {'kind': Reaction.LIKE},
+            'posts:upload_start': {'filename': 'image.gif', 'size': 10},
+        }
+        cls.url_kwargs = {
+            'post_id': cls.post.id,
+            'username': cls.author.username,
+            'slug': cls.group.slug,
+            'name': 'тег',
+            'number': 1,
+            'comment_id': cls.comment.id,
+            'token': upload.token,
+        }
+
+    def seed(self, size):
+        """size новых авторов, на которых подписан читатель, и по
+        size постов, комментариев, ответов, реакций и похожих постов."""
+        for _ in range(size):
+            number = User.objects.count()
+            author = User.objects.create_user(username=f'author{number}')
+            Follow.objects.create(user=self.user, author=author)
+            for writer in (author, self.author):
+                post = Post.objects.create(
+                    text=f'#тег Пост @reader {number}',
+                    author=writer,
+                    group=self.group,
+                )
+                react(author, post, Reaction.LIKE)
+                RelatedPost.objects.create(
+                    post=self.post, related=post, score=0.5
+                )
+            comment = Comment.objects.create(
+                post=self.post, author=author, text=f'@reader {number}'
+            )
+            Comment.objects.create(
+                post=self.post, author=self.author, text='Ответ',
+                parent=comment,
+            )
+            Comment.objects.create(
+                post=self.post, author=self.user, text='Ответ на ответ',
+                parent=self.comment,
+            )
+            react(author, self.post, Reaction.FIRE)
@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Follow, FollowSuggestion, Group, Post
+from posts.recommendations import build_follow_suggestions
+from posts.related import build_related_posts, get_related_posts
+
+User = get_user_model()
+
+
+class FollowSuggestionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.friend = User.objects.create_user(username='friend')
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        Follow.objects.create(user=cls.reader, author=cls.friend)
+        Follow.objects.create(user=cls.friend, author=cls.author)
+
+    def test_friend_of_friend_is_suggested(self):
+        """Автора, на которого подписан мой автор, рекомендуют мне."""
+        build_follow_suggestions()
+        suggested = FollowSuggestion.objects.filter(
+            user=self.reader
+        ).values_list('author', flat=True)
+        self.assertEqual(list(suggested), [self.author.id])
+
+    def test_incremental_refresh(self):
+        """Повторный запуск пересчитывает только изменившихся."""
+        build_follow_suggestions()
+        self.assertEqual(build_follow_suggestions(), 0)
+        Follow.objects.create(user=self.friend, author=self.other)
+        # Изменился friend, а значит и его подписчик reader
+        self.assertEqual(build_follow_suggestions(), 2)
+        self.assertTrue(FollowSuggestion.objects.filter(
+            user=self.reader, author=self.other).exists())
+
+    def test_co_follower_change_refreshes_neighbours(self):
+        """Новая подписка пользователя с общим автором пересчитывает
+        совместные подписки соседа."""
+        twin = User.objects.create_user(username='twin')
+        Follow.objects.create(user=twin, author=self.friend)
+        build_follow_suggestions()
+        Follow.objects.create(user=twin, author=self.other)
+        # twin и reader, который тоже подписан на friend
+        self.assertEqual(build_follow_suggestions(), 2)
+        self.assertTrue(FollowSuggestion.objects.filter(
+            user=self.reader, author=self.other).exists())
+
+    def test_suggestions_on_follow_page(self):
+        """Рекомендации показываются в ленте подписок."""
+        build_follow_suggestions()
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [s.author for s in response.context['suggestions']],
+            [self.author],
+        )
+
+
+@override_settings(
+    RELATED_POSTS_TOP_K=2, RELATED_POSTS_MAX_DF=1.0,
+    RELATED_POSTS_GROUP_WEIGHT=0.25,
+)
+class RelatedPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='related')
+        cls.group = Group.objects.create(
+            title='Кошки', slug='cats', description='Про кошек'
+        )
+
+    def post(self, text, group=None):
+        return Post.objects.create(text=text, author=self.author, group=group)
+
+    def related_ids(self, post):
+        return [item.related_id for item in get_related_posts(post)]
+
+    def test_similar_texts_are_ranked_first(self):
+        """Похожие тексты в начале списка, общая группа добавляет
+        сходства."""
+        cats = self.post('кошки любят спать на солнце')
+        sleepy = self.post('кошки любят спать весь день')
+        grouped = self.post('собаки любят гулять', self.group)
+        self.post('налоговая отчётность за квартал')
+        cats.group = self.group
+        cats.save()
+        self.assertEqual(build_related_posts(), 4)
+        self.assertEqual(self.related_ids(cats), [sleepy.id, grouped.id])
+        with self.assertNumQueries(1):
+            list(get_related_posts(cats))
+
+    def test_new_post_updates_only_affected_lists(self):
+        """Новый пост пересчитывает себя и те списки, куда проходит."""
+        first = self.post('рецепт борща со свёклой')
+        second = self.post('рецепт пирога с яблоками')
+        other = self.post('ремонт велосипеда своими руками')
+        build_related_posts()
+        self.assertEqual(build_related_posts(), 0)
+        newcomer = self.post('рецепт борща с говядиной')
+        self.assertEqual(build_related_posts(), 3)
+        self.assertEqual(self.related_ids(first)[0], newcomer.id)
+        self.assertEqual(self.related_ids(newcomer)[0], first.id)
+        self.assertNotIn(newcomer.id, self.related_ids(other))
+        self.assertIn(second.id, self.related_ids(newcomer))
+
+    def test_post_edited_away_leaves_old_lists(self):
+        """Пост, правкой ставший непохожим, пропадает из списков,
+        где был раньше."""
+        first = self.post('рецепт борща со свёклой')
+        second = self.post('рецепт борща с говядиной')
+        build_related_posts()
+        self.assertEqual(self.related_ids(first), [second.id])
+        second.text = 'ремонт велосипеда своими руками'
+        second.save()
+        self.assertEqual(build_related_posts(), 2)
+        self.assertEqual(self.related_ids(first), [])
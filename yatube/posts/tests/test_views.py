@@ -1,10 +1,40 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from urllib.parse import quote
+
 from django import forms
+from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Follow, Group, Post
+from posts.archive import archive_old_posts
+from posts.autocomplete import PrefixIndex, prefix_index
+from posts.journeys import Journeys
+from posts.markup import RENDERER_VERSION
+from posts.models import (ArchivedComment, ArchivedPost, BulkOperation,
+                          Comment, Follow, FollowFeedState, Group, Post,
+                          PostRevision, PostTag, PostViewCount, Reaction,
+                          ReactionCounter, RelatedPost, Tag)
+from posts.mentions import attach_rendered_text
+from posts.reactions import attach_reaction_totals, react
+from posts.revisions import (apply_delta, make_delta, record_edit,
+                             revision_text)
+from posts.tasks import run_bulk_operation
+from posts.trending import refresh_trending_scores
+from posts.view_counter import get_view_count, view_counter
 
 User = get_user_model()
 
@@ -344,3 +374,781 @@ class FollowersTests(TestCase):
             reverse('posts:follow_index'))
         posts_list = response.context['page_obj']
         self.assertNotIn(post, posts_list)
+
+
+@override_settings(POSTS_BY_PAGE=2)
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.user)
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_commented_post_rises(self):
+        """Пост с комментариями выше в ленте «Популярное»."""
+        refresh_trending_scores()
+        Comment.objects.create(
+            post=self.posts[0], author=self.user, text='Комментарий'
+        )
+        Comment.objects.create(
+            post=self.posts[0], author=self.user, text='Ещё один'
+        )
+        # Пересчитывается только прокомментированный пост
+        self.assertEqual(refresh_trending_scores(), 1)
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(response.context['posts'][0], self.posts[0])
+
+    def test_anonymous_page_cached(self):
+        """Анонимному посетителю страница отдаётся из кеша,
+        авторизованному — рендерится заново."""
+        refresh_trending_scores()
+        url = reverse('posts:trending')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, first.content)
+        self.client.force_login(self.user)
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_keyset_pages_cover_all_posts(self):
+        """Страницы по ключу не теряют и не повторяют записи."""
+        refresh_trending_scores()
+        seen = []
+        url = reverse('posts:trending')
+        while url:
+            response = self.client.get(url)
+            seen.extend(response.context['posts'])
+            cursor = response.context['next_cursor']
+            url = cursor and (
+                reverse('posts:trending') + '?after=' + quote(cursor)
+            )
+        self.assertEqual(sorted(post.id for post in seen),
+                         sorted(post.id for post in self.posts))
+
+
+@override_settings(TASKS_EAGER=True)
+class FollowUnreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def unread(self):
+        response = self.reader_client.get(reverse('posts:follow_unread'))
+        return response.json()['unread']
+
+    def test_unread_counter(self):
+        """Новые записи автора увеличивают счётчик подписчика,
+        просмотр ленты подписок сбрасывает его."""
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}
+        ))
+        self.assertEqual(self.unread(), 0)
+        for number in range(2):
+            self.author_client.post(
+                reverse('posts:post_create'), {'text': f'Пост {number}'}
+            )
+        self.assertEqual(self.unread(), 2)
+        self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(self.unread(), 0)
+
+    def test_existing_follows_get_feed_state(self):
+        """Миграция 0026 заводит состояние ленты подпискам, созданным
+        до счётчика, и новые записи их автора начинают считаться."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        fill_feed_states = import_module(
+            'posts.migrations.0026_fill_follow_feed_state'
+        ).fill_feed_states
+        fill_feed_states(apps, None)
+        fill_feed_states(apps, None)
+        self.assertEqual(FollowFeedState.objects.count(), 1)
+        self.author_client.post(
+            reverse('posts:post_create'), {'text': 'Пост'}
+        )
+        self.assertEqual(self.unread(), 1)
+
+
+@override_settings(POSTS_BY_PAGE=2)
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.old_post = Post.objects.create(text='Старый пост', author=cls.user)
+        Comment.objects.create(
+            post=cls.old_post, author=cls.user, text='Старый комментарий'
+        )
+        react(cls.user, cls.old_post, Reaction.LIKE)
+        PostViewCount.objects.create(post=cls.old_post, views=7)
+        cls.old_post.text = 'Старый пост после правки'
+        cls.old_post.save()
+        record_edit(cls.old_post, 'Старый пост')
+        Post.objects.filter(id=cls.old_post.id).update(
+            created=timezone.now() - timedelta(days=365)
+        )
+        cls.new_posts = [
+            Post.objects.create(text=f'Новый пост {number}', author=cls.user)
+            for number in range(2)
+        ]
+        archive_old_posts(days=30)
+
+    def test_old_post_moved_to_archive(self):
+        """Старый пост и его комментарии переносятся в архив."""
+        self.assertFalse(Post.objects.filter(id=self.old_post.id).exists())
+        archived = ArchivedPost.objects.get(id=self.old_post.id)
+        self.assertEqual(archived.comments_by_post.count(), 1)
+
+    def test_archived_post_detail(self):
+        """Архивный пост открывается по старому адресу."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.old_post.id})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_archived'])
+        self.assertEqual(len(response.context['comments']), 1)
+
+    def test_archived_post_keeps_reactions_views_history(self):
+        """Реакции, просмотры и история правок переживают
+        архивирование."""
+        # Буфер мог остаться от других тестов с тем же id поста
+        view_counter.flush()
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.old_post.id])
+        )
+        self.assertEqual(
+            response.context['post'].reaction_totals,
+            [(Reaction.LIKE, '👍', 1)],
+        )
+        self.assertEqual(response.context['views'], 7)
+        response = self.client.get(
+            reverse('posts:post_revision', args=[self.old_post.id, 1])
+        )
+        self.assertEqual(response.context['text'], 'Старый пост')
+
+    def test_deleted_archived_post_takes_its_rows(self):
+        """Удаление архивного поста удаляет и строки, сохранённые
+        при архивировании."""
+        ArchivedPost.objects.get(id=self.old_post.id).delete()
+        for model in (Reaction, ReactionCounter, PostViewCount,
+                      PostRevision):
+            with self.subTest(model=model):
+                self.assertFalse(
+                    model.objects.filter(post_id=self.old_post.id).exists()
+                )
+
+    def test_profile_pages_past_horizon(self):
+        """Профиль после горячих постов показывает архивные."""
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        response = self.client.get(url)
+        self.assertEqual(response.context['count_posts'], 3)
+        self.assertEqual(
+            list(response.context['page_obj']), self.new_posts[::-1]
+        )
+        response = self.client.get(url + '?page=2')
+        self.assertEqual(
+            [post.id for post in response.context['page_obj']],
+            [self.old_post.id],
+        )
+
+
+class ReactionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def react(self, kind):
+        self.authorized_client.post(
+            reverse('posts:react', kwargs={'post_id': self.post.id}),
+            {'kind': kind},
+        )
+
+    def totals(self):
+        return attach_reaction_totals([self.post])[0].reaction_totals
+
+    def test_reaction_is_idempotent(self):
+        """Повторная реакция того же вида не увеличивает счётчик."""
+        self.react(Reaction.LIKE)
+        self.react(Reaction.LIKE)
+        self.assertEqual(self.totals(), [(Reaction.LIKE, '👍', 1)])
+
+    def test_reaction_change_and_removal(self):
+        """Смена и отмена реакции переносят и убирают её из итогов."""
+        self.react(Reaction.LIKE)
+        self.react(Reaction.FIRE)
+        self.assertEqual(self.totals(), [(Reaction.FIRE, '🔥', 1)])
+        self.authorized_client.post(
+            reverse('posts:unreact', kwargs={'post_id': self.post.id})
+        )
+        self.assertEqual(self.totals(), [])
+
+    def test_feed_reads_totals_in_one_query(self):
+        """Итоги реакций страницы ленты читаются одним запросом."""
+        for number in range(3):
+            post = Post.objects.create(text=f'Пост {number}', author=self.user)
+            react(self.user, post, Reaction.HEART)
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            attach_reaction_totals(posts)
+        self.assertEqual(
+            sum(total for post in posts for *_, total in post.reaction_totals),
+            3,
+        )
+
+
+@override_settings(VIEW_COUNTS_FLUSH_INTERVAL=0)
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    def setUp(self):
+        view_counter.flush()
+
+    def test_views_are_buffered_and_flushed(self):
+        """Просмотры копятся в памяти и пишутся одной пачкой."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        for _ in range(3):
+            self.client.get(url)
+        self.assertFalse(PostViewCount.objects.exists())
+        self.assertEqual(get_view_count(self.post.id), 3)
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(
+            PostViewCount.objects.get(post=self.post).views, 3
+        )
+        self.client.get(url)
+        view_counter.flush()
+        self.assertEqual(
+            PostViewCount.objects.get(post=self.post).views, 4
+        )
+
+    @override_settings(VIEW_COUNTS_MAX_PENDING=2)
+    def test_buffer_is_bounded(self):
+        """При переполнении буфер сбрасывается сразу."""
+        other = Post.objects.create(text='Другой пост', author=self.user)
+        view_counter.incr(self.post.id)
+        view_counter.incr(other.id)
+        self.assertEqual(PostViewCount.objects.count(), 2)
+
+
+@override_settings(REVISIONS_SNAPSHOT_EVERY=3, REVISIONS_KEEP=4)
+class RevisionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='editor')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.post = Post.objects.create(
+            text='Первая версия поста', author=self.author
+        )
+
+    def edit(self, text):
+        self.client.post(
+            reverse('posts:post_edit', args=[self.post.id]), {'text': text}
+        )
+
+    def test_delta_round_trip(self):
+        """Разность восстанавливает новый текст из старого."""
+        pairs = [
+            ('', 'новый'),
+            ('старый текст', ''),
+            ('Мама мыла раму', 'Мама мыла окно и раму!'),
+        ]
+        for old, new in pairs:
+            with self.subTest(old=old, new=new):
+                self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+
+    def test_every_version_is_rebuilt(self):
+        """Любая из сохранённых версий собирается заново, а лишние
+        удаляются с сохранением полного текста у самой старой."""
+        versions = [self.post.text] + [
+            f'Первая версия поста, правка {number}' for number in range(7)
+        ]
+        for text in versions[1:]:
+            self.edit(text)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, versions[-1])
+        numbers = list(self.post.revisions.values_list('number', flat=True))
+        self.assertEqual(sorted(numbers), [5, 6, 7, 8])
+        self.assertTrue(self.post.revisions.get(number=5).snapshot)
+        self.assertFalse(self.post.revisions.get(number=6).snapshot)
+        for number in numbers:
+            with self.subTest(number=number):
+                self.assertEqual(
+                    revision_text(self.post, number), versions[number - 1]
+                )
+
+    def test_history_pages(self):
+        """Страница версии показывает её текст, несуществующая — 404."""
+        self.edit('Вторая версия')
+        response = self.client.get(
+            reverse('posts:post_revision', args=[self.post.id, 1])
+        )
+        self.assertEqual(response.context['text'], 'Первая версия поста')
+        response = self.client.get(
+            reverse('posts:post_revision', args=[self.post.id, 9])
+        )
+        self.assertEqual(response.status_code, 404)
+        self.edit('Вторая версия')
+        self.assertEqual(self.post.revisions.count(), 2)
+
+    @override_settings(REVISIONS_DELTA_MAX_LENGTH=30)
+    def test_long_text_stored_whole(self):
+        """Правка длинного текста хранится целиком, без сравнения."""
+        long_text = 'Первая версия поста, а потом ещё много текста'
+        with mock.patch('posts.revisions.make_delta') as delta:
+            self.edit(long_text)
+        delta.assert_not_called()
+        self.assertTrue(self.post.revisions.get(number=2).snapshot)
+        self.assertEqual(revision_text(self.post, 2), long_text)
+
+    def test_failed_revision_keeps_text(self):
+        """Если версия не записалась, текст поста не меняется."""
+        with mock.patch(
+            'posts.views.record_edit', side_effect=IntegrityError
+        ):
+            with self.assertRaises(IntegrityError):
+                self.edit('Вторая версия')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Первая версия поста')
+
+
+@override_settings(POSTS_BY_PAGE=2)
+class TagTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='tagger')
+
+    def test_tags_follow_edits(self):
+        """Правка поста меняет только изменившиеся теги и счётчики."""
+        post = Post.objects.create(
+            text='#Котики и #собаки, но не #1', author=self.author
+        )
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'post_count')),
+            {'котики': 1, 'собаки': 1},
+        )
+        kept = PostTag.objects.get(post=post, tag__name='котики')
+        post.text = '#котики и #птицы'
+        post.save()
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'post_count')),
+            {'котики': 1, 'собаки': 0, 'птицы': 1},
+        )
+        self.assertTrue(PostTag.objects.filter(id=kept.id).exists())
+
+    def test_tag_feed_uses_keyset_pages(self):
+        """Лента тега листается по ключу, от новых к старым."""
+        posts = [
+            Post.objects.create(text=f'Пост {number} #лента',
+                                author=self.author)
+            for number in range(3)
+        ]
+        Post.objects.create(text='Без тега', author=self.author)
+        url = reverse('posts:tag_posts', args=['Лента'])
+        response = self.client.get(url)
+        self.assertEqual(response.context['posts'], posts[:0:-1])
+        response = self.client.get(
+            f"{url}?after={quote(response.context['next_cursor'])}"
+        )
+        self.assertEqual(response.context['posts'], posts[:1])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_delete_releases_tags(self):
+        """Удаление поста уменьшает счётчики его тегов."""
+        post = Post.objects.create(
+            text='#котики и #собаки', author=self.author
+        )
+        Post.objects.create(text='Снова #котики', author=self.author)
+        post.delete()
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'post_count')),
+            {'котики': 1, 'собаки': 0},
+        )
+        self.assertEqual(PostTag.objects.count(), 1)
+
+    def test_archive_releases_tags(self):
+        """Архивирование снимает теги и уменьшает счётчики."""
+        post = Post.objects.create(text='Старый #пост', author=self.author)
+        Post.objects.filter(id=post.id).update(
+            created=timezone.now() - timedelta(days=365)
+        )
+        archive_old_posts(days=30)
+        self.assertEqual(Tag.objects.get(name='пост').post_count, 0)
+        self.assertFalse(PostTag.objects.exists())
+
+
+class MentionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.alice = User.objects.create_user(username='alice')
+        cls.bob = User.objects.create_user(username='bob.smith')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_mentions_are_stored_on_save(self):
+        """Упоминания разрешаются при сохранении, неизвестные имена
+        пропускаются."""
+        post = Post.objects.create(
+            text='Привет, @alice и @nobody!', author=self.author
+        )
+        self.assertEqual(
+            list(post.mentions.values_list('user', flat=True)),
+            [self.alice.id],
+        )
+        post.text = 'Теперь только @bob.smith.'
+        post.save()
+        self.assertEqual(
+            list(post.mentions.values_list('user', flat=True)),
+            [self.bob.id],
+        )
+        comment = Comment.objects.create(
+            post=post, author=self.author, text='@alice, смотри'
+        )
+        self.assertTrue(comment.mentions.filter(user=self.alice).exists())
+
+    def test_html_is_stored_on_save(self):
+        """HTML текста собирается при сохранении и показывается
+        без запросов."""
+        post = Post.objects.create(
+            text='<b>@alice</b>\n#Тег', author=self.author
+        )
+        alice_url = reverse('posts:profile', args=['alice'])
+        tag_url = reverse('posts:tag_posts', args=['тег'])
+        self.assertEqual(
+            post.text_html,
+            f'&lt;b&gt;<a href="{alice_url}">@alice</a>&lt;/b&gt;<br>'
+            f'<a href="{tag_url}">#Тег</a>',
+        )
+        post = Post.objects.get(id=post.id)
+        with self.assertNumQueries(0):
+            attach_rendered_text([post])
+        self.assertEqual(post.rendered_html, post.text_html)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'href="{alice_url}"')
+
+    def test_stale_html_is_batched_and_cached(self):
+        """Записи старой версии отрисовываются пачкой одним запросом,
+        затем берутся из кеша, а rerender_html сохраняет их в базе."""
+        for name in ('alice', 'bob.smith'):
+            Post.objects.create(text=f'@{name}', author=self.author)
+        Post.objects.create(text='Без упоминаний', author=self.author)
+        Post.objects.update(text_html='', html_version=0)
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            attach_rendered_text(posts)
+        alice_url = reverse('posts:profile', args=['alice'])
+        self.assertIn(
+            f'<a href="{alice_url}">@alice</a>',
+            [post.rendered_html for post in posts],
+        )
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(0):
+            attach_rendered_text(posts)
+        call_command('rerender_html', workers=1, stdout=StringIO())
+        self.assertEqual(
+            set(Post.objects.values_list('html_version', flat=True)),
+            {RENDERER_VERSION},
+        )
+        self.assertTrue(
+            Post.objects.filter(text_html__contains=alice_url).exists()
+        )
+
+    def test_archived_mentions_are_rendered(self):
+        """Упоминания архивных постов и комментариев остаются ссылками
+        и после смены версии отрисовщика."""
+        post = Post.objects.create(text='@alice', author=self.author)
+        Comment.objects.create(post=post, author=self.author, text='@alice')
+        Post.objects.filter(id=post.id).update(
+            created=timezone.now() - timedelta(days=365)
+        )
+        archive_old_posts(days=30)
+        ArchivedPost.objects.update(html_version=0)
+        ArchivedComment.objects.update(html_version=0)
+        archived = [ArchivedPost.objects.get(), ArchivedComment.objects.get()]
+        attach_rendered_text(archived)
+        alice_url = reverse('posts:profile', args=['alice'])
+        for obj in archived:
+            with self.subTest(obj=obj):
+                self.assertIn(f'href="{alice_url}"', obj.rendered_html)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_rename_rerenders_mentions(self):
+        """После смены имени ссылка с прежнего @имени ведёт на новый
+        адрес профиля, в том числе после пересборки."""
+        post = Post.objects.create(text='Привет, @alice', author=self.author)
+        alice = User.objects.get(id=self.alice.id)
+        alice.username = 'alice_new'
+        alice.save()
+        new_url = reverse('posts:profile', args=['alice_new'])
+        post.refresh_from_db()
+        self.assertIn(f'<a href="{new_url}">@alice</a>', post.text_html)
+        Post.objects.update(html_version=0)
+        posts = attach_rendered_text(Post.objects.all())
+        self.assertIn(f'href="{new_url}"', posts[0].rendered_html)
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ivan = User.objects.create_user(
+            username='ivan_p', first_name='Иван', last_name='Петров'
+        )
+        cls.group = Group.objects.create(
+            title='Любители кошек', slug='cats', description='Про кошек'
+        )
+
+    def setUp(self):
+        prefix_index.rebuild()
+
+    def labels(self, query):
+        response = self.client.get(
+            reverse('posts:autocomplete'), {'q': query}
+        )
+        return [item['label'] for item in response.json()['results']]
+
+    def test_prefix_matches_names_and_titles(self):
+        """Подсказки находятся по началу логина, имени, фамилии
+        и любого слова названия группы, без учёта регистра."""
+        for query in ('iva', 'ИВ', 'петр', 'иван п'):
+            with self.subTest(query=query):
+                self.assertEqual(self.labels(query), ['Иван Петров (@ivan_p)'])
+        self.assertEqual(self.labels('кош'), ['Любители кошек'])
+        self.assertEqual(self.labels(''), [])
+
+    def test_index_follows_changes(self):
+        """Новые, переименованные и удалённые объекты сразу
+        отражаются в подсказках."""
+        User.objects.create_user(username='ivanova')
+        self.assertEqual(len(self.labels('iva')), 2)
+        self.group.title = 'Собачники'
+        self.group.save()
+        self.assertEqual(self.labels('люб'), [])
+        self.assertEqual(self.labels('соб'), ['Собачники'])
+        self.group.delete()
+        self.assertEqual(self.labels('соб'), [])
+
+    def test_stale_index_rebuilt_once_in_background(self):
+        """Устаревший индекс перестраивается одним фоновым потоком,
+        а запросы тем временем ищут по старому."""
+        index = PrefixIndex()
+        index.built = time.monotonic() - 3600
+        index._entries = [('old', 'user', 0, 'Старый', '/old/')]
+        release = threading.Event()
+        with mock.patch.object(
+            index, 'rebuild', side_effect=lambda: release.wait(5)
+        ) as rebuild:
+            for _ in range(5):
+                index.ensure_fresh()
+                self.assertEqual(len(index.search('old')), 1)
+            release.set()
+            deadline = time.monotonic() + 5
+            while index._rebuilding and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(rebuild.call_count, 1)
+        self.assertFalse(index._rebuilding)
+
+    def test_update_during_rebuild_survives_swap(self):
+        """Правка, пришедшая, пока индекс читал базу, не теряется
+        при подмене списка."""
+        index = PrefixIndex()
+        stale = [('ivan', 'user', 1, 'Иван', '/profile/ivan/')]
+
+        def load():
+            index.update('user', 1, [
+                ('petr', 'user', 1, 'Пётр', '/profile/petr/')
+            ])
+            return list(stale)
+
+        with mock.patch.object(index, '_load', side_effect=load):
+            index.rebuild()
+        self.assertEqual(index.search('iv'), [])
+        self.assertEqual(
+            index.search('pe'), [('user', 'Пётр', '/profile/petr/')]
+        )
+
+    def test_search_is_fast(self):
+        """Поиск по индексу на десятки тысяч ключей занимает
+        доли миллисекунды."""
+        index = PrefixIndex()
+        index.built = time.monotonic()
+        index.update('user', 0, [
+            (f'user{number:05d}', 'user', number, '', '')
+            for number in range(20000)
+        ])
+        started = time.perf_counter()
+        for number in range(1000):
+            self.assertTrue(index.search(f'user{number % 200:03d}'))
+        self.assertLess((time.perf_counter() - started) / 1000, 0.0005)
+
+
+@override_settings(BULK_ACTIONS_CHUNK=2)
+class BulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.spammer = User.objects.create_user(username='spammer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.spam = [
+            Post.objects.create(
+                text=f'#реклама @reader {number}', author=cls.spammer
+            )
+            for number in range(3)
+        ]
+        cls.post = Post.objects.create(text='#реклама', author=cls.reader)
+        comment = Comment.objects.create(
+            post=cls.spam[0], author=cls.reader, text='@spammer ответ'
+        )
+        Comment.objects.create(
+            post=cls.spam[0], author=cls.reader, text='ещё', parent=comment
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.spammer, text='Купите'
+        )
+        react(cls.reader, cls.spam[0], Reaction.LIKE)
+        RelatedPost.objects.create(
+            post=cls.post, related=cls.spam[0], score=0.5
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def action(self, action, posts, **data):
+        return self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {
+                'action': action,
+                '_selected_action': [post.id for post in posts],
+                **data,
+            },
+            follow=True,
+        )
+
+    def test_delete_removes_dependent_rows(self):
+        """Удаление пачками убирает комментарии с ответами, реакции,
+        теги и ссылки похожих постов и пишет прогресс."""
+        self.action('delete_posts', self.spam)
+        self.assertEqual(list(Post.objects.all()), [self.post])
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertFalse(Reaction.objects.exists())
+        self.assertFalse(RelatedPost.objects.exists())
+        self.assertEqual(Tag.objects.get(name='реклама').post_count, 1)
+        operation = BulkOperation.objects.get()
+        self.assertEqual(operation.status, BulkOperation.DONE)
+        self.assertEqual((operation.done, operation.total), (3, 3))
+
+    def test_reassign_group(self):
+        """Перенос в группу — UPDATE по выбранным постам."""
+        self.action('reassign_group', self.spam[:2], group=self.group.id)
+        self.assertEqual(
+            set(self.group.posts_by_group.all()), set(self.spam[:2])
+        )
+
+    def test_purge_authors(self):
+        """Удаление от авторов забирает и их комментарии к чужим
+        постам."""
+        self.action('purge_authors', self.spam[:1])
+        self.assertFalse(Post.objects.filter(author=self.spammer).exists())
+        self.assertFalse(
+            Comment.objects.filter(author=self.spammer).exists()
+        )
+        self.assertTrue(Post.objects.filter(id=self.post.id).exists())
+
+    @override_settings(BULK_ACTIONS_SYNC_LIMIT=0)
+    def test_large_selection_runs_in_background(self):
+        """Большая выборка не обрабатывается в запросе, а ждёт
+        задачу run_bulk_operation."""
+        self.action('delete_posts', self.spam)
+        self.assertEqual(Post.objects.count(), 4)
+        operation = BulkOperation.objects.get()
+        self.assertEqual(operation.status, BulkOperation.PENDING)
+        # Выборка сохранена списком id, а не запросом
+        self.assertEqual(
+            json.loads(operation.params)['posts'],
+            sorted(post.id for post in self.spam),
+        )
+        run_bulk_operation(operation.id)
+        self.assertEqual(list(Post.objects.all()), [self.post])
+
+    @override_settings(BULK_ACTIONS_SYNC_LIMIT=0)
+    def test_select_across_stores_filter(self):
+        """«Выбрать все» по фильтру сохраняет параметры фильтра,
+        а задача сама проходит по подходящим постам."""
+        Post.objects.filter(id__in=[post.id for post in self.spam[:2]]).update(
+            group=self.group
+        )
+        self.client.post(
+            reverse('admin:posts_post_changelist')
+            + f'?group__id__exact={self.group.id}',
+            {
+                'action': 'delete_posts',
+                '_selected_action': [self.spam[0].id],
+                'select_across': '1',
+            },
+        )
+        operation = BulkOperation.objects.get()
+        params = json.loads(operation.params)
+        self.assertNotIn('posts', params)
+        self.assertEqual(
+            params['filters'], {'group__id__exact': [str(self.group.id)]}
+        )
+        self.assertEqual(operation.total, 2)
+        run_bulk_operation(operation.id)
+        self.assertEqual(
+            set(Post.objects.all()), {self.spam[2], self.post}
+        )
+
+    def test_view_only_staff_cannot_reassign(self):
+        """Сотрудник с правом только на просмотр не переносит посты."""
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        staff.user_permissions.add(
+            Permission.objects.get(codename='view_post')
+        )
+        self.client.force_login(staff)
+        self.action('reassign_group', self.spam, group=self.group.id)
+        self.assertFalse(self.group.posts_by_group.exists())
+        self.assertFalse(BulkOperation.objects.exists())
+
+
+class JourneysTests(TestCase):
+    def test_seeded_choices_repeat(self):
+        """С одним и тем же зерном сценарии выбирают те же посты."""
+        class Session:
+            async def get(self, path):
+                return None
+
+        async def picks(seed):
+            journeys = Journeys(
+                ['a', 'b'], 'pass', list(range(100)),
+                rng=random.Random(seed),
+            )
+            return [await journeys._pick_post(Session()) for _ in range(10)]
+
+        self.assertEqual(asyncio.run(picks(1)), asyncio.run(picks(1)))
+        self.assertNotEqual(asyncio.run(picks(1)), asyncio.run(picks(2)))
@@ -0,0 +1,50 @@
+"""Ветки комментариев в виде материализованного пути.
+
+Путь комментария — пути всех предков и его собственный id, каждый
+в base36 фиксированной ширины PATH_STEP. Сортировка по пути даёт порядок
+вывода ветки, а поддерево — это диапазон путей (path, path + '~'),
+который читается одним проходом по индексу (post, path).
+"""
+PATH_STEP = 7
+PATH_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+# Символ больше любого из PATH_ALPHABET: верхняя граница поддерева
+PATH_END = '~'
+
+
+def encode_segment(number):
+    digits = []
+    while number:
+        number, digit = divmod(number, len(PATH_ALPHABET))
+        digits.append(PATH_ALPHABET[digit])
+    return ''.join(reversed(digits)).rjust(PATH_STEP, '0')
+
+
+def make_path(comment_id, parent_path=''):
+    return parent_path + encode_segment(comment_id)
+
+
+def subtree(queryset, root):
+    """Потомки root в порядке вывода, без самого root."""
+    return queryset.filter(
+        path__gt=root.path, path__lt=root.path + PATH_END
+    ).order_by('path')
+
+
+def thread_page(queryset, depth_from, max_depth):
+    """Ветка из max_depth уровней, начиная с depth_from; у комментариев
+    на последнем уровне проставляется has_hidden_replies.
+
+    Скрытые ответы ищутся одним запросом на всю страницу.
+    """
+    limit = depth_from + max_depth - 1
+    comments = list(queryset.filter(depth__lte=limit).order_by('path'))
+    edge = [comment.id for comment in comments if comment.depth == limit]
+    hidden = set()
+    if edge:
+        hidden = set(queryset.filter(
+            parent_id__in=edge
+        ).values_list('parent_id', flat=True).distinct())
+    for comment in comments:
+        comment.has_hidden_replies = comment.id in hidden
+        comment.indent = comment.depth - depth_from
+    return comments
@@ -0,0 +1,104 @@
+"""Рейтинг постов для ленты «Популярное».
+
+Рейтинг — log10 вовлечённости плюс время публикации, делённое на
+TRENDING_DECAY_SECONDS. Каждые TRENDING_DECAY_SECONDS секунд новизны
+стоят столько же, сколько десятикратная вовлечённость, поэтому рейтинг
+старого поста не нужно пересчитывать только из-за того, что прошло
+время: пересчитываются лишь посты, у которых изменились входные данные.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Comment, Follow, Post, PostScore
+
+
+def compute_score(created, comments, followers):
+    engagement = comments + settings.TRENDING_FOLLOWER_WEIGHT * followers
+    return (
+        math.log10(max(engagement, 1))
+        + created.timestamp() / settings.TRENDING_DECAY_SECONDS
+    )
+
+
+def _follower_counts(author_ids):
+    return dict(
+        Follow.objects.filter(author__in=author_ids).values_list(
+            'author'
+        ).annotate(total=Count('id')).order_by()
+    )
+
+
+def _changed_post_ids(since, window_start):
+    """Посты, у которых с прошлого расчёта изменились входные данные."""
+    changed = set(
+        Post.objects.filter(created__gte=since).values_list('id', flat=True)
+    )
+    changed.update(
+        Comment.objects.filter(created__gte=since).values_list(
+            'post_id', flat=True
+        )
+    )
+    # Подписчиков сравниваем только у свежих постов: старые и так
+    # опустились в рейтинге ниже, чем могут поднять новые подписки
+    recent = list(PostScore.objects.filter(
+        post__created__gte=window_start
+    ).values_list('post_id', 'post__author_id', 'followers'))
+    counts = _follower_counts({author_id for _, author_id, _ in recent})
+    changed.update(
+        post_id for post_id, author_id, followers in recent
+        if counts.get(author_id, 0) != followers
+    )
+    return changed
+
+
+def refresh_trending_scores(full=False, batch_size=500):
+    """Пересчитывает рейтинг изменившихся постов и возвращает их число.
+
+    С full пересчитываются все посты за окно TRENDING_WINDOW_DAYS.
+    """
+    started = timezone.now()
+    window_start = started - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    last_run = PostScore.objects.aggregate(last=Max('updated'))['last']
+    if full or last_run is None:
+        post_ids = set(Post.objects.filter(
+            created__gte=window_start
+        ).values_list('id', flat=True))
+    else:
+        post_ids = _changed_post_ids(last_run, window_start)
+    post_ids = sorted(post_ids)
+    for start in range(0, len(post_ids), batch_size):
+        _refresh_batch(post_ids[start:start + batch_size], started)
+    return len(post_ids)
+
+
+def _refresh_batch(post_ids, started):
+    rows = list(Post.objects.filter(id__in=post_ids).annotate(
+        total_comments=Count('comments_by_post')
+    ).values_list('id', 'author_id', 'created', 'total_comments'))
+    counts = _follower_counts({author_id for _, author_id, _, _ in rows})
+    scores = []
+    for post_id, author_id, created, comments in rows:
+        followers = counts.get(author_id, 0)
+        scores.append(PostScore(
+            post_id=post_id,
+            score=compute_score(created, comments, followers),
+            comments=comments,
+            followers=followers,
+            updated=started,
+        ))
+    existing = set(PostScore.objects.filter(
+        post_id__in=post_ids
+    ).values_list('post_id', flat=True))
+    with transaction.atomic():
+        PostScore.objects.bulk_update(
+            [score for score in scores if score.post_id in existing],
+            ['score', 'comments', 'followers', 'updated'],
+        )
+        PostScore.objects.bulk_create(
+            [score for score in scores if score.post_id not in existing]
+        )
@@ -0,0 +1,143 @@
+"""Возобновляемая загрузка картинок частями.
+
+Клиент создаёт загрузку (имя и размер файла) и получает токен, затем
+отправляет части телом запроса с заголовками X-Upload-Offset
+и X-Chunk-Sha256. Часть дописывается во временный файл потоком,
+без чтения всего тела в память, и принимается, только если сошлась
+контрольная сумма; иначе файл обрезается обратно. После обрыва клиент
+узнаёт, сколько байт уже принято, и продолжает с этого места.
+
+Завершённую загрузку PostForm принимает по токену вместо файла
+из request.FILES; хранилище картинок переносит готовый файл на место,
+не копируя его.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+UPLOADS_DIR = 'uploads'
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Часть отвергнута; status — код HTTP-ответа."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUploadFile(UploadedFile):
+    """Собранный файл загрузки в виде загруженного через форму."""
+
+    def __init__(self, upload):
+        self.path = part_path(upload)
+        super().__init__(
+            open(self.path, 'rb'), name=upload.filename, size=upload.size
+        )
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def part_path(upload):
+    return os.path.join(
+        settings.MEDIA_ROOT, UPLOADS_DIR, f'{upload.token.hex}.part'
+    )
+
+
+def start_upload(user, filename, size):
+    if not 0 < size <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError('Недопустимый размер файла', status=413)
+    upload = ChunkedUpload.objects.create(
+        user=user, filename=os.path.basename(filename)[:255], size=size
+    )
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def _write_chunk(path, offset, stream, limit):
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as part:
+        part.seek(offset)
+        while True:
+            piece = stream.read(READ_SIZE)
+            if not piece:
+                break
+            written += len(piece)
+            if written > limit:
+                part.truncate(offset)
+                raise UploadError('Часть слишком велика', status=413)
+            digest.update(piece)
+            part.write(piece)
+        if written == 0:
+            raise UploadError('Пустая часть')
+    return digest.hexdigest(), written
+
+
+def append_chunk(upload, offset, stream, checksum):
+    """Дописывает часть из потока stream с позиции offset.
+
+    Возвращает новое число принятых байт.
+    """
+    if offset != upload.offset:
+        raise UploadError('Неверное смещение', status=409)
+    limit = min(
+        settings.CHUNKED_UPLOAD_MAX_CHUNK, upload.size - upload.offset
+    )
+    path = part_path(upload)
+    actual, written = _write_chunk(path, offset, stream, limit)
+    if actual != (checksum or '').lower():
+        with open(path, 'r+b') as part:
+            part.truncate(offset)
+        raise UploadError('Контрольная сумма не совпала')
+    # Смещение двигается, только если его не успел сдвинуть параллельный
+    # повтор той же части: тот записал те же байты на то же место
+    moved = ChunkedUpload.objects.filter(
+        id=upload.id, offset=offset
+    ).update(offset=offset + written)
+    if not moved:
+        raise UploadError('Неверное смещение', status=409)
+    upload.offset = offset + written
+    return upload.offset
+
+
+def completed_upload(user, token):
+    """Завершённая загрузка пользователя по токену или None."""
+    try:
+        upload = ChunkedUpload.objects.get(token=token, user=user)
+    except (ChunkedUpload.DoesNotExist, ValidationError):
+        return None
+    return upload if upload.complete else None
+
+
+def discard(upload):
+    """Удаляет загрузку; файл мог уже забрать себе пост."""
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def purge_stale_uploads(hours=None):
+    """Удаляет загрузки, брошенные дольше hours часов назад."""
+    if hours is None:
+        hours = settings.CHUNKED_UPLOAD_EXPIRE_HOURS
+    cutoff = timezone.now() - timedelta(hours=hours)
+    stale = ChunkedUpload.objects.filter(created__lt=cutoff)
+    count = 0
+    for upload in stale.iterator():
+        discard(upload)
+        count += 1
+    return count
@@ -6,13 +6,40 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('trending/', views.trending, name='trending'),
+    path('tag/<str:name>/', views.tag_posts, name='tag_posts'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
+    path('autocomplete/', views.autocomplete_names, name='autocomplete'),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:token>/', views.upload_chunk, name='upload_chunk'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/history/',
+        views.post_history,
+        name='post_history'
+    ),
+    path(
+        'posts/<int:post_id>/history/<int:number>/',
+        views.post_history,
+        name='post_revision'
+    ),
     path('posts/<int:post_id>/comment', views.add_comment, name='add_comment'),
+    path(
+        'posts/<int:post_id>/comments/<int:comment_id>/',
+        views.comment_thread,
+        name='comment_thread'
+    ),
+    path('posts/<int:post_id>/react/', views.react_to_post, name='react'),
+    path(
+        'posts/<int:post_id>/unreact/',
+        views.unreact_to_post,
+        name='unreact'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/unread/', views.follow_unread, name='follow_unread'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -0,0 +1,90 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def keyset_paginate(queryset, fields, after, per_page):
+    """Страница по ключу: записи строго после кортежа after в порядке
+    убывания fields. Смещение не используется, поэтому каждая страница —
+    это один проход по индексу.
+
+    Возвращает (записи, ключ последней записи или None, если дальше
+    ничего нет).
+    """
+    queryset = queryset.order_by(*(f'-{field}' for field in fields))
+    if after is not None:
+        condition = Q()
+        for position, field in enumerate(fields):
+            step = Q(**{f'{field}__lt': after[position]})
+            for previous, value in zip(fields[:position], after):
+                step &= Q(**{previous: value})
+            condition |= step
+        queryset = queryset.filter(condition)
+    items = list(queryset[:per_page + 1])
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    return items, tuple(getattr(items[-1], field) for field in fields)
+
+
+def encode_cursor(values):
+    return '_'.join(
+        value.isoformat() if hasattr(value, 'isoformat') else repr(value)
+        for value in values
+    )
+
+
+def decode_cursor(cursor, converters):
+    """Разбирает ключ из GET-параметра; для мусора возвращает None."""
+    if not cursor:
+        return None
+    parts = cursor.split('_')
+    if len(parts) != len(converters):
+        return None
+    try:
+        values = tuple(
+            convert(part) for convert, part in zip(converters, parts)
+        )
+    except ValueError:
+        return None
+    return None if None in values else values
+
+
+def to_datetime(value):
+    return parse_datetime(value.replace(' ', '+'))
+
+
+class ChainedPostList:
+    """Несколько выборок подряд — например, горячие посты и архив —
+    как один список для Paginator.
+
+    Архивная выборка читается, только когда страница доходит до неё.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def count(self):
+        if self._counts is None:
+            self._counts = [queryset.count() for queryset in self.querysets]
+        return sum(self._counts)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        self.count()
+        items = []
+        for queryset, size in zip(self.querysets, self._counts):
+            if stop is not None and stop <= 0:
+                break
+            if start < size:
+                end = size if stop is None else min(stop, size)
+                items.extend(queryset[start:end])
+            start = max(start - size, 0)
+            if stop is not None:
+                stop -= size
+        return items
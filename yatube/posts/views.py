@@ -1,10 +1,30 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods, require_POST
 
+from core.cache import stale_cache_page
+from core.tasks import enqueue
+from core.users import user_by_username
+from .autocomplete import autocomplete
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import (ArchivedComment, ArchivedPost, ChunkedUpload, Comment,
+                     Follow, FollowFeedState, Group, Post, PostRevision,
+                     PostScore, Reaction, Tag)
+from .reactions import attach_reaction_totals, react, unreact
+from .recommendations import get_follow_suggestions
+from .related import get_related_posts
+from .revisions import record_edit, revision_text
+from .tasks import bump_unread_counts, warm_thumbnails
+from .threads import subtree, thread_page
+from .uploads import UploadError, append_chunk, discard, start_upload
+from .utils import (ChainedPostList, decode_cursor, encode_cursor,
+                    keyset_paginate, to_datetime)
+from .view_counter import get_view_count, view_counter
 
 
 def paginator_method(request, post_list):
@@ -15,7 +35,7 @@ def paginator_method(request, post_list):
 
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
+    post_list = Post.objects.select_related('author', 'group')
     page_obj = paginator_method(request, post_list)
     context = {
         'page_obj': page_obj,
@@ -23,10 +43,48 @@ def index(request):
     return render(request, template, context)
 
 
+# Очки пересчитываются периодически, минутная задержка незаметна
+@stale_cache_page(60, key_prefix='trending')
+def trending(request):
+    template = 'posts/trending.html'
+    after = decode_cursor(request.GET.get('after'), (float, int))
+    scores, last = keyset_paginate(
+        PostScore.objects.select_related('post__author', 'post__group'),
+        ('score', 'post_id'),
+        after,
+        settings.POSTS_BY_PAGE,
+    )
+    context = {
+        'posts': [score.post for score in scores],
+        'next_cursor': last and encode_cursor(last),
+    }
+    return render(request, template, context)
+
+
+def tag_posts(request, name):
+    template = 'posts/tag_posts.html'
+    tag = get_object_or_404(Tag, name=name.lower())
+    after = decode_cursor(request.GET.get('after'), (to_datetime, int))
+    post_tags, last = keyset_paginate(
+        tag.post_tags.select_related('post__author', 'post__group'),
+        ('created', 'post_id'),
+        after,
+        settings.POSTS_BY_PAGE,
+    )
+    context = {
+        'tag': tag,
+        'posts': [post_tag.post for post_tag in post_tags],
+        'next_cursor': last and encode_cursor(last),
+    }
+    return render(request, template, context)
+
+
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    group_post_list = group.posts_by_group.all()
+    group_post_list = group.posts_by_group.select_related(
+        'author', 'group'
+    )
     page_obj = paginator_method(request, group_post_list)
     context = {
         'group': group,
@@ -35,10 +93,20 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+def _author_or_404(username):
+    author = user_by_username(username)
+    if author is None:
+        raise Http404
+    return author
+
+
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    author_post_list = author.posts_by_user.all()
+    author = _author_or_404(username)
+    author_post_list = ChainedPostList(
+        author.posts_by_user.select_related('author', 'group'),
+        author.archived_posts_by_user.select_related('author', 'group'),
+    )
     count_posts = author_post_list.count()
     page_obj = paginator_method(request, author_post_list)
     user = request.user
@@ -49,37 +117,126 @@ def profile(request, username):
         'count_posts': count_posts,
         'page_obj': page_obj,
         'following': following or None,
+        'suggestions': get_follow_suggestions(user),
     }
     return render(request, template, context)
 
 
+def _live_post_context(request, post):
+    """Новые просмотры, реакции и ответы есть только у неархивных
+    постов."""
+    view_counter.incr(post.id)
+    user = request.user
+    reply_to = request.GET.get('reply_to', '')
+    return {
+        'reaction_kinds': Reaction.KIND_CHOICES,
+        'user_reaction': user.is_authenticated and Reaction.objects.filter(
+            user=user, post=post
+        ).values_list('kind', flat=True).first(),
+        'reply_to': reply_to.isdigit() and post.comments_by_post.filter(
+            id=reply_to
+        ).first(),
+        'related_posts': get_related_posts(post),
+    }
+
+
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
+    post = Post.objects.filter(id=post_id).first()
+    is_archived = post is None
+    if is_archived:
+        # Старые посты читаются из архива по тому же адресу
+        post = get_object_or_404(ArchivedPost, id=post_id)
     author = post.author
-    count_posts = author.posts_by_user.all().count()
+    count_posts = (
+        author.posts_by_user.count() + author.archived_posts_by_user.count()
+    )
     form = CommentForm(request.POST or None)
-    comments = post.comments_by_post.all()
+    comments = thread_page(
+        post.comments_by_post.select_related('author'),
+        0,
+        settings.COMMENTS_SHOWN_DEPTH,
+    )
+    attach_reaction_totals([post])
     context = {
         'count_posts': count_posts,
         'post': post,
         'form': form,
         'comments': comments,
+        'is_archived': is_archived,
+    }
+    if not is_archived:
+        context.update(_live_post_context(request, post))
+    # Просмотры архивного поста не растут, но показываются
+    context['views'] = get_view_count(post.id)
+    return render(request, template, context)
+
+
+def comment_thread(request, post_id, comment_id):
+    template = 'posts/comment_thread.html'
+    root = Comment.objects.filter(id=comment_id, post_id=post_id).first()
+    is_archived = root is None
+    if is_archived:
+        root = get_object_or_404(
+            ArchivedComment, id=comment_id, post_id=post_id
+        )
+    comments = thread_page(
+        subtree(root.post.comments_by_post.select_related('author'), root),
+        root.depth + 1,
+        settings.COMMENTS_SHOWN_DEPTH,
+    )
+    context = {
+        'root': root,
+        'post': root.post,
+        'comments': comments,
+        'is_archived': is_archived,
     }
     return render(request, template, context)
 
 
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        upload_token=request.POST.get('upload_token'),
+        user=request.user,
+    )
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if form.upload is not None:
+            discard(form.upload)
+        if post.image:
+            enqueue(warm_thumbnails, post.id, dedup_key=f'thumb:{post.id}')
+        enqueue(bump_unread_counts, post.author_id)
         return redirect('posts:profile', request.user)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+def post_history(request, post_id, number=None):
+    post = Post.objects.filter(id=post_id).first()
+    if post is None:
+        # История архивного поста хранится по тому же id
+        post = get_object_or_404(ArchivedPost, id=post_id)
+    revisions = PostRevision.objects.filter(post_id=post.id).defer(
+        'data'
+    ).order_by('-number')
+    text = None
+    if number is not None:
+        text = revision_text(post, number)
+        if text is None:
+            raise Http404('Такой версии нет')
+    context = {
+        'post': post,
+        'revisions': revisions,
+        'number': number,
+        'text': text,
+    }
+    return render(request, 'posts/post_history.html', context)
+
+
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -88,11 +245,23 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        upload_token=request.POST.get('upload_token'),
+        user=request.user,
     )
     if form.is_valid():
-        post = form.save()
-        post.save()
+        with transaction.atomic():
+            # Строка поста блокируется до записи версии: параллельная
+            # правка не получит тот же номер версии, а разность
+            # считается от текста, который действительно лежит в базе
+            old_text = Post.objects.select_for_update().values_list(
+                'text', flat=True
+            ).get(id=post_id)
+            post = form.save()
+            post.save()
+            record_edit(post, old_text)
+        if form.upload is not None:
+            discard(form.upload)
         return redirect('posts:post_detail', post_id)
     else:
         form = PostForm(instance=post)
@@ -101,6 +270,66 @@ def post_edit(request, post_id):
                   {'form': form, 'is_edit': True})
 
 
+def autocomplete_names(request):
+    """Подсказки пользователей и групп по началу имени: ?q=..."""
+    suggestions = autocomplete(request.GET.get('q', ''))
+    return JsonResponse({'results': [
+        {'kind': kind, 'label': label, 'url': url}
+        for kind, label, url in suggestions
+    ]})
+
+
+def _upload_state(upload):
+    return {
+        'token': str(upload.token),
+        'offset': upload.offset,
+        'size': upload.size,
+        'complete': upload.complete,
+    }
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Начинает загрузку картинки частями, возвращает её токен."""
+    try:
+        upload = start_upload(
+            request.user,
+            request.POST.get('filename', ''),
+            int(request.POST.get('size', 0)),
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Неверный размер'}, status=400)
+    except UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def upload_chunk(request, token):
+    """GET — сколько байт уже принято, POST — очередная часть в теле
+    запроса с заголовками X-Upload-Offset и X-Chunk-Sha256."""
+    upload = get_object_or_404(ChunkedUpload, token=token, user=request.user)
+    if request.method == 'POST':
+        try:
+            append_chunk(
+                upload,
+                int(request.META.get('HTTP_X_UPLOAD_OFFSET', -1)),
+                request,
+                request.META.get('HTTP_X_CHUNK_SHA256'),
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Неверное смещение'}, status=400)
+        except UploadError as error:
+            upload.refresh_from_db()
+            return JsonResponse(
+                {'error': str(error), **_upload_state(upload)},
+                status=error.status
+            )
+    return JsonResponse(_upload_state(upload))
+
+
 @login_required
 def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
@@ -108,32 +337,76 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = get_object_or_404(Post, id=post_id)
+        parent_id = request.POST.get('parent')
+        if parent_id:
+            parent = get_object_or_404(Comment, id=parent_id, post_id=post_id)
+            if parent.depth >= settings.COMMENTS_MAX_DEPTH:
+                # Слишком глубокий ответ становится соседом родителя
+                parent = parent.parent
+            comment.parent = parent
         comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@login_required
+@require_POST
+def react_to_post(request, post_id):
+    post = get_object_or_404(Post, id=post_id)
+    kind = request.POST.get('kind')
+    if kind in dict(Reaction.KIND_CHOICES):
+        react(request.user, post, kind)
+    return redirect('posts:post_detail', post_id=post_id)
+
+
+@login_required
+@require_POST
+def unreact_to_post(request, post_id):
+    post = get_object_or_404(Post, id=post_id)
+    unreact(request.user, post)
+    return redirect('posts:post_detail', post_id=post_id)
+
+
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
     user = request.user
-    post_list = Post.objects.filter(author__following__user=user)
+    post_list = Post.objects.filter(
+        author__following__user=user
+    ).select_related('author', 'group')
     page_obj = paginator_method(request, post_list)
+    seen = FollowFeedState.objects.filter(user=user).update(
+        unread=0, last_seen=timezone.now()
+    )
+    if not seen:
+        FollowFeedState.objects.create(user=user)
     context = {
         'page_obj': page_obj,
+        'suggestions': get_follow_suggestions(user),
     }
     return render(request, template, context)
 
 
+@login_required
+def follow_unread(request):
+    unread = FollowFeedState.objects.filter(
+        user=request.user
+    ).values_list('unread', flat=True).first()
+    return JsonResponse({'unread': unread or 0})
+
+
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = _author_or_404(username)
     if author != request.user:
         Follow.objects.get_or_create(user=request.user, author=author)
+        # Счётчик непрочитанного ведётся только для тех, у кого есть
+        # строка состояния ленты
+        FollowFeedState.objects.get_or_create(user=request.user)
     return redirect('posts:profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = _author_or_404(username)
     Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -48,17 +49,21 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'users.apps.UsersConfig',
-    'core',
+    'core.apps.CoreConfig',
     'about',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
+    'core.middleware.TrafficCaptureMiddleware',
+    'core.middleware.MemoryProfileMiddleware',
+    'core.middleware.SlowQueryMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,6 +82,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.unread.follow_unread',
             ],
         },
     },
@@ -148,8 +154,152 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 POSTS_BY_PAGE = 10
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Общий для процессов кеш — memcached по адресу MEMCACHED_LOCATION
+# (python-memcached из requirements.txt); без него у каждого процесса
+# свой кеш, и сессии с пользователем читаются из базы на каждом запросе
+MEMCACHED_LOCATION = os.getenv('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION,
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Кеш с защитой от одновременного пересчёта (core.cache):
+# сколько секунд после истечения отдавать устаревшее значение,
+# на сколько брать блокировку пересчёта и сила раннего обновления
+STALE_CACHE_GRACE = 300
+STALE_CACHE_LOCK_TIMEOUT = 10
+STALE_CACHE_BETA = 1.0
+
+# Рекомендации «на кого подписаться» (posts.recommendations):
+# сколько хранить и показывать, вес совместных подписок и сколько
+# подписчиков каждого автора учитывать при поиске похожих пользователей
+FOLLOW_SUGGESTIONS_TOP_K = 20
+FOLLOW_SUGGESTIONS_SHOWN = 5
+FOLLOW_SUGGESTIONS_CO_FOLLOW_WEIGHT = 0.5
+FOLLOW_SUGGESTIONS_FANOUT = 200
+
+# Лента «Популярное» (posts.trending): за сколько секунд новизна
+# перевешивает десятикратную вовлечённость, вес подписчика автора
+# относительно комментария и окно, в котором следим за подписчиками
+TRENDING_DECAY_SECONDS = 45000
+TRENDING_FOLLOWER_WEIGHT = 0.1
+TRENDING_WINDOW_DAYS = 7
+
+# Отложенные задачи (core.tasks): с TASKS_EAGER задачи выполняются
+# сразу в запросе, без очереди и воркеров
+TASKS_EAGER = False
+TASKS_MAX_ATTEMPTS = 5
+TASKS_RETRY_BACKOFF = 10
+TASKS_LEASE_SECONDS = 300
+TASKS_CLAIM_BATCH = 10
+
+# Посты старше этого срока archive_posts переносит в архивные таблицы
+ARCHIVE_AFTER_DAYS = 180
+
+# Ветки комментариев: сколько уровней показывать сразу (глубже —
+# по ссылке «показать ответы») и предельная глубина ответов
+COMMENTS_SHOWN_DEPTH = 4
+COMMENTS_MAX_DEPTH = 30
+
+# Число строк-шардов счётчика реакций одного поста. Больше одного
+# имеет смысл только в базе с построчными блокировками: в SQLite
+# писатель блокирует всю базу
+REACTION_SHARDS = 1
+
+# Буфер просмотров постов (posts.view_counter): период сброса в секундах
+# (0 — только при переполнении и остановке) и предел постов в буфере
+VIEW_COUNTS_FLUSH_INTERVAL = 10
+VIEW_COUNTS_MAX_PENDING = 10000
+
+# Загрузка картинок частями (posts.uploads): предел размера файла
+# и одной части в байтах и срок жизни незавершённой загрузки в часах
+CHUNKED_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK = 1024 * 1024
+CHUNKED_UPLOAD_EXPIRE_HOURS = 24
+
+# История правок (posts.revisions): как часто версия хранится целиком,
+# сколько последних версий поста хранить и с какой длины текста
+# не считать разность (сравнение квадратично по длине)
+REVISIONS_SNAPSHOT_EVERY = 10
+REVISIONS_KEEP = 100
+REVISIONS_DELTA_MAX_LENGTH = 20000
+
+# Сколько секунд хранить в кеше HTML текстов, собранных на лету, пока
+# rerender_html не пересоберёт их в базе (posts.mentions)
+RENDERED_TEXT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Похожие посты (posts.related): сколько хранить и показывать, доля
+# сходства, которую даёт общая группа, и доля постов, начиная с которой
+# слово считается служебным и не учитывается
+RELATED_POSTS_TOP_K = 10
+RELATED_POSTS_SHOWN = 5
+RELATED_POSTS_GROUP_WEIGHT = 0.25
+RELATED_POSTS_MAX_DF = 0.5
+
+# Автодополнение имён (posts.autocomplete): сколько подсказок отдавать
+# и через сколько секунд перестраивать индекс процесса целиком
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_AGE = 300
+
+# Массовые действия админки (posts.bulk): размер пачки id и размер
+# выборки, до которого действие выполняется сразу, а не в фоне
+BULK_ACTIONS_CHUNK = 500
+BULK_ACTIONS_SYNC_LIMIT = 2000
+
+# Запись трафика для manage.py replay_traffic (core.middleware):
+# без TRAFFIC_CAPTURE_PATH запись выключена. Пишется доля
+# TRAFFIC_CAPTURE_SAMPLE запросов, пользователи сводятся к
+# TRAFFIC_CAPTURE_USER_BUCKETS обезличенным корзинам
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH')
+TRAFFIC_CAPTURE_SAMPLE = 0.05
+TRAFFIC_CAPTURE_USER_BUCKETS = 50
+TRAFFIC_CAPTURE_QUERY_KEYS = ('page', 'after', 'reply_to', 'q')
+
+# Профилирование памяти (core.memory): снимки tracemalloc до и после
+# доли MEMORY_PROFILE_SAMPLE запросов и точки для сравнения раз
+# в MEMORY_PROFILE_CHECKPOINT_INTERVAL секунд; отчёт — /debug/memory/
+MEMORY_PROFILE = bool(os.getenv('MEMORY_PROFILE'))
+MEMORY_PROFILE_SAMPLE = 0.01
+MEMORY_PROFILE_FRAMES = 1
+MEMORY_PROFILE_TOP = 20
+MEMORY_PROFILE_CHECKPOINT_INTERVAL = 600
+MEMORY_PROFILE_CHECKPOINTS = 24
+
+# Журнал медленных запросов (core.slow_queries): запросы дольше порога
+# в миллисекундах пишутся в лог с планом; None выключает замеры.
+# Сводка по отпечаткам — раз в SLOW_QUERY_REPORT_INTERVAL секунд
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_REPORT_INTERVAL = 60 * 60
+SLOW_QUERY_REPORT_TOP = 20
+
+# Метрики Prometheus (core.metrics): каждый процесс раз
+# в METRICS_FLUSH_INTERVAL секунд пишет свои значения в общий
+# каталог METRICS_DIR, /metrics складывает их. Перед запуском
+# сервера каталог очищается: manage.py clear_metrics
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+)
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+THUMBNAIL_BACKEND = 'core.thumbnails.MeteredThumbnailBackend'
+
+# Сессии и пользователь запроса из кеша (core.users): страница
+# вошедшего пользователя обходится без чтения сессии и User из базы.
+# Только с общим кешем: в кеше процесса выход, смена пароля
+# и отключение пользователя не видны остальным процессам.
+# USER_CACHE_TIMEOUT = None выключает кеш пользователя
+if MEMCACHED_LOCATION:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    USER_CACHE_TIMEOUT = 5 * 60
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    USER_CACHE_TIMEOUT = None